@@ -0,0 +1,93 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date
+from app.auth import AuthorizedUser
+from app.libs.repository import repository
+from app.apis.quests import ListQuestsResponse, load_user_quests
+from app.apis.rivals import GetRivalResponse, ListRivalsResponse, find_active_rival, load_user_rivals
+from app.apis.payments import (
+    QuotaStatus,
+    SubscriptionStatus,
+    build_quota_status,
+    get_user_quest_count,
+    get_user_subscription_status,
+)
+
+router = APIRouter()
+
+# Pydantic Models
+class DashboardResponse(BaseModel):
+    quests: Optional[ListQuestsResponse] = None
+    rival: Optional[GetRivalResponse] = None
+    rivals: Optional[ListRivalsResponse] = None
+    subscription: Optional[SubscriptionStatus] = None
+    quota: Optional[QuotaStatus] = None
+
+SECTIONS = ["quests", "rival", "rivals", "subscription", "quota"]
+
+# API Endpoints
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard(user: AuthorizedUser, sections: str = ",".join(SECTIONS)):
+    """Get everything the app shows on first paint in one request.
+
+    `sections` is a comma separated subset of quests, rival, rivals, subscription and quota;
+    each section has the same shape as its own endpoint and omitted ones are null.
+    """
+    requested = {s.strip() for s in sections.split(",") if s.strip()}
+    unknown = requested - set(SECTIONS)
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sections. Choose from: {SECTIONS}"
+        )
+
+    today = date.today()
+
+    # Each lookup runs once however many sections need it, all in separate sessions
+    queries = {}
+    if requested & {"quests", "rivals"}:
+        queries["sub_info"] = lambda db: db.subscription_info(user.sub)
+    if "quests" in requested:
+        queries["quests"] = lambda db: load_user_quests(db, user.sub, today)
+        queries["daily_completions_used"] = lambda db: db.daily_completions(user.sub, today)
+    if requested & {"rival", "rivals"}:
+        queries["rivals"] = lambda db: load_user_rivals(db, user.sub)
+    if requested & {"subscription", "quota"}:
+        queries["subscription"] = lambda db: get_user_subscription_status(db, user.sub)
+    if "quota" in requested and "quests" not in requested:
+        queries["quest_count"] = lambda db: get_user_quest_count(db, user.sub)
+
+    results = dict(zip(queries, await repository.run_concurrently(*queries.values(), user_id=user.sub)))
+
+    response = DashboardResponse()
+    if "quests" in requested:
+        quests = results["quests"]
+        response.quests = ListQuestsResponse(
+            quests=quests,
+            total_count=len(quests),
+            daily_completions_used=results["daily_completions_used"],
+            daily_completions_limit=results["sub_info"]["daily_completion_limit"],
+            is_premium=results["sub_info"]["is_premium"]
+        )
+    if requested & {"rival", "rivals"}:
+        rivals = results["rivals"]
+        active_rival = find_active_rival(rivals)
+        if "rival" in requested:
+            response.rival = GetRivalResponse(rival=active_rival, has_rival=active_rival is not None)
+        if "rivals" in requested:
+            response.rivals = ListRivalsResponse(
+                rivals=rivals,
+                total_count=len(rivals),
+                active_rival=active_rival,
+                slots_used=len(rivals),
+                max_slots=results["sub_info"]["max_rivals"],
+                is_premium=results["sub_info"]["is_premium"]
+            )
+    if "subscription" in requested:
+        response.subscription = SubscriptionStatus(**results["subscription"])
+    if "quota" in requested:
+        quest_count = len(results["quests"]) if "quests" in results else results["quest_count"]
+        response.quota = build_quota_status(results["subscription"], quest_count)
+
+    return response
@@ -0,0 +1,77 @@
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+from app.auth import AuthorizedUser
+from app.libs.database import connect_direct
+from app.libs.live_updates import CHANNEL, live_hub
+from app.libs.pg_listener import pg_listener
+from app.libs.repository import repository
+
+AUTH_PROTOCOL_PREFIX = "Authorization.Bearer."
+
+@asynccontextmanager
+async def lifespan(app):
+    """Listen for live change events for the app's lifetime"""
+    if not repository.uses_postgres:
+        # Events are delivered in-process
+        yield
+        return
+    pg_listener.add_listener(CHANNEL, live_hub.on_notification)
+    await pg_listener.start(connect_direct)
+    yield
+    await pg_listener.stop()
+
+router = APIRouter(lifespan=lifespan)
+
+# Helper functions
+def select_subprotocol(websocket: WebSocket) -> str | None:
+    """Echo a requested subprotocol, preferring one that does not carry the token"""
+    protocols = [
+        p.strip()
+        for p in websocket.headers.get("Sec-Websocket-Protocol", "").split(",")
+        if p.strip()
+    ]
+    for protocol in protocols:
+        if not protocol.startswith(AUTH_PROTOCOL_PREFIX):
+            return protocol
+    return protocols[0] if protocols else None
+
+# API Endpoints
+@router.websocket("/live")
+async def live_updates(websocket: WebSocket, user: AuthorizedUser):
+    """Push quest, streak, daily count, rival and subscription changes to the client.
+
+    Messages are JSON objects {"type": ..., "data": ...}. A `resync` message means events
+    were dropped because the client fell behind, and it should refetch its lists.
+    """
+    await websocket.accept(subprotocol=select_subprotocol(websocket))
+    subscriber = live_hub.subscribe(user.sub)
+
+    async def send_events():
+        while True:
+            event = await subscriber.queue.get()
+            await websocket.send_json(event)
+
+    async def receive_until_closed():
+        # Clients only send pings; this returns when the socket closes
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [
+        asyncio.create_task(send_events()),
+        asyncio.create_task(receive_until_closed()),
+        asyncio.create_task(subscriber.closed.wait()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        live_hub.unsubscribe(subscriber)
+
+    if subscriber.closed.is_set():
+        # Slow consumer: close so the client reconnects and refetches
+        await websocket.close(code=1013, reason="Client too slow")
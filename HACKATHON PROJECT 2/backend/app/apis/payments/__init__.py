@@ -1,17 +1,35 @@
-from fastapi import APIRouter, HTTPException, Request, Header
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, HTTPException, Request, Response, Header
 from pydantic import BaseModel, EmailStr
 from typing import Optional, Literal
 from datetime import datetime, timedelta
-import asyncpg
-import databutton as db
 from app.auth import AuthorizedUser
+from app.libs.cache_bus import cache_bus
+from app.libs.idempotency import idempotency
+from app.libs.rate_limit import RateLimit
+from app.libs.repository import repository
+from app.libs.response_cache import SUBSCRIPTION_ROUTES, SUBSCRIPTION_STATUS, response_cache
+from app.libs.resilience import Upstream, UpstreamUnavailable
+from app.libs.secret_store import secret_store
+from app.libs.warmup import readiness
 import requests
+import os
 import json
 import hashlib
 import hmac
 from decimal import Decimal
 
-router = APIRouter(prefix="/payments")
+@asynccontextmanager
+async def lifespan(app):
+    """Run the cache invalidation listener for the app's lifetime"""
+    if not repository.uses_postgres:
+        yield
+        return
+    await cache_bus.start()
+    yield
+    await cache_bus.stop()
+
+router = APIRouter(prefix="/payments", lifespan=lifespan)
 
 # Pydantic Models
 class InitializePaymentRequest(BaseModel):
@@ -60,35 +78,53 @@ PLANS = {
 
 FREE_QUEST_LIMIT = 5
 
-# Database helper functions
-async def get_db_connection():
-    """Get database connection"""
-    database_url = db.secrets.get("DATABASE_URL_DEV")
-    return await asyncpg.connect(database_url)
+# PAYSTACK_BASE_URL points payments at another Paystack-compatible server, e.g. a local fake
+PAYSTACK_BASE_URL = os.environ.get("PAYSTACK_BASE_URL", "https://api.paystack.co")
+
+# Fail fast while Paystack is down instead of holding workers for the full timeout
+paystack = Upstream(
+    "paystack",
+    timeout_seconds=10,
+    max_concurrency=20,
+    is_failure=lambda response: response.status_code >= 500
+)
+
+# Every initialize and verify is a Paystack call; cap them per user
+initialize_limit = RateLimit("payments_initialize", requests=10, per_seconds=600)
+# Clients poll verify after checkout, so it gets a higher rate
+verify_limit = RateLimit("payments_verify", requests=30, per_seconds=60, burst=10)
+
+# Built once per value of the secret key, not on every request
+paystack_headers = secret_store.derived(
+    "PAYSTACK_SECRET_KEY",
+    lambda secret_key: {
+        "Authorization": f"Bearer {secret_key}",
+        "Content-Type": "application/json"
+    }
+)
+paystack_hmac_key = secret_store.derived("PAYSTACK_SECRET_KEY", lambda secret_key: secret_key.encode('utf-8'))
+
+async def warm_paystack():
+    """Build the Paystack headers and webhook key before the first payment request"""
+    if paystack_headers.get() is None or paystack_hmac_key.get() is None:
+        raise RuntimeError("PAYSTACK_SECRET_KEY is not set")
 
+readiness.add_step("paystack", warm_paystack, required=False)
+
+# Database helper functions
 def get_paystack_headers():
     """Get Paystack API headers with secret key"""
-    secret_key = db.secrets.get("PAYSTACK_SECRET_KEY")
-    if not secret_key:
+    headers = paystack_headers.get()
+    if headers is None:
         raise HTTPException(
             status_code=503,
             detail="Paystack API keys not configured. Please add PAYSTACK_SECRET_KEY in Settings."
         )
-    return {
-        "Authorization": f"Bearer {secret_key}",
-        "Content-Type": "application/json"
-    }
+    return headers
 
-async def get_user_subscription_status(conn, user_id: str) -> dict:
+async def get_user_subscription_status(db, user_id: str) -> dict:
     """Get current subscription status for user"""
-    query = """
-    SELECT subscription_type, status, start_date, end_date, auto_renew
-    FROM user_subscriptions 
-    WHERE user_id = $1 AND status = 'active' AND end_date > NOW()
-    ORDER BY end_date DESC 
-    LIMIT 1
-    """
-    row = await conn.fetchrow(query, user_id)
+    row = await db.active_subscription(user_id)
     
     if row:
         end_date = row['end_date']
@@ -109,19 +145,36 @@ async def get_user_subscription_status(conn, user_id: str) -> dict:
             'days_remaining': None
         }
 
-async def get_user_quest_count(conn, user_id: str) -> int:
+async def get_user_quest_count(db, user_id: str) -> int:
     """Get current number of active quests for user"""
-    query = "SELECT COUNT(*) FROM quests WHERE user_id = $1"
-    return await conn.fetchval(query, user_id)
+    return await db.count_quests(user_id)
+
+def build_quota_status(subscription_status: dict, quest_count: int) -> QuotaStatus:
+    """Quest quota for a user's subscription status and current quest count"""
+    is_premium = subscription_status['is_premium']
+    max_quests = 999 if is_premium else FREE_QUEST_LIMIT
+    can_create_quest = is_premium or quest_count < FREE_QUEST_LIMIT
+    
+    return QuotaStatus(
+        current_quest_count=quest_count,
+        max_quests=max_quests,
+        is_premium=is_premium,
+        can_create_quest=can_create_quest
+    )
+
+def paystack_unavailable(error: UpstreamUnavailable, detail: str) -> HTTPException:
+    """503 for a rejected Paystack call, telling the client when to retry"""
+    headers = {"Retry-After": str(int(error.retry_after) + 1)} if error.retry_after is not None else None
+    return HTTPException(status_code=503, detail=detail, headers=headers)
 
 def verify_paystack_signature(payload: str, signature: str) -> bool:
     """Verify Paystack webhook signature"""
-    secret_key = db.secrets.get("PAYSTACK_SECRET_KEY")
-    if not secret_key:
+    key = paystack_hmac_key.get()
+    if key is None:
         return False
     
     computed_signature = hmac.new(
-        secret_key.encode('utf-8'),
+        key,
         payload.encode('utf-8'),
         hashlib.sha512
     ).hexdigest()
@@ -130,8 +183,22 @@ def verify_paystack_signature(payload: str, signature: str) -> bool:
 
 # API Endpoints
 @router.post("/initialize", response_model=InitializePaymentResponse)
-async def initialize_payment(request: InitializePaymentRequest, user: AuthorizedUser):
-    """Initialize payment with Paystack"""
+async def initialize_payment(
+    request: InitializePaymentRequest, user: AuthorizedUser, idempotency_key: Optional[str] = Header(None)
+):
+    """Initialize payment with Paystack
+    
+    Retries sent with the same Idempotency-Key get the first transaction back
+    instead of creating another one.
+    """
+    return await idempotency.run(
+        user.sub, "payments.initialize", idempotency_key, request.model_dump(mode="json"),
+        lambda: initialize_paystack_payment(request, user)
+    )
+
+async def initialize_paystack_payment(request: InitializePaymentRequest, user) -> InitializePaymentResponse:
+    # Replays are not counted against the rate limit
+    await initialize_limit.check(user.sub)
     
     plan_config = PLANS.get(request.plan)
     if not plan_config:
@@ -162,11 +229,11 @@ async def initialize_payment(request: InitializePaymentRequest, user: Authorized
     
     try:
         # Call Paystack API
-        response = requests.post(
-            "https://api.paystack.co/transaction/initialize",
+        response = await paystack.call(
+            requests.post,
+            f"{PAYSTACK_BASE_URL}/transaction/initialize",
             headers=get_paystack_headers(),
-            json=paystack_data,
-            timeout=30
+            json=paystack_data
         )
         
         if response.status_code != 200:
@@ -185,23 +252,16 @@ async def initialize_payment(request: InitializePaymentRequest, user: Authorized
             )
         
         # Store payment record
-        conn = await get_db_connection()
-        try:
-            await conn.execute(
-                """
-                INSERT INTO payments (user_id, paystack_reference, amount, currency, status, payment_type, metadata)
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-                """,
+        async with repository.session(user_id=user.sub) as db:
+            await db.create_payment(
                 user.sub,
                 reference,
                 Decimal(str(plan_config['amount'] / 100)),  # Convert kobo to naira
                 plan_config['currency'],
                 'pending',
                 'subscription',
-                json.dumps(paystack_data['metadata'])
+                paystack_data['metadata']
             )
-        finally:
-            await conn.close()
         
         data = result['data']
         return InitializePaymentResponse(
@@ -211,6 +271,9 @@ async def initialize_payment(request: InitializePaymentRequest, user: Authorized
             message="Payment initialized successfully. Redirecting to Paystack..."
         )
         
+    except UpstreamUnavailable as e:
+        print(f"Paystack request rejected: {e}")
+        raise paystack_unavailable(e, "Payment service temporarily unavailable. Please try again.")
     except requests.RequestException as e:
         print(f"Paystack request error: {e}")
         raise HTTPException(
@@ -222,12 +285,14 @@ async def initialize_payment(request: InitializePaymentRequest, user: Authorized
 async def verify_payment(reference: str, user: AuthorizedUser):
     """Verify payment status with Paystack"""
     
+    await verify_limit.check(user.sub)
+    
     try:
         # Verify with Paystack
-        response = requests.get(
-            f"https://api.paystack.co/transaction/verify/{reference}",
-            headers=get_paystack_headers(),
-            timeout=30
+        response = await paystack.call(
+            requests.get,
+            f"{PAYSTACK_BASE_URL}/transaction/verify/{reference}",
+            headers=get_paystack_headers()
         )
         
         if response.status_code != 200:
@@ -247,56 +312,32 @@ async def verify_payment(reference: str, user: AuthorizedUser):
         transaction_data = result['data']
         
         # Update payment in database
-        conn = await get_db_connection()
-        try:
-            # Update payment status
-            await conn.execute(
-                """
-                UPDATE payments 
-                SET status = $1, paystack_transaction_id = $2, verified_at = NOW()
-                WHERE paystack_reference = $3 AND user_id = $4
-                """,
-                transaction_data['status'],
-                transaction_data['id'],
-                reference,
-                user.sub
-            )
+        async with repository.session(user_id=user.sub) as db:
+            # The payment status and the subscription it pays for commit together
+            async with db.transaction():
+                # Update payment status
+                await db.update_payment_status(user.sub, reference, transaction_data['status'], transaction_data['id'])
+                
+                # If payment successful, create/update subscription
+                if transaction_data['status'] == 'success':
+                    metadata = transaction_data.get('metadata', {})
+                    plan = metadata.get('plan', 'monthly')
+                    plan_config = PLANS.get(plan, PLANS['monthly'])
+                    
+                    start_date = datetime.now()
+                    end_date = start_date + timedelta(days=plan_config['duration_days'])
+                    
+                    # Upsert subscription; cached entitlements are dropped after the commit
+                    await db.upsert_subscription(user.sub, plan, start_date, end_date)
             
-            # If payment successful, create/update subscription
             if transaction_data['status'] == 'success':
-                metadata = transaction_data.get('metadata', {})
-                plan = metadata.get('plan', 'monthly')
-                plan_config = PLANS.get(plan, PLANS['monthly'])
-                
-                start_date = datetime.now()
-                end_date = start_date + timedelta(days=plan_config['duration_days'])
-                
-                # Upsert subscription
-                await conn.execute(
-                    """
-                    INSERT INTO user_subscriptions (user_id, subscription_type, status, start_date, end_date)
-                    VALUES ($1, $2, 'active', $3, $4)
-                    ON CONFLICT (user_id) 
-                    DO UPDATE SET 
-                        subscription_type = $2,
-                        status = 'active',
-                        start_date = $3,
-                        end_date = $4,
-                        updated_at = NOW()
-                    """,
-                    user.sub,
-                    plan,
-                    start_date,
-                    end_date
-                )
-                
                 # Get updated subscription status
-                subscription_status = await get_user_subscription_status(conn, user.sub)
+                subscription_status = await get_user_subscription_status(db, user.sub)
+                await db.publish(user.sub, "subscription.updated", subscription_status)
+                # Also evicted by the outbox task, this makes the user's next read fresh right away
+                await db.invalidate_responses(user.sub, SUBSCRIPTION_ROUTES)
             else:
                 subscription_status = None
-            
-        finally:
-            await conn.close()
         
         return VerifyPaymentResponse(
             status=transaction_data['status'],
@@ -305,6 +346,9 @@ async def verify_payment(reference: str, user: AuthorizedUser):
             subscription_status=subscription_status
         )
         
+    except UpstreamUnavailable as e:
+        print(f"Paystack verification rejected: {e}")
+        raise paystack_unavailable(e, "Payment verification service temporarily unavailable")
     except requests.RequestException as e:
         print(f"Paystack verification error: {e}")
         raise HTTPException(
@@ -315,34 +359,26 @@ async def verify_payment(reference: str, user: AuthorizedUser):
 @router.get("/subscription-status", response_model=SubscriptionStatus)
 async def get_subscription_status(user: AuthorizedUser):
     """Get current subscription status for user"""
-    conn = await get_db_connection()
-    try:
-        status = await get_user_subscription_status(conn, user.sub)
-        return SubscriptionStatus(**status)
-    finally:
-        await conn.close()
+    cached = response_cache.lookup(SUBSCRIPTION_STATUS, user.sub)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+    token = response_cache.token()
+    async with repository.session(read_only=True, user_id=user.sub) as db:
+        status = await get_user_subscription_status(db, user.sub)
+    # Valid until days_remaining next goes down (or the subscription ends)
+    expires_at = status['end_date'] - timedelta(days=status['days_remaining']) if status['is_premium'] else None
+    return response_cache.store(SUBSCRIPTION_STATUS, user.sub, SubscriptionStatus(**status), token, expires_at=expires_at)
 
 @router.get("/quota-status", response_model=QuotaStatus)
 async def get_quota_status(user: AuthorizedUser):
     """Get current quest quota status for user"""
-    conn = await get_db_connection()
-    try:
-        # Get subscription and quest count in parallel
-        subscription_status = await get_user_subscription_status(conn, user.sub)
-        quest_count = await get_user_quest_count(conn, user.sub)
-        
-        is_premium = subscription_status['is_premium']
-        max_quests = 999 if is_premium else FREE_QUEST_LIMIT
-        can_create_quest = is_premium or quest_count < FREE_QUEST_LIMIT
-        
-        return QuotaStatus(
-            current_quest_count=quest_count,
-            max_quests=max_quests,
-            is_premium=is_premium,
-            can_create_quest=can_create_quest
-        )
-    finally:
-        await conn.close()
+    # Get subscription and quest count in parallel
+    subscription_status, quest_count = await repository.run_concurrently(
+        lambda db: get_user_subscription_status(db, user.sub),
+        lambda db: get_user_quest_count(db, user.sub),
+        user_id=user.sub
+    )
+    return build_quota_status(subscription_status, quest_count)
 
 @router.post("/webhook")
 async def paystack_webhook(request: Request):
@@ -367,20 +403,10 @@ async def paystack_webhook(request: Request):
             data = event_data['data']
             reference = data['reference']
             
-            conn = await get_db_connection()
-            try:
+            async with repository.session() as db:
                 # Update payment record
-                await conn.execute(
-                    """
-                    UPDATE payments 
-                    SET webhook_received_at = NOW()
-                    WHERE paystack_reference = $1
-                    """,
-                    reference
-                )
+                await db.mark_payment_webhook_received(reference)
                 print(f"Payment webhook processed for reference: {reference}")
-            finally:
-                await conn.close()
         
         return {"status": "success"}
         
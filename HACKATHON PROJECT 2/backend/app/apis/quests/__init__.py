@@ -1,15 +1,74 @@
 
 
 
-from fastapi import APIRouter, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import date, datetime
+from typing import ClassVar, List, Literal, Optional
+from datetime import date, datetime, timedelta
 import asyncpg
-import databutton as db
+import csv
+import io
+import json
+import os
+import zlib
 from app.auth import AuthorizedUser
+from app.libs.cache_bus import cache_bus
+from app.libs.database import db_connection, get_db_connection, release_db_connection
+from app.libs.history_import import HistoryImporter, iter_lines
+from app.libs.idempotency import idempotency
+from app.libs.leaderboard import leaderboard
+from app.libs.live_updates import publish
+from app.libs.outbox import OutboxTask, enqueue, task_handler
+from app.libs.partitions import ensure_schema as ensure_archive_schema, partition_maintainer
+from app.libs.reminders import (
+    DEFAULT_REMINDER_MINUTE,
+    ensure_schema as ensure_reminders_schema,
+    parse_minute,
+    reminder_scheduler,
+)
+from app.libs.quest_history import (
+    bits_to_bytes,
+    concat_years,
+    current_streak_from_bits,
+    days_in_year,
+    get_streaks_for,
+    longest_run,
+    rebuild_bitmaps,
+)
+from app.libs.repository import repository
+from app.libs.response_cache import QUESTS_LIST, RIVAL_ROUTES, invalidate_responses, response_cache
+from app.libs.warmup import readiness
 
-router = APIRouter(prefix="/quests")
+@asynccontextmanager
+async def lifespan(app):
+    """Run the streak leaderboard, cache invalidation listener, partition maintenance and reminder scheduler for the app's lifetime"""
+    if not repository.uses_postgres:
+        yield
+        return
+    reminders_enabled = os.environ.get("REMINDERS_ENABLED") == "true"
+    await cache_bus.start()
+    await leaderboard.start()
+    partition_maintainer.start()
+    if reminders_enabled:
+        reminder_scheduler.start()
+    yield
+    if reminders_enabled:
+        reminder_scheduler.stop()
+    partition_maintainer.stop()
+    await leaderboard.stop()
+    await cache_bus.stop()
+
+router = APIRouter(prefix="/quests", lifespan=lifespan)
+
+async def warm_archive_schema():
+    """Create the quest_check_days view once, before traffic, instead of on the first completion"""
+    async with db_connection() as conn:
+        await ensure_archive_schema(conn)
+
+if repository.uses_postgres:
+    readiness.add_step("quest_check_days", warm_archive_schema)
 
 # Pydantic Models
 class CreateQuestRequest(BaseModel):
@@ -50,117 +109,165 @@ class CompleteQuestResponse(BaseModel):
     daily_completions_used: int
     daily_completions_limit: int
 
-# Database helper functions
-async def get_db_connection():
-    """Get database connection"""
-    database_url = db.secrets.get("DATABASE_URL_DEV")
-    return await asyncpg.connect(database_url)
+class QuestHistoryResponse(BaseModel):
+    quest_id: int
+    year: int
+    days_in_year: int
+    bitmap: str  # Hex of the 366-bit little-endian bitset, bit 0 = January 1st
+    completed_days: int
+    current_streak: int
+    longest_streak: int
 
-async def get_user_subscription_info(conn, user_id: str) -> dict:
-    """Get user subscription status and limits"""
-    query = """
-    SELECT 
-        CASE WHEN status = 'active' AND end_date > NOW() THEN true ELSE false END as is_premium,
-        COALESCE(daily_completion_limit, 5) as daily_completion_limit,
-        COALESCE(max_rivals, 1) as max_rivals
-    FROM user_subscriptions 
-    WHERE user_id = $1
-    ORDER BY created_at DESC
-    LIMIT 1
-    """
-    result = await conn.fetchrow(query, user_id)
+class LeaderboardEntry(BaseModel):
+    rank: int
+    quest_id: int
+    title: Optional[str] = None  # Only shown for the user's own quests
+    current_streak: int
+    is_mine: bool
+
+class LeaderboardResponse(BaseModel):
+    entries: List[LeaderboardEntry]
+    total_ranked: int
+
+MAX_LEADERBOARD_SIZE = 100
+
+class ReminderPreferences(BaseModel):
+    remind_at: str  # HH:MM, server time
+    enabled: bool = True
+
+class ImportReject(BaseModel):
+    line: int
+    reason: str
+
+class ImportQuestsResponse(BaseModel):
+    quests_created: int
+    completions_imported: int
+    duplicates_skipped: int
+    rows_rejected: int
+    rejects: List[ImportReject]  # First 100 rejected rows
+    message: str
+
+EXPORT_COLUMNS = ["quest_id", "title", "quest_created_at", "date", "completed_at"]
+EXPORT_CHUNK_ROWS = 500
+EXPORT_PREFETCH_ROWS = 1000
+
+# Helper functions
+def format_export_rows(rows, format: str) -> str:
+    if format == "ndjson":
+        return "".join(json.dumps(dict(row), default=str) + "\n" for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[c] is None else row[c] for c in EXPORT_COLUMNS])
+    return buffer.getvalue()
+
+async def encode_export(rows, format: str, gzip: bool):
+    """Turn an async iterator of export rows into body chunks of EXPORT_CHUNK_ROWS rows each"""
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # 31 = gzip container
     
-    if result:
-        return {
-            'is_premium': result['is_premium'],
-            'daily_completion_limit': result['daily_completion_limit'],
-            'max_rivals': result['max_rivals']
-        }
-    else:
-        # Default for users without subscription record
-        return {
-            'is_premium': False,
-            'daily_completion_limit': 5,
-            'max_rivals': 1
-        }
-
-async def get_daily_completions_count(conn, user_id: str, target_date: date = None) -> int:
-    """Get number of quest completions for user on specific date"""
-    if target_date is None:
-        target_date = date.today()
-        
-    query = """
-    SELECT COALESCE(completion_count, 0) 
-    FROM daily_completions 
-    WHERE user_id = $1 AND date = $2
-    """
-    result = await conn.fetchval(query, user_id, target_date)
-    return result or 0
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+    
+    if format == "csv":
+        yield encode(",".join(EXPORT_COLUMNS) + "\n")
+    
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_CHUNK_ROWS:
+            chunk = encode(format_export_rows(batch, format))
+            batch = []
+            if chunk:
+                yield chunk
+    if batch:
+        yield encode(format_export_rows(batch, format))
+    
+    if compressor:
+        yield compressor.flush()
 
-async def increment_daily_completions(conn, user_id: str, target_date: date = None) -> int:
-    """Increment daily completion count and return new count"""
-    if target_date is None:
-        target_date = date.today()
+async def load_user_quests(db, user_id: str, today: date) -> List[Quest]:
+    """Get all user quests with today's completion status and current streaks"""
+    quest_rows = await db.list_quests(user_id, today)
+    
+    quests = []
+    for row in quest_rows:
+        # Calculate streak for each quest
+        streak = await db.current_streak(row['id'])
         
-    query = """
-    INSERT INTO daily_completions (user_id, date, completion_count, last_updated)
-    VALUES ($1, $2, 1, NOW())
-    ON CONFLICT (user_id, date)
-    DO UPDATE SET 
-        completion_count = daily_completions.completion_count + 1,
-        last_updated = NOW()
-    RETURNING completion_count
-    """
-    return await conn.fetchval(query, user_id, target_date)
+        quest = Quest(
+            id=row['id'],
+            user_id=row['user_id'],
+            title=row['title'],
+            created_at=row['created_at'],
+            completed_today=row['completed_today'],
+            current_streak=streak
+        )
+        quests.append(quest)
+    return quests
 
-async def calculate_streak(conn, quest_id: int) -> int:
-    """Calculate current streak for a quest"""
-    query = """
-    WITH consecutive_days AS (
-        SELECT date,
-               date - INTERVAL '1 day' * (ROW_NUMBER() OVER (ORDER BY date DESC)) AS grp
-        FROM quest_checks 
-        WHERE quest_id = $1 
-        ORDER BY date DESC
-    ),
-    streaks AS (
-        SELECT COUNT(*) as streak_length
-        FROM consecutive_days
-        GROUP BY grp
-        ORDER BY MIN(date) DESC
-        LIMIT 1
+def require_postgres():
+    """Reject features that only the Postgres repository supports"""
+    if not repository.uses_postgres:
+        raise HTTPException(status_code=501, detail="Not available with the in-memory repository")
+
+# Background tasks
+class RecomputeStreaks(OutboxTask):
+    task_type: ClassVar[str] = "quests.recompute_streaks"
+    user_id: str
+    quest_ids: List[int]
+
+@task_handler(RecomputeStreaks)
+async def recompute_streaks(conn, task: RecomputeStreaks) -> None:
+    """Rebuild the bitmaps of quests whose history changed in bulk and refresh their leaderboard entries"""
+    today = date.today()
+    await rebuild_bitmaps(conn, task.quest_ids)
+    streaks = await get_streaks_for(conn, task.quest_ids)
+    rows = await conn.fetch(
+        """
+        SELECT q.id, q.title,
+               EXISTS(
+                   SELECT 1 FROM quest_checks qc 
+                   WHERE qc.quest_id = q.id AND qc.date = $2
+               ) as completed_today
+        FROM quests q
+        WHERE q.id = ANY($1::int[])
+        """,
+        task.quest_ids,
+        today
     )
-    SELECT COALESCE(streak_length, 0) FROM streaks;
-    """
-    result = await conn.fetchval(query, quest_id)
-    return result or 0
+    for row in rows:
+        current_streak, _ = streaks[row['id']]
+        last_completed = today if row['completed_today'] else today - timedelta(days=1)
+        leaderboard.update(row['id'], task.user_id, row['title'], current_streak, last_completed)
+        await leaderboard.broadcast(conn, row['id'])
+    await publish(conn, task.user_id, "quests.streaks_updated", {"quest_ids": task.quest_ids})
+    await invalidate_responses(conn, task.user_id, [QUESTS_LIST])
 
 # API Endpoints
 @router.post("/create", response_model=CreateQuestResponse)
-async def create_quest(request: CreateQuestRequest, user: AuthorizedUser):
-    """Create a new daily quest for the user - NO LIMITS on quest creation!"""
+async def create_quest(
+    request: CreateQuestRequest, user: AuthorizedUser, idempotency_key: Optional[str] = Header(None)
+):
+    """Create a new daily quest for the user - NO LIMITS on quest creation!
+    
+    Retries sent with the same Idempotency-Key get the first response back.
+    """
+    return await idempotency.run(
+        user.sub, "quests.create", idempotency_key, request.model_dump(mode="json"),
+        lambda: create_user_quest(request, user)
+    )
+
+async def create_user_quest(request: CreateQuestRequest, user) -> CreateQuestResponse:
     if not request.title.strip():
         raise HTTPException(status_code=400, detail="Quest title cannot be empty")
     
-    conn = await get_db_connection()
-    try:
+    async with repository.session(user_id=user.sub) as db:
         # Insert new quest - NO LIMITS! Users can create unlimited quest types
-        query = """
-        INSERT INTO quests (user_id, title) 
-        VALUES ($1, $2) 
-        RETURNING id, user_id, title, created_at
-        """
-        quest_row = await conn.fetchrow(query, user.sub, request.title.strip())
+        quest_row = await db.create_quest(user.sub, request.title.strip())
         
         # Check if completed today
-        today = date.today()
-        completion_query = """
-        SELECT EXISTS(
-            SELECT 1 FROM quest_checks 
-            WHERE quest_id = $1 AND date = $2
-        )
-        """
-        completed_today = await conn.fetchval(completion_query, quest_row['id'], today)
+        completed_today = await db.is_completed(quest_row['id'], date.today())
         
         quest = Quest(
             id=quest_row['id'],
@@ -170,79 +277,58 @@ async def create_quest(request: CreateQuestRequest, user: AuthorizedUser):
             completed_today=completed_today,
             current_streak=0  # New quest has no streak
         )
+        await db.publish(user.sub, "quest.created", quest.model_dump(mode="json"))
+        await db.invalidate_responses(user.sub, [QUESTS_LIST])
         
         return CreateQuestResponse(
             quest=quest,
             message="Quest created successfully! Time to build your streak."
         )
-        
-    finally:
-        await conn.close()
 
 @router.get("/list", response_model=ListQuestsResponse)
 async def list_quests(user: AuthorizedUser):
     """List all quests for the current user with completion status and daily limits"""
-    conn = await get_db_connection()
-    try:
-        today = date.today()
-        
-        # Get user subscription info
-        sub_info = await get_user_subscription_info(conn, user.sub)
-        
-        # Get daily completions used today
-        daily_completions_used = await get_daily_completions_count(conn, user.sub, today)
-        
-        # Get all user quests with today's completion status
-        query = """
-        SELECT q.id, q.user_id, q.title, q.created_at,
-               EXISTS(
-                   SELECT 1 FROM quest_checks qc 
-                   WHERE qc.quest_id = q.id AND qc.date = $2
-               ) as completed_today
-        FROM quests q
-        WHERE q.user_id = $1
-        ORDER BY q.created_at DESC
-        """
-        quest_rows = await conn.fetch(query, user.sub, today)
-        
-        quests = []
-        for row in quest_rows:
-            # Calculate streak for each quest
-            streak = await calculate_streak(conn, row['id'])
-            
-            quest = Quest(
-                id=row['id'],
-                user_id=row['user_id'],
-                title=row['title'],
-                created_at=row['created_at'],
-                completed_today=row['completed_today'],
-                current_streak=streak
-            )
-            quests.append(quest)
-        
-        return ListQuestsResponse(
-            quests=quests,
-            total_count=len(quests),
-            daily_completions_used=daily_completions_used,
-            daily_completions_limit=sub_info['daily_completion_limit'],
-            is_premium=sub_info['is_premium']
-        )
-        
-    finally:
-        await conn.close()
+    cached = response_cache.lookup(QUESTS_LIST, user.sub)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+    token = response_cache.token()
+    today = date.today()
+    
+    # Subscription info, daily completions used today and the quests are independent reads
+    sub_info, daily_completions_used, quests = await repository.run_concurrently(
+        lambda db: db.subscription_info(user.sub),
+        lambda db: db.daily_completions(user.sub, today),
+        lambda db: load_user_quests(db, user.sub, today),
+        user_id=user.sub
+    )
+    
+    response = ListQuestsResponse(
+        quests=quests,
+        total_count=len(quests),
+        daily_completions_used=daily_completions_used,
+        daily_completions_limit=sub_info['daily_completion_limit'],
+        is_premium=sub_info['is_premium']
+    )
+    # Limits change when premium lapses
+    return response_cache.store(QUESTS_LIST, user.sub, response, token, expires_at=sub_info['premium_until'])
 
 @router.post("/complete-today", response_model=CompleteQuestResponse)
-async def complete_today(request: CompleteQuestRequest, user: AuthorizedUser):
-    """Mark a quest as completed for today - WITH DAILY COMPLETION LIMITS!"""
-    conn = await get_db_connection()
-    try:
+async def complete_today(
+    request: CompleteQuestRequest, user: AuthorizedUser, idempotency_key: Optional[str] = Header(None)
+):
+    """Mark a quest as completed for today - WITH DAILY COMPLETION LIMITS!
+    
+    Retries sent with the same Idempotency-Key get the first response back.
+    """
+    return await idempotency.run(
+        user.sub, "quests.complete_today", idempotency_key, request.model_dump(mode="json"),
+        lambda: complete_user_quest_today(request, user)
+    )
+
+async def complete_user_quest_today(request: CompleteQuestRequest, user) -> CompleteQuestResponse:
+    async with repository.session(user_id=user.sub) as db:
         # Verify quest belongs to user
-        quest_query = """
-        SELECT id, user_id, title, created_at 
-        FROM quests 
-        WHERE id = $1 AND user_id = $2
-        """
-        quest_row = await conn.fetchrow(quest_query, request.quest_id, user.sub)
+        quest_row = await db.get_quest(user.sub, request.quest_id)
         
         if not quest_row:
             raise HTTPException(status_code=404, detail="Quest not found")
@@ -250,18 +336,12 @@ async def complete_today(request: CompleteQuestRequest, user: AuthorizedUser):
         today = date.today()
         
         # Check if already completed today
-        existing_query = """
-        SELECT id FROM quest_checks 
-        WHERE quest_id = $1 AND date = $2
-        """
-        existing = await conn.fetchval(existing_query, request.quest_id, today)
-        
-        if existing:
+        if await db.is_completed(request.quest_id, today):
             raise HTTPException(status_code=400, detail="Quest already completed today")
         
         # GET USER SUBSCRIPTION INFO AND CHECK DAILY LIMITS
-        sub_info = await get_user_subscription_info(conn, user.sub)
-        daily_completions_used = await get_daily_completions_count(conn, user.sub, today)
+        sub_info = await db.subscription_info(user.sub)
+        daily_completions_used = await db.daily_completions(user.sub, today)
         
         # Check if user has reached daily completion limit (unless premium with unlimited)
         if sub_info['daily_completion_limit'] != -1:  # -1 means unlimited for premium
@@ -271,19 +351,18 @@ async def complete_today(request: CompleteQuestRequest, user: AuthorizedUser):
                     detail=f"Daily completion limit reached ({sub_info['daily_completion_limit']}/day). Upgrade to Champion for unlimited daily completions!"
                 )
         
-        # Create completion record
-        completion_query = """
-        INSERT INTO quest_checks (quest_id, date) 
-        VALUES ($1, $2) 
-        RETURNING id, quest_id, date, created_at
-        """
-        completion_row = await conn.fetchrow(completion_query, request.quest_id, today)
-        
-        # INCREMENT DAILY COMPLETION COUNT
-        new_daily_count = await increment_daily_completions(conn, user.sub, today)
-        
-        # Calculate new streak
-        new_streak = await calculate_streak(conn, request.quest_id)
+        # The completion, its counters, its XP and its follow-up tasks commit together
+        async with db.transaction():
+            # Create completion record
+            completion_row = await db.add_completion(request.quest_id, today)
+            
+            # INCREMENT DAILY COMPLETION COUNT
+            new_daily_count = await db.increment_daily_completions(user.sub, today)
+            
+            # Calculate new streak
+            new_streak = await db.current_streak(request.quest_id)
+            # Leaderboard and rival reaction follow the commit, see app.libs.repository_postgres
+            await db.record_completion(user.sub, quest_row['id'], quest_row['title'], new_streak, new_daily_count, today)
         
         completion = QuestCompletion(
             id=completion_row['id'],
@@ -300,6 +379,13 @@ async def complete_today(request: CompleteQuestRequest, user: AuthorizedUser):
             completed_today=True,
             current_streak=new_streak
         )
+        await db.publish(user.sub, "quest.completed", {
+            "quest": quest.model_dump(mode="json"),
+            "daily_completions_used": new_daily_count,
+            "daily_completions_limit": sub_info['daily_completion_limit']
+        })
+        # Rival XP changes with each completion
+        await db.invalidate_responses(user.sub, [QUESTS_LIST, *RIVAL_ROUTES])
         
         streak_msg = f"Streak: {new_streak} day{'s' if new_streak != 1 else ''}!" if new_streak > 0 else "Great start!"
         completion_msg = f"Daily progress: {new_daily_count}/{sub_info['daily_completion_limit'] if sub_info['daily_completion_limit'] != -1 else '∞'}"
@@ -311,27 +397,212 @@ async def complete_today(request: CompleteQuestRequest, user: AuthorizedUser):
             daily_completions_used=new_daily_count,
             daily_completions_limit=sub_info['daily_completion_limit']
         )
-        
-    finally:
-        await conn.close()
 
 @router.delete("/delete/{quest_id}")
 async def delete_quest(quest_id: int, user: AuthorizedUser):
     """Delete a quest and all its completions"""
-    conn = await get_db_connection()
-    try:
+    async with repository.session(user_id=user.sub) as db:
         # Verify quest belongs to user and delete
-        query = """
-        DELETE FROM quests 
-        WHERE id = $1 AND user_id = $2
-        RETURNING id
-        """
-        deleted_id = await conn.fetchval(query, quest_id, user.sub)
+        deleted_id = await db.delete_quest(user.sub, quest_id)
         
         if not deleted_id:
             raise HTTPException(status_code=404, detail="Quest not found")
         
+        leaderboard.remove(deleted_id)
+        await db.broadcast_leaderboard(deleted_id)
+        await db.publish(user.sub, "quest.deleted", {"quest_id": deleted_id})
+        await db.invalidate_responses(user.sub, [QUESTS_LIST])
+        
         return {"message": "Quest deleted successfully"}
+
+
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(user: AuthorizedUser, k: int = 10):
+    """Get the top-k quests by current streak, served from the in-memory index.
+    
+    Other users' quest titles are left out, they can be personal.
+    """
+    if k < 1 or k > MAX_LEADERBOARD_SIZE:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_LEADERBOARD_SIZE}")
+    
+    entries = [
+        LeaderboardEntry(
+            rank=rank,
+            quest_id=entry.quest_id,
+            title=entry.title if entry.user_id == user.sub else None,
+            current_streak=entry.streak,
+            is_mine=entry.user_id == user.sub
+        )
+        for rank, entry in enumerate(leaderboard.top(k), start=1)
+    ]
+    return LeaderboardResponse(entries=entries, total_ranked=len(leaderboard))
+
+@router.get("/reminders", response_model=ReminderPreferences)
+async def get_reminder_preferences(user: AuthorizedUser):
+    """Get when the user is reminded about quests still open for the day"""
+    require_postgres()
+    conn = await get_db_connection(read_only=True, user_id=user.sub)
+    try:
+        # No schema setup here, DDL cannot run on a replica; the table appears with the first write
+        try:
+            row = await conn.fetchrow(
+                "SELECT remind_minute, enabled FROM reminder_preferences WHERE user_id = $1",
+                user.sub
+            )
+        except asyncpg.UndefinedTableError:
+            row = None
+        minute = row['remind_minute'] if row else DEFAULT_REMINDER_MINUTE
+        return ReminderPreferences(
+            remind_at=f"{minute // 60:02d}:{minute % 60:02d}",
+            enabled=row['enabled'] if row else True
+        )
         
     finally:
-        await conn.close()
+        await release_db_connection(conn)
+
+@router.put("/reminders", response_model=ReminderPreferences)
+async def update_reminder_preferences(request: ReminderPreferences, user: AuthorizedUser):
+    """Set the daily reminder time (HH:MM) or turn reminders off"""
+    try:
+        minute = parse_minute(request.remind_at)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="remind_at must be a time as HH:MM")
+    require_postgres()
+    
+    conn = await get_db_connection(user_id=user.sub)
+    try:
+        await ensure_reminders_schema(conn)
+        await conn.execute(
+            """
+            INSERT INTO reminder_preferences (user_id, remind_minute, enabled)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (user_id)
+            DO UPDATE SET remind_minute = $2, enabled = $3, updated_at = NOW()
+            """,
+            user.sub,
+            minute,
+            request.enabled
+        )
+        return ReminderPreferences(
+            remind_at=f"{minute // 60:02d}:{minute % 60:02d}",
+            enabled=request.enabled
+        )
+        
+    finally:
+        await release_db_connection(conn)
+
+@router.get("/export")
+async def export_quests(
+    user: AuthorizedUser,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False
+):
+    """Stream the user's full quest history, one row per quest completion.
+    
+    Rows are read through a server-side cursor and written out in small chunks, so memory
+    use stays constant however long the history is. Quests without completions appear once
+    with empty date fields.
+    """
+    require_postgres()
+    
+    query = """
+    SELECT q.id AS quest_id, q.title, q.created_at AS quest_created_at,
+           qc.date, qc.created_at AS completed_at
+    FROM quests q
+    LEFT JOIN quest_check_days qc ON qc.quest_id = q.id
+    WHERE q.user_id = $1
+    ORDER BY q.id, qc.date
+    """
+    
+    conn = await get_db_connection(read_only=True, user_id=user.sub)
+    
+    async def generate_export():
+        try:
+            # Cursors only exist inside a transaction
+            async with conn.transaction():
+                rows = conn.cursor(query, user.sub, prefetch=EXPORT_PREFETCH_ROWS)
+                async for chunk in encode_export(rows, format, gzip):
+                    yield chunk
+        finally:
+            await release_db_connection(conn)
+    
+    extension = "ndjson" if format == "ndjson" else "csv"
+    headers = {"Content-Disposition": f'attachment; filename="quests-export.{extension}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    
+    return StreamingResponse(
+        generate_export(),
+        media_type="application/x-ndjson" if format == "ndjson" else "text/csv",
+        headers=headers
+    )
+
+@router.post("/import", response_model=ImportQuestsResponse)
+async def import_quests(request: Request, user: AuthorizedUser, format: Literal["csv", "ndjson"] = "csv"):
+    """Import quests and dated completions from a streamed CSV or NDJSON request body.
+    
+    Each row has a `title` and an optional `date` (YYYY-MM-DD, before today); files from
+    /quests/export can be imported as-is. Quests are matched by title and created when
+    missing, days already completed are skipped, and invalid rows are reported.
+    """
+    require_postgres()
+    conn = await get_db_connection(user_id=user.sub)
+    try:
+        async with conn.transaction():
+            importer = HistoryImporter(conn, user.sub, format)
+            await importer.begin()
+            try:
+                async for line in iter_lines(request.stream()):
+                    await importer.add_line(line)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            await importer.finish()
+            
+            # Bitmaps and streaks of the affected quests are rebuilt in the background
+            affected = sorted(importer.affected_quest_ids)
+            if affected:
+                await enqueue(conn, RecomputeStreaks(user_id=user.sub, quest_ids=affected))
+        
+        await publish(conn, user.sub, "quests.imported", {
+            "quests_created": importer.quests_created,
+            "completions_imported": importer.completions_imported
+        })
+        await invalidate_responses(conn, user.sub, [QUESTS_LIST])
+        
+        return ImportQuestsResponse(
+            quests_created=importer.quests_created,
+            completions_imported=importer.completions_imported,
+            duplicates_skipped=importer.completions_staged - importer.completions_imported,
+            rows_rejected=importer.rows_rejected,
+            rejects=[ImportReject(**r) for r in importer.rejects],
+            message=f"Imported {importer.completions_imported} completions across {len(affected)} quests."
+        )
+        
+    finally:
+        await release_db_connection(conn)
+
+@router.get("/{quest_id}/history", response_model=QuestHistoryResponse)
+async def get_quest_history(quest_id: int, user: AuthorizedUser, year: Optional[int] = None):
+    """Get the year-view completion bitmap of a quest with its current and longest streaks"""
+    today = date.today()
+    if year is None:
+        year = today.year
+    if year < 1 or year > today.year:
+        raise HTTPException(status_code=400, detail="Invalid year")
+    
+    async with repository.session(read_only=True, user_id=user.sub) as db:
+        if not await db.get_quest(user.sub, quest_id):
+            raise HTTPException(status_code=404, detail="Quest not found")
+        
+        year_bits = await db.year_bitmaps(quest_id)
+        bits = year_bits.get(year, 0)
+        
+        return QuestHistoryResponse(
+            quest_id=quest_id,
+            year=year,
+            days_in_year=days_in_year(year),
+            bitmap=bits_to_bytes(bits).hex(),
+            completed_days=bits.bit_count(),
+            current_streak=current_streak_from_bits(year_bits, today),
+            longest_streak=longest_run(concat_years(year_bits))
+        )
@@ -1,17 +1,47 @@
 
 
-from fastapi import APIRouter, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 import asyncpg
-import databutton as db
+import os
 from app.auth import AuthorizedUser
-from openai import OpenAI
+from app.libs.cache_bus import cache_bus
+from app.libs.database import get_db_connection, release_db_connection
+from app.libs.persona_batcher import PersonaBatcher
+from app.libs.persona_cache import persona_cache
+from app.libs.rate_limit import RateLimit
+from app.libs.repository import repository
+from app.libs.response_cache import RIVAL_GET, RIVAL_ROUTES, RIVALS_LIST, response_cache
+from app.libs.resilience import Upstream
+from app.libs.secret_store import secret_store
+from app.libs.streaming import JsonObjectScanner, sse_event
+from app.libs.warmup import readiness
+from app.libs.rival_interactions import interaction_engine
+from app.libs.rival_xp import rival_xp_engine
+from openai import AsyncOpenAI, OpenAI
 import json
 import random
 
-router = APIRouter(prefix="/rivals")
+@asynccontextmanager
+async def lifespan(app):
+    """Run the rival interaction and XP workers and cache invalidation listener for the app's lifetime"""
+    if not repository.uses_postgres:
+        yield
+        return
+    enrich = enrich_interactions if os.environ.get("RIVAL_INTERACTIONS_LLM_ENRICH") == "true" else None
+    await cache_bus.start()
+    interaction_engine.start(enrich=enrich)
+    await rival_xp_engine.start()
+    yield
+    await rival_xp_engine.stop()
+    interaction_engine.stop()
+    await cache_bus.stop()
+
+router = APIRouter(prefix="/rivals", lifespan=lifespan)
 
 # Pydantic Models
 class Rival(BaseModel):
@@ -35,6 +65,14 @@ class RivalInteraction(BaseModel):
     user_completions_today: int
     created_at: datetime
 
+class ListRivalInteractionsResponse(BaseModel):
+    interactions: List[RivalInteraction]
+    next_before_id: Optional[int]  # Pass as before_id to get the next page
+
+class PersonaRequest(BaseModel):
+    quest_context: str
+    personality_type: str
+
 class GenerateRivalResponse(BaseModel):
     rival: Rival
     message: str
@@ -78,65 +116,66 @@ PERSONALITY_TYPES = {
     }
 }
 
-# Database helper functions
-async def get_db_connection():
-    """Get database connection"""
-    database_url = db.secrets.get("DATABASE_URL_DEV")
-    return await asyncpg.connect(database_url)
-
-async def get_user_subscription_info(conn, user_id: str) -> dict:
-    """Get user subscription status and rival limits"""
-    query = """
-    SELECT 
-        CASE WHEN status = 'active' AND end_date > NOW() THEN true ELSE false END as is_premium,
-        COALESCE(daily_completion_limit, 5) as daily_completion_limit,
-        COALESCE(max_rivals, 1) as max_rivals
-    FROM user_subscriptions 
-    WHERE user_id = $1
-    ORDER BY created_at DESC
-    LIMIT 1
-    """
-    result = await conn.fetchrow(query, user_id)
-    
-    if result:
-        return {
-            'is_premium': result['is_premium'],
-            'daily_completion_limit': result['daily_completion_limit'],
-            'max_rivals': result['max_rivals']
-        }
-    else:
-        # Default for users without subscription record
-        return {
-            'is_premium': False,
-            'daily_completion_limit': 5,
-            'max_rivals': 1
-        }
+# Clients are reused until the API key changes
+# OPENAI_BASE_URL points generation at another OpenAI-compatible server, e.g. a local fake
+openai_client = secret_store.derived(
+    "OPENAI_API_KEY", lambda api_key: OpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+)
+async_openai_client = secret_store.derived(
+    "OPENAI_API_KEY", lambda api_key: AsyncOpenAI(api_key=api_key, base_url=os.environ.get("OPENAI_BASE_URL"))
+)
+
+async def warm_openai_clients():
+    """Build both OpenAI clients before the first generation request"""
+    if openai_client.get() is None or async_openai_client.get() is None:
+        raise RuntimeError("OPENAI_API_KEY is not set")
 
+readiness.add_step("openai", warm_openai_clients, required=False)
+
+# Database helper functions
 def get_openai_client() -> OpenAI:
     """Get OpenAI client with API key from secrets"""
-    api_key = db.secrets.get("OPENAI_API_KEY")
-    if not api_key:
+    client = openai_client.get()
+    if client is None:
+        raise HTTPException(
+            status_code=503, 
+            detail="OpenAI API key not configured. Please add OPENAI_API_KEY in Settings."
+        )
+    return client
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get async OpenAI client for streaming completions"""
+    client = async_openai_client.get()
+    if client is None:
         raise HTTPException(
             status_code=503, 
             detail="OpenAI API key not configured. Please add OPENAI_API_KEY in Settings."
         )
-    return OpenAI(api_key=api_key)
+    return client
 
-async def get_user_quest_context(conn, user_id: str) -> str:
+async def get_user_quest_context(db, user_id: str) -> str:
     """Get user's quest titles to inform rival generation"""
-    query = "SELECT title FROM quests WHERE user_id = $1 ORDER BY created_at DESC LIMIT 5"
-    quest_rows = await conn.fetch(query, user_id)
+    quest_titles = await db.recent_quest_titles(user_id, 5)
     
-    if not quest_rows:
+    if not quest_titles:
         return "This user hasn't created any quests yet."
     
-    quest_titles = [row['title'] for row in quest_rows]
     return f"User's recent quests: {', '.join(quest_titles)}"
 
-def generate_rival_persona(quest_context: str, personality_type: str) -> dict:
-    """Generate a rival persona using OpenAI with specific personality"""
-    client = get_openai_client()
-    
+# Fail fast to the fallback persona while OpenAI is down or saturated
+openai_upstream = Upstream("openai", timeout_seconds=15, max_concurrency=16)
+
+# Each generation is an LLM call; cap them per user (RATE_LIMIT_RIVAL_GENERATE overrides)
+generate_limit = RateLimit("rival_generate", requests=10, per_seconds=3600, burst=3)
+
+PERSONA_MODEL_PARAMS = {
+    "model": "gpt-4o-mini",
+    "temperature": 0.8,
+    "max_tokens": 150
+}
+
+def build_persona_messages(quest_context: str, personality_type: str) -> list:
+    """Render the chat messages for generating a rival persona"""
     personality_info = PERSONALITY_TYPES[personality_type]
     traits = ", ".join(personality_info["traits"])
     
@@ -168,136 +207,271 @@ Respond with valid JSON only:
   "taunt": "Your taunt message here!"
 }}"""
     
+    return [
+        {"role": "system", "content": "You are a creative AI that generates competitive gaming personas. Always respond with valid JSON only."},
+        {"role": "user", "content": prompt}
+    ]
+
+def validate_rival_persona(rival_data: dict) -> dict:
+    """Check an AI generated persona has the required fields and clamp their lengths"""
+    if not isinstance(rival_data, dict) or not all(key in rival_data for key in ["name", "archetype", "taunt"]):
+        raise ValueError("Missing required fields in AI response")
+    
+    return {
+        "name": str(rival_data["name"])[:50],
+        "archetype": str(rival_data["archetype"])[:30],
+        "taunt": str(rival_data["taunt"])[:200]
+    }
+
+def generate_rival_persona(messages: list, timeout: Optional[float] = None) -> dict:
+    """Generate a rival persona using OpenAI, raises if the response is unusable"""
+    client = get_openai_client()
+    response = client.chat.completions.create(messages=messages, timeout=timeout, **PERSONA_MODEL_PARAMS)
+    content = response.choices[0].message.content.strip()
+    return validate_rival_persona(json.loads(content))
+
+def generate_single_persona(request: PersonaRequest, timeout: Optional[float] = None) -> dict:
+    """Generate the persona of one request with its own completion call"""
+    return generate_rival_persona(
+        build_persona_messages(request.quest_context, request.personality_type), timeout=timeout
+    )
+
+def generate_rival_personas(requests: List[PersonaRequest], timeout: Optional[float] = None) -> list:
+    """Generate several personas with one completion call, None for entries that fail validation"""
+    sections = []
+    for i, request in enumerate(requests):
+        traits = ", ".join(PERSONALITY_TYPES[request.personality_type]["traits"])
+        sections.append(
+            f"Rival {i + 1}:\n"
+            f"Personality Type: {request.personality_type}\n"
+            f"Personality Traits: {traits}\n"
+            f"Context about the user: {request.quest_context}"
+        )
+    
+    prompt = f"""
+You are creating {len(requests)} competitive AI rivals for a gamified habit tracker called RivalQuest, one per request below.
+
+{chr(10).join(sections)}
+
+For each rival generate:
+1. Name: A fantasy/gaming-inspired name (5-12 characters) that fits its personality
+2. Archetype: One word describing their character (Warrior, Mage, Rogue, Berserker, Paladin, etc.)
+3. Taunt: A short, motivational message (20-80 characters) that matches its personality
+
+Each rival should embody its personality, be competitive but motivating, reference quest/habit completion and streaks, and use gaming terminology.
+
+Respond with valid JSON only, with exactly {len(requests)} personas in request order:
+{{
+  "personas": [
+    {{"name": "RivalName", "archetype": "Archetype", "taunt": "Your taunt message here!"}}
+  ]
+}}"""
+    
+    client = get_openai_client()
+    response = client.chat.completions.create(
+        model=PERSONA_MODEL_PARAMS["model"],
+        messages=[
+            {"role": "system", "content": "You are a creative AI that generates competitive gaming personas. Always respond with valid JSON only."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=PERSONA_MODEL_PARAMS["temperature"],
+        max_tokens=PERSONA_MODEL_PARAMS["max_tokens"] * len(requests),
+        timeout=timeout
+    )
+    personas = json.loads(response.choices[0].message.content.strip())["personas"]
+    
+    results = []
+    for persona in personas:
+        try:
+            results.append(validate_rival_persona(persona))
+        except ValueError:
+            results.append(None)
+    return results
+
+persona_batcher = PersonaBatcher(
+    generate_rival_personas, generate_single_persona, call=openai_upstream.call
+)
+
+def fallback_rival_persona(personality_type: str) -> dict:
+    """Fallback rival based on personality when AI generation fails"""
+    fallback_names = PERSONALITY_TYPES[personality_type]["sample_names"]
+    return {
+        "name": random.choice(fallback_names),
+        "archetype": "Champion",
+        "taunt": f"A {personality_type} rival challenges you to greatness!"
+    }
+
+async def request_rival_persona(quest_context: str, personality_type: str) -> Optional[dict]:
+    """Generate a persona through the batcher, None when generation fails"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a creative AI that generates competitive gaming personas. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.8,
-            max_tokens=150
+        return await persona_batcher.submit(
+            PersonaRequest(quest_context=quest_context, personality_type=personality_type)
         )
-        
-        content = response.choices[0].message.content.strip()
-        rival_data = json.loads(content)
-        
-        # Validate required fields
-        if not all(key in rival_data for key in ["name", "archetype", "taunt"]):
-            raise ValueError("Missing required fields in AI response")
-        
-        # Validate lengths
-        if len(rival_data["name"]) > 50:
-            rival_data["name"] = rival_data["name"][:50]
-        if len(rival_data["archetype"]) > 30:
-            rival_data["archetype"] = rival_data["archetype"][:30]
-        if len(rival_data["taunt"]) > 200:
-            rival_data["taunt"] = rival_data["taunt"][:200]
-        
-        return rival_data
-        
-    except (json.JSONDecodeError, Exception) as e:
+    except Exception as e:
         print(f"AI generation failed: {e}")
-        # Fallback rival based on personality
-        fallback_names = personality_info["sample_names"]
-        return {
-            "name": random.choice(fallback_names),
-            "archetype": "Champion",
-            "taunt": f"A {personality_type} rival challenges you to greatness!"
-        }
+        return None
+
+async def enrich_interactions(items: list) -> list:
+    """Rewrite a batch of template interactions in each rival's voice with a single LLM call"""
+    client = get_openai_client()
+    lines = [
+        f"{i + 1}. [{rival['name']}, {rival['personality_type']}] {message}"
+        for i, (rival, message) in enumerate(items)
+    ]
+    prompt = f"""
+Rewrite each rival message below in the voice of its rival (name and personality in brackets).
+Keep the meaning and any numbers, stay competitive but motivating, and keep each under 120 characters.
+
+{chr(10).join(lines)}
+
+Respond with a JSON array of exactly {len(items)} strings, in the same order."""
+    
+    response = await openai_upstream.call(
+        client.chat.completions.create,
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You write short in-character messages for gaming rivals. Always respond with valid JSON only."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.8,
+        max_tokens=60 * len(items)
+    )
+    messages = json.loads(response.choices[0].message.content.strip())
+    if not isinstance(messages, list) or len(messages) != len(items):
+        raise ValueError("Enriched batch does not match the request")
+    return [m if isinstance(m, str) else None for m in messages]
+
+def rival_from_row(row) -> Rival:
+    return Rival(
+        id=row['id'],
+        user_id=row['user_id'],
+        name=row['name'],
+        archetype=row['archetype'],
+        taunt=row['taunt'],
+        personality_type=row['personality_type'],
+        level=row['level'],
+        experience=row['experience'],
+        rival_order=row['rival_order'],
+        is_active=row['is_active'],
+        created_at=row['created_at']
+    )
+
+async def load_user_rivals(db, user_id: str) -> List[Rival]:
+    """Get all of the user's rivals in slot order"""
+    return [rival_from_row(row) for row in await db.list_rivals(user_id)]
+
+def require_postgres():
+    """Reject features that only the Postgres repository supports"""
+    if not repository.uses_postgres:
+        raise HTTPException(status_code=501, detail="Not available with the in-memory repository")
+
+def find_active_rival(rivals: List[Rival]) -> Optional[Rival]:
+    """The primary rival: the first active one in slot order"""
+    return next((rival for rival in rivals if rival.is_active), None)
 
 # API Endpoints
 @router.get("/get", response_model=GetRivalResponse)
 async def get_rival(user: AuthorizedUser):
     """Get the primary/active rival for the user"""
-    conn = await get_db_connection()
-    try:
-        query = """
-        SELECT id, user_id, name, archetype, taunt, personality_type, 
-               level, experience, rival_order, is_active, created_at
-        FROM rivals 
-        WHERE user_id = $1 AND is_active = true
-        ORDER BY rival_order ASC
-        LIMIT 1
-        """
-        rival_row = await conn.fetchrow(query, user.sub)
+    cached = response_cache.lookup(RIVAL_GET, user.sub)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+    token = response_cache.token()
+    async with repository.session(read_only=True, user_id=user.sub) as db:
+        rival_row = await db.active_rival(user.sub)
         
         if rival_row:
-            rival = Rival(
-                id=rival_row['id'],
-                user_id=rival_row['user_id'],
-                name=rival_row['name'],
-                archetype=rival_row['archetype'],
-                taunt=rival_row['taunt'],
-                personality_type=rival_row['personality_type'],
-                level=rival_row['level'],
-                experience=rival_row['experience'],
-                rival_order=rival_row['rival_order'],
-                is_active=rival_row['is_active'],
-                created_at=rival_row['created_at']
-            )
-            return GetRivalResponse(rival=rival, has_rival=True)
+            response = GetRivalResponse(rival=rival_from_row(rival_row), has_rival=True)
         else:
-            return GetRivalResponse(rival=None, has_rival=False)
-        
-    finally:
-        await conn.close()
+            response = GetRivalResponse(rival=None, has_rival=False)
+        return response_cache.store(RIVAL_GET, user.sub, response, token)
 
 @router.get("/list", response_model=ListRivalsResponse)
 async def list_rivals(user: AuthorizedUser):
     """List all rivals for the user with subscription limits"""
-    conn = await get_db_connection()
-    try:
-        # Get user subscription info
-        sub_info = await get_user_subscription_info(conn, user.sub)
-        
-        # Get all user's rivals
-        query = """
-        SELECT id, user_id, name, archetype, taunt, personality_type, 
-               level, experience, rival_order, is_active, created_at
-        FROM rivals 
-        WHERE user_id = $1
-        ORDER BY rival_order ASC
-        """
-        rival_rows = await conn.fetch(query, user.sub)
-        
-        rivals = []
-        active_rival = None
-        
-        for row in rival_rows:
-            rival = Rival(
-                id=row['id'],
-                user_id=row['user_id'],
-                name=row['name'],
-                archetype=row['archetype'],
-                taunt=row['taunt'],
-                personality_type=row['personality_type'],
-                level=row['level'],
-                experience=row['experience'],
-                rival_order=row['rival_order'],
-                is_active=row['is_active'],
-                created_at=row['created_at']
-            )
-            rivals.append(rival)
-            
-            if row['is_active'] and active_rival is None:
-                active_rival = rival
-        
-        return ListRivalsResponse(
-            rivals=rivals,
-            total_count=len(rivals),
-            active_rival=active_rival,
-            slots_used=len(rivals),
-            max_slots=sub_info['max_rivals'],
-            is_premium=sub_info['is_premium']
+    cached = response_cache.lookup(RIVALS_LIST, user.sub)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+    token = response_cache.token()
+    # Get user subscription info and all user's rivals in parallel
+    sub_info, rivals = await repository.run_concurrently(
+        lambda db: db.subscription_info(user.sub),
+        lambda db: load_user_rivals(db, user.sub),
+        user_id=user.sub
+    )
+    
+    response = ListRivalsResponse(
+        rivals=rivals,
+        total_count=len(rivals),
+        active_rival=find_active_rival(rivals),
+        slots_used=len(rivals),
+        max_slots=sub_info['max_rivals'],
+        is_premium=sub_info['is_premium']
+    )
+    # Slots change when premium lapses
+    return response_cache.store(RIVALS_LIST, user.sub, response, token, expires_at=sub_info['premium_until'])
+
+async def check_rival_slots(db, user_id: str) -> tuple:
+    """Return (subscription info, existing rival count), raising 403 when no slot is free"""
+    sub_info = await db.subscription_info(user_id)
+    
+    # Count existing rivals
+    existing_count = await db.count_rivals(user_id)
+    
+    # Check if user can create more rivals
+    if existing_count >= sub_info['max_rivals']:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Rival limit reached ({sub_info['max_rivals']}). Upgrade to Champion for multiple rivals!"
         )
-        
-    finally:
-        await conn.close()
+    return sub_info, existing_count
+
+async def save_new_rival(
+    db,
+    user_id: str,
+    rival_data: dict,
+    personality_type: str,
+    existing_count: int,
+    max_slots: int
+) -> GenerateRivalResponse:
+    """Insert a generated rival into the next free slot"""
+    # Determine rival order (next available slot)
+    next_order = existing_count + 1
+    
+    # First rival is always active, others are inactive by default
+    is_active = existing_count == 0
+    
+    # Create new rival
+    rival_row = await db.create_rival(
+        user_id, 
+        rival_data["name"], 
+        rival_data["archetype"], 
+        rival_data["taunt"],
+        personality_type,
+        next_order,
+        is_active
+    )
+    rival = rival_from_row(rival_row)
+    
+    await db.publish(user_id, "rival.created", rival.model_dump(mode="json"))
+    await db.invalidate_responses(user_id, RIVAL_ROUTES)
+    
+    status_msg = "active" if is_active else "ready to challenge"
+    message = f"Meet your new {personality_type} rival: {rival_data['name']} the {rival_data['archetype']}! They're {status_msg}."
+    
+    return GenerateRivalResponse(
+        rival=rival,
+        message=message,
+        is_new=True,
+        slots_used=existing_count + 1,
+        max_slots=max_slots
+    )
 
 @router.post("/generate", response_model=GenerateRivalResponse)
 async def generate_rival(user: AuthorizedUser, personality_type: str = "competitive"):
     """Generate a new rival with specified personality type"""
+    await generate_limit.check(user.sub)
+    
     # Validate personality type
     if personality_type not in PERSONALITY_TYPES:
         raise HTTPException(
@@ -311,78 +485,163 @@ async def generate_rival(user: AuthorizedUser, personality_type: str = "competit
     except HTTPException:
         raise  # Re-raise the 503 error for missing API key
     
-    conn = await get_db_connection()
-    try:
+    async with repository.session(user_id=user.sub) as db:
         # Check user subscription and rival limits
-        sub_info = await get_user_subscription_info(conn, user.sub)
-        
-        # Count existing rivals
-        count_query = "SELECT COUNT(*) FROM rivals WHERE user_id = $1"
-        existing_count = await conn.fetchval(count_query, user.sub)
-        
-        # Check if user can create more rivals
-        if existing_count >= sub_info['max_rivals']:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Rival limit reached ({sub_info['max_rivals']}). Upgrade to Champion for multiple rivals!"
-            )
+        await check_rival_slots(db, user.sub)
         
         # Get user's quest context
-        quest_context = await get_user_quest_context(conn, user.sub)
+        quest_context = await get_user_quest_context(db, user.sub)
         
-        # Generate rival using OpenAI
-        rival_data = generate_rival_persona(quest_context, personality_type)
-        
-        # Determine rival order (next available slot)
-        next_order = existing_count + 1
-        
-        # Create new rival
-        insert_query = """
-        INSERT INTO rivals (user_id, name, archetype, taunt, personality_type, 
-                           level, experience, rival_order, is_active) 
-        VALUES ($1, $2, $3, $4, $5, 1, 0, $6, $7)
-        RETURNING id, user_id, name, archetype, taunt, personality_type, 
-                  level, experience, rival_order, is_active, created_at
-        """
-        
-        # First rival is always active, others are inactive by default
-        is_active = existing_count == 0
+        # Reuse a cached persona for the same prompt when allowed
+        cache_key = persona_cache.key(build_persona_messages(quest_context, personality_type), **PERSONA_MODEL_PARAMS)
+        cached = await db.cached_persona(cache_key) if persona_cache.should_reuse() else None
+    
+    # The LLM call and its batching window run without holding a pooled connection
+    generated = None if cached is not None else await request_rival_persona(quest_context, personality_type)
+    rival_data = cached or generated or fallback_rival_persona(personality_type)
+    
+    async with repository.session(user_id=user.sub) as db:
+        # Check again, another request may have taken the slot in the meantime
+        sub_info, existing_count = await check_rival_slots(db, user.sub)
+        if generated is not None:
+            await db.store_persona(cache_key, generated)
         
-        rival_row = await conn.fetchrow(
-            insert_query, 
-            user.sub, 
-            rival_data["name"], 
-            rival_data["archetype"], 
-            rival_data["taunt"],
-            personality_type,
-            next_order,
-            is_active
+        return await save_new_rival(
+            db, user.sub, rival_data, personality_type, existing_count, sub_info['max_rivals']
         )
-        
-        rival = Rival(
-            id=rival_row['id'],
-            user_id=rival_row['user_id'],
-            name=rival_row['name'],
-            archetype=rival_row['archetype'],
-            taunt=rival_row['taunt'],
-            personality_type=rival_row['personality_type'],
-            level=rival_row['level'],
-            experience=rival_row['experience'],
-            rival_order=rival_row['rival_order'],
-            is_active=rival_row['is_active'],
-            created_at=rival_row['created_at']
+
+@router.get("/generate/stream")
+async def generate_rival_stream(user: AuthorizedUser, personality_type: str = "competitive"):
+    """Generate a new rival, streaming the model's tokens as Server-Sent Events.
+    
+    Events: `token` ({"text"}) for each model delta, `persona` once the JSON persona is
+    complete, `rival` with the saved GenerateRivalResponse, or `error` ({"detail"}).
+    """
+    await generate_limit.check(user.sub)
+    
+    if personality_type not in PERSONALITY_TYPES:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Invalid personality type. Must be one of: {list(PERSONALITY_TYPES.keys())}"
+        )
+    
+    client = get_async_openai_client()
+    
+    async with repository.session(user_id=user.sub) as db:
+        await check_rival_slots(db, user.sub)
+        quest_context = await get_user_quest_context(db, user.sub)
+        messages = build_persona_messages(quest_context, personality_type)
+        cache_key = persona_cache.key(messages, **PERSONA_MODEL_PARAMS)
+        cached = await db.cached_persona(cache_key) if persona_cache.should_reuse() else None
+    
+    async def event_stream():
+        # No session is held while the model streams; the insert takes a new one
+        try:
+            rival_data = cached
+            generated = False
+            if rival_data is None:
+                scanner = JsonObjectScanner()
+                try:
+                    # The stream holds an OpenAI slot until it is done
+                    async with openai_upstream.guard() as slot:
+                        stream = await client.chat.completions.create(
+                            messages=messages, stream=True, timeout=slot.timeout, **PERSONA_MODEL_PARAMS
+                        )
+                        async for chunk in stream:
+                            if not chunk.choices:
+                                continue
+                            text = chunk.choices[0].delta.content or ""
+                            if not text:
+                                continue
+                            yield sse_event("token", {"text": text})
+                            parsed = scanner.feed(text)
+                            if parsed is not None:
+                                # Persist as soon as the JSON closes, ignore any trailing tokens
+                                rival_data = validate_rival_persona(parsed)
+                                generated = True
+                                await stream.close()
+                                break
+                except Exception as e:
+                    print(f"AI generation failed: {e}")
+                
+                if rival_data is None:
+                    rival_data = fallback_rival_persona(personality_type)
+            
+            yield sse_event("persona", rival_data)
+            
+            async with repository.session(user_id=user.sub) as db:
+                # Check again, another request may have taken the slot during the stream
+                sub_info, existing_count = await check_rival_slots(db, user.sub)
+                if generated:
+                    await db.store_persona(cache_key, rival_data)
+                response = await save_new_rival(
+                    db, user.sub, rival_data, personality_type, existing_count, sub_info['max_rivals']
+                )
+            yield sse_event("rival", response.model_dump(mode="json"))
+            
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+        except Exception as e:
+            print(f"Streaming rival generation failed: {e}")
+            yield sse_event("error", {"detail": "Rival generation failed"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{rival_id}/interactions", response_model=ListRivalInteractionsResponse)
+async def list_rival_interactions(
+    rival_id: int,
+    user: AuthorizedUser,
+    limit: int = 20,
+    before_id: Optional[int] = None
+):
+    """List a rival's reactions to the user's quest completions, newest first"""
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    require_postgres()
+    
+    conn = await get_db_connection(read_only=True, user_id=user.sub)
+    try:
+        owner = await conn.fetchval(
+            "SELECT user_id FROM rivals WHERE id = $1 AND user_id = $2",
+            rival_id,
+            user.sub
         )
+        if not owner:
+            raise HTTPException(status_code=404, detail="Rival not found")
+        
+        query = """
+        SELECT id, rival_id, interaction_type, message, user_completions_today, created_at
+        FROM rival_interactions
+        WHERE rival_id = $1 AND ($2::int IS NULL OR id < $2)
+        ORDER BY id DESC
+        LIMIT $3
+        """
+        # No schema setup here, DDL cannot run on a replica; the table appears with the first write
+        try:
+            rows = await conn.fetch(query, rival_id, before_id, limit + 1)
+        except asyncpg.UndefinedTableError:
+            rows = []
         
-        status_msg = "active" if is_active else "ready to challenge"
-        message = f"Meet your new {personality_type} rival: {rival_data['name']} the {rival_data['archetype']}! They're {status_msg}."
+        interactions = [
+            RivalInteraction(
+                id=row['id'],
+                rival_id=row['rival_id'],
+                interaction_type=row['interaction_type'],
+                message=row['message'],
+                user_completions_today=row['user_completions_today'],
+                created_at=row['created_at']
+            )
+            for row in rows[:limit]
+        ]
         
-        return GenerateRivalResponse(
-            rival=rival,
-            message=message,
-            is_new=True,
-            slots_used=existing_count + 1,
-            max_slots=sub_info['max_rivals']
+        return ListRivalInteractionsResponse(
+            interactions=interactions,
+            next_before_id=interactions[-1].id if len(rows) > limit else None
         )
         
     finally:
-        await conn.close()
+        await release_db_connection(conn)
@@ -0,0 +1,73 @@
+"""Size-bounded in-process LRU caches with per-entry expiry.
+
+Every cache is registered by name so the cache bus (`app.libs.cache_bus`) can
+evict entries in all workers when a write changes the underlying data.
+
+Usage:
+
+    from app.libs.cache import LocalCache
+
+    entitlements = LocalCache("entitlements", max_entries=10_000, ttl_seconds=60)
+    entitlements.set(user_id, info)
+    info = entitlements.get(user_id)
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.libs.metrics import Counter, Gauge
+
+LOOKUPS = Counter("local_cache_lookups_total", "In-process cache lookups by cache and result")
+ENTRIES = Gauge("local_cache_entries", "Entries held by each in-process cache")
+
+_caches: dict[str, "LocalCache"] = {}
+
+_MISSING = object()
+
+
+class LocalCache:
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float | None = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        _caches[name] = self
+
+    def get(self, key: str, default=None):
+        item = self._entries.get(key, _MISSING)
+        if item is _MISSING:
+            LOOKUPS.inc(cache=self.name, result="miss")
+            return default
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            LOOKUPS.inc(cache=self.name, result="expired")
+            return default
+        self._entries.move_to_end(key)
+        LOOKUPS.inc(cache=self.name, result="hit")
+        return value
+
+    def set(self, key: str, value, ttl_seconds: float | None = None) -> None:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        ENTRIES.set(len(self._entries), cache=self.name)
+
+    def delete(self, key: str) -> None:
+        if self._entries.pop(key, None) is not None:
+            ENTRIES.set(len(self._entries), cache=self.name)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        ENTRIES.set(0, cache=self.name)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def get_cache(name: str) -> LocalCache | None:
+    return _caches.get(name)
@@ -0,0 +1,86 @@
+"""Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+`invalidate` evicts the keys from the local cache right away and sends a
+NOTIFY on the writer's connection, so the other workers evict them as soon as
+the write commits. Each worker receives invalidations on the shared listener
+connection (`app.libs.pg_listener`) and ignores its own, unless they were sent
+with `echo=True`: then the writer evicts again on commit, which drops anything
+a concurrent read cached from before the write while its transaction was open.
+
+Usage:
+
+    from app.libs.cache_bus import cache_bus
+
+    await cache_bus.invalidate(conn, "entitlements", [user.sub])
+"""
+
+import json
+
+from app.libs.cache import get_cache
+from app.libs.database import connect_direct
+from app.libs.metrics import Counter
+from app.libs.pg_listener import WORKER_ID, pg_listener
+
+CHANNEL = "cache_invalidation"
+
+INVALIDATIONS = Counter("cache_invalidations_total", "Cache keys invalidated by cache and origin")
+
+
+def evict(cache_name: str, keys: list[str] | None) -> None:
+    """Delete the keys, or clear the whole cache when keys is None"""
+    cache = get_cache(cache_name)
+    if cache is None:
+        return
+    if keys is None:
+        cache.clear()
+    else:
+        for key in keys:
+            cache.delete(key)
+
+
+class CacheBus:
+    def __init__(self):
+        self._registered = False
+
+    async def invalidate(self, conn, cache_name: str, keys: list[str] | None = None, echo: bool = False) -> None:
+        """Evict keys (or the whole cache when keys is None) in every worker.
+
+        An empty list evicts nothing and sends nothing. With no connection (the in-memory
+        repository) only this worker's cache is evicted.
+        """
+        if keys is not None and not keys:
+            return
+        evict(cache_name, keys)
+        INVALIDATIONS.inc(1 if keys is None else len(keys), cache=cache_name, origin="local")
+        if conn is None:
+            return
+        # keys is sent as null to clear the cache
+        payload = json.dumps({"origin": WORKER_ID, "cache": cache_name, "keys": keys, "echo": echo})
+        try:
+            await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+        except Exception as e:
+            print(f"Failed to broadcast invalidation of {cache_name}: {e}")
+
+    def on_notification(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message.get("origin") == WORKER_ID and not message.get("echo"):
+            return
+        keys = message.get("keys")
+        if keys is not None and not keys:
+            return
+        evict(message["cache"], keys)
+        origin = "echo" if message.get("origin") == WORKER_ID else "remote"
+        INVALIDATIONS.inc(1 if keys is None else len(keys), cache=message["cache"], origin=origin)
+
+    async def start(self) -> None:
+        """Start receiving invalidations; pair with stop()"""
+        if not self._registered:
+            pg_listener.add_listener(CHANNEL, self.on_notification)
+            self._registered = True
+        await pg_listener.start(connect_direct)
+
+    async def stop(self) -> None:
+        await pg_listener.stop()
+
+
+cache_bus = CacheBus()
@@ -1,12 +1,163 @@
-import databutton as db
+"""Pooled Postgres connections with read/write routing.
+
+Writes use the primary pool (`DATABASE_URL_ADMIN_PROD` in the deployed service,
+`DATABASE_URL_ADMIN_DEV` in the workspace). Read-only handlers ask for a replica
+connection; it comes from the replica pool when `DATABASE_URL_REPLICA_PROD`
+(`DATABASE_URL_REPLICA_DEV`) is configured, and from the primary otherwise. A user
+who has just written is pinned to the primary for `READ_YOUR_WRITES_SECONDS` so
+they never read a replica that has not caught up with their own change. The pin
+is broadcast to the other workers through the shared listener connection.
+
+Usage:
+
+    from app.libs.database import get_db_connection, release_db_connection
+
+    conn = await get_db_connection(read_only=True, user_id=user.sub)
+    try:
+        ...
+    finally:
+        await release_db_connection(conn)
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
 import asyncpg
-from app.env import mode, Mode
 
-async def get_db_connection():
-    if mode == Mode.PROD:
-        db_url = db.secrets.get("DATABASE_URL_ADMIN_PROD")
-    else:
-        db_url = db.secrets.get("DATABASE_URL_ADMIN_DEV")
-    
-    conn = await asyncpg.connect(db_url)
+from app.libs.pg_listener import WORKER_ID, pg_listener
+from app.libs.secret_store import ENV_SUFFIX, secret_store
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+DATABASE_URL_SECRETS = {
+    PRIMARY: f"DATABASE_URL_ADMIN_{ENV_SUFFIX}",
+    REPLICA: f"DATABASE_URL_REPLICA_{ENV_SUFFIX}",
+}
+
+READ_YOUR_WRITES_SECONDS = 5
+PIN_CHANNEL = "replica_pins"
+
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+
+_pools: dict[str, asyncpg.Pool] = {}
+_pool_lock = asyncio.Lock()
+_connection_pools: dict[int, asyncpg.Pool] = {}
+_pinned_until: dict[str, float] = {}
+
+
+def get_database_url(role: str) -> str | None:
+    return secret_store.get(DATABASE_URL_SECRETS[role])
+
+
+async def get_pool(role: str = PRIMARY) -> asyncpg.Pool:
+    """Get (creating on first use) the pool for a role, the replica falls back to the primary"""
+    pool = _pools.get(role)
+    if pool is not None:
+        return pool
+    async with _pool_lock:
+        for r in (PRIMARY, role):
+            if r in _pools:
+                continue
+            url = get_database_url(r)
+            if url is None:
+                if r == PRIMARY:
+                    raise RuntimeError(f"{DATABASE_URL_SECRETS[PRIMARY]} is not configured")
+                _pools[r] = _pools[PRIMARY]
+            else:
+                _pools[r] = await asyncpg.create_pool(url, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE)
+        return _pools[role]
+
+
+def has_replica() -> bool:
+    return get_database_url(REPLICA) is not None
+
+
+def reset_pools(_new_url: str | None = None) -> None:
+    """Drop the pools after a database URL changes; they close once their connections are released"""
+    for pool in set(_pools.values()):
+        asyncio.get_running_loop().create_task(pool.close())
+    _pools.clear()
+
+
+for _secret in DATABASE_URL_SECRETS.values():
+    secret_store.on_change(_secret, reset_pools)
+
+
+def is_pinned(user_id: str | None) -> bool:
+    if user_id is None:
+        return False
+    until = _pinned_until.get(user_id)
+    if until is None:
+        return False
+    if until <= time.monotonic():
+        del _pinned_until[user_id]
+        return False
+    return True
+
+
+def pin_to_primary(user_id: str) -> None:
+    _pinned_until[user_id] = time.monotonic() + READ_YOUR_WRITES_SECONDS
+
+
+def _on_pin(payload: str) -> None:
+    origin, _, user_id = payload.partition(":")
+    if origin != WORKER_ID:
+        pin_to_primary(user_id)
+
+
+pg_listener.add_listener(PIN_CHANNEL, _on_pin)
+
+
+async def get_db_connection(read_only: bool = False, user_id: str | None = None):
+    """Acquire a pooled connection; release it with release_db_connection.
+
+    Connections that are not read-only are assumed to write, and pin `user_id` to the
+    primary for a few seconds.
+    """
+    role = REPLICA if read_only and not is_pinned(user_id) else PRIMARY
+    pool = await get_pool(role)
+    conn = await pool.acquire()
+    _connection_pools[id(conn)] = pool
+
+    if not read_only and user_id is not None and has_replica():
+        pin_to_primary(user_id)
+        try:
+            await conn.execute("SELECT pg_notify($1, $2)", PIN_CHANNEL, f"{WORKER_ID}:{user_id}")
+        except Exception as e:
+            print(f"Failed to broadcast primary pin: {e}")
     return conn
+
+
+async def release_db_connection(conn) -> None:
+    pool = _connection_pools.pop(id(conn), None)
+    if pool is None:
+        await conn.close()
+    else:
+        await pool.release(conn)
+
+
+@asynccontextmanager
+async def db_connection(read_only: bool = False, user_id: str | None = None):
+    conn = await get_db_connection(read_only=read_only, user_id=user_id)
+    try:
+        yield conn
+    finally:
+        await release_db_connection(conn)
+
+
+async def connect_direct() -> asyncpg.Connection:
+    """Open a dedicated, unpooled primary connection, e.g. for LISTEN"""
+    url = get_database_url(PRIMARY)
+    if url is None:
+        raise RuntimeError(f"{DATABASE_URL_SECRETS[PRIMARY]} is not configured")
+    return await asyncpg.connect(url)
+
+
+async def close_pools() -> None:
+    for pool in set(_pools.values()):
+        await pool.close()
+    _pools.clear()
@@ -0,0 +1,63 @@
+"""User subscription entitlements (premium flag and limits), cached per worker.
+
+Entries expire after a minute so that subscriptions lapsing at `end_date` are
+picked up without a write, and payment writes evict them in every worker
+through the cache bus.
+
+Usage:
+
+    from app.libs.entitlements import get_user_subscription_info, invalidate_entitlements
+
+    sub_info = await get_user_subscription_info(conn, user.sub)
+    await invalidate_entitlements(conn, user.sub)
+"""
+
+from app.libs.cache import LocalCache
+from app.libs.cache_bus import cache_bus
+
+CACHE_NAME = "entitlements"
+
+entitlements_cache = LocalCache(CACHE_NAME, max_entries=10_000, ttl_seconds=60)
+
+
+async def get_user_subscription_info(conn, user_id: str) -> dict:
+    """Get user subscription status and limits"""
+    cached = entitlements_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+
+    query = """
+    SELECT
+        CASE WHEN status = 'active' AND end_date > NOW() THEN true ELSE false END as is_premium,
+        CASE WHEN status = 'active' AND end_date > NOW() THEN end_date END as premium_until,
+        COALESCE(daily_completion_limit, 5) as daily_completion_limit,
+        COALESCE(max_rivals, 1) as max_rivals
+    FROM user_subscriptions
+    WHERE user_id = $1
+    ORDER BY created_at DESC
+    LIMIT 1
+    """
+    result = await conn.fetchrow(query, user_id)
+
+    if result:
+        info = {
+            'is_premium': result['is_premium'],
+            'premium_until': result['premium_until'],
+            'daily_completion_limit': result['daily_completion_limit'],
+            'max_rivals': result['max_rivals']
+        }
+    else:
+        # Default for users without subscription record
+        info = {
+            'is_premium': False,
+            'premium_until': None,
+            'daily_completion_limit': 5,
+            'max_rivals': 1
+        }
+
+    entitlements_cache.set(user_id, info)
+    return dict(info)
+
+
+async def invalidate_entitlements(conn, user_id: str) -> None:
+    await cache_bus.invalidate(conn, CACHE_NAME, [user_id])
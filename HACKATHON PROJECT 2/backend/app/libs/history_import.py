@@ -0,0 +1,183 @@
+"""Bulk import of quests and dated completions from CSV or NDJSON.
+
+The upload is parsed incrementally, line by line, and validated in chunks.
+Each chunk first creates any quests it references by title that the user does
+not have yet. Its completions are then loaded into a temporary staging table
+with `COPY` (`copy_records_to_table`). When the whole upload is staged, the
+new completions are merged into `quest_checks` in one statement, skipping days
+that are already recorded (archived months included), after creating any
+monthly partitions the imported dates need.
+Everything runs inside the caller's transaction.
+
+Rows need a `title` and optionally a `date` (YYYY-MM-DD); other columns such as
+those of `/quests/export` are ignored. Dates must be before today, since today
+is tracked (and limited) through `/quests/complete-today`.
+
+Usage:
+
+    importer = HistoryImporter(conn, user.sub)
+    await importer.begin()
+    async for line in lines:
+        await importer.add_line(line)
+    await importer.finish()
+"""
+
+import codecs
+import csv
+import json
+from datetime import date
+
+from app.libs.partitions import ensure_partitions_for_range
+
+CHUNK_ROWS = 5000
+MAX_TITLE_LENGTH = 200
+MAX_REPORTED_REJECTS = 100
+EARLIEST_DATE = date(2000, 1, 1)
+
+
+async def iter_lines(chunks):
+    """Split a stream of byte chunks into decoded text lines"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    remainder = ""
+    async for chunk in chunks:
+        lines = (remainder + decoder.decode(chunk)).split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    remainder += decoder.decode(b"", final=True)
+    if remainder:
+        yield remainder.rstrip("\r")
+
+
+class HistoryImporter:
+    def __init__(self, conn, user_id: str, format: str = "csv"):
+        self.conn = conn
+        self.user_id = user_id
+        self.format = format
+        self.today = date.today()
+        self.line_number = 0
+        self.header: list[str] | None = None
+        self.quest_ids: dict[str, int] = {}
+        self.pending: list[tuple[str, date | None]] = []
+        self.affected_quest_ids: set[int] = set()
+        self.quests_created = 0
+        self.completions_staged = 0
+        self.completions_imported = 0
+        self.rows_rejected = 0
+        self.rejects: list[dict] = []
+
+    async def begin(self) -> None:
+        rows = await self.conn.fetch(
+            "SELECT id, title FROM quests WHERE user_id = $1 ORDER BY created_at ASC", self.user_id
+        )
+        for row in rows:
+            self.quest_ids.setdefault(row["title"], row["id"])
+        await self.conn.execute(
+            "CREATE TEMP TABLE import_quest_checks (quest_id INTEGER, date DATE) ON COMMIT DROP"
+        )
+
+    def reject(self, reason: str) -> None:
+        self.rows_rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({"line": self.line_number, "reason": reason})
+
+    def parse_line(self, line: str) -> dict | None:
+        if self.format == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                self.reject("Invalid JSON")
+                return None
+            if not isinstance(record, dict):
+                self.reject("Expected a JSON object")
+                return None
+            return record
+
+        values = next(csv.reader([line]))
+        if self.header is None:
+            self.header = [v.strip().lower() for v in values]
+            if "title" not in self.header:
+                raise ValueError("CSV header must include a 'title' column")
+            return None
+        return dict(zip(self.header, values))
+
+    async def add_line(self, line: str) -> None:
+        self.line_number += 1
+        if not line.strip():
+            return
+        record = self.parse_line(line)
+        if record is None:
+            return
+
+        title = str(record.get("title") or "").strip()
+        if not title:
+            self.reject("Missing title")
+            return
+        if len(title) > MAX_TITLE_LENGTH:
+            self.reject(f"Title longer than {MAX_TITLE_LENGTH} characters")
+            return
+
+        day = None
+        raw_date = record.get("date")
+        if raw_date:
+            try:
+                day = date.fromisoformat(str(raw_date).strip())
+            except ValueError:
+                self.reject("Invalid date, expected YYYY-MM-DD")
+                return
+            if day >= self.today:
+                self.reject("Only days before today can be imported")
+                return
+            if day < EARLIEST_DATE:
+                self.reject(f"Dates before {EARLIEST_DATE.isoformat()} are not supported")
+                return
+
+        self.pending.append((title, day))
+        if len(self.pending) >= CHUNK_ROWS:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Create missing quests and stage the completions of the pending chunk"""
+        chunk, self.pending = self.pending, []
+        new_titles = list(dict.fromkeys(t for t, _ in chunk if t not in self.quest_ids))
+        if new_titles:
+            rows = await self.conn.fetch(
+                """
+                INSERT INTO quests (user_id, title)
+                SELECT $1, unnest($2::text[])
+                RETURNING id, title
+                """,
+                self.user_id,
+                new_titles,
+            )
+            for row in rows:
+                self.quest_ids[row["title"]] = row["id"]
+            self.quests_created += len(rows)
+
+        records = [(self.quest_ids[t], d) for t, d in chunk if d is not None]
+        if records:
+            await self.conn.copy_records_to_table(
+                "import_quest_checks", records=records, columns=["quest_id", "date"]
+            )
+            self.completions_staged += len(records)
+            self.affected_quest_ids.update(quest_id for quest_id, _ in records)
+
+    async def finish(self) -> None:
+        """Merge staged completions into quest_checks"""
+        await self.flush()
+        if not self.completions_staged:
+            return
+        first, last = await self.conn.fetchrow("SELECT MIN(date), MAX(date) FROM import_quest_checks")
+        await ensure_partitions_for_range(self.conn, first, last)
+        result = await self.conn.execute(
+            """
+            INSERT INTO quest_checks (quest_id, date)
+            SELECT DISTINCT s.quest_id, s.date
+            FROM import_quest_checks s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM quest_check_days qc
+                WHERE qc.quest_id = s.quest_id AND qc.date = s.date
+            )
+            """
+        )
+        self.completions_imported = int(result.split()[-1])
@@ -0,0 +1,273 @@
+"""Idempotency keys for mutating endpoints.
+
+A client sends the same `Idempotency-Key` header on every retry of one logical
+request. The first request with a key runs, and its response is stored for
+`IDEMPOTENCY_TTL_SECONDS` (default 24h). Retries with that key get the stored
+response back without running the handler again. A duplicate that arrives
+while the first is still running waits for it and then gets its response
+instead of racing it.
+
+Keys are scoped to the user and the endpoint. Reusing a key with a different
+request body is rejected with `IdempotencyConflict`. Failed requests (raised
+exceptions) are not stored, so a retry after an error runs again.
+
+`IDEMPOTENCY_BACKEND` picks where the responses live:
+
+- `memory` (default): dicts in this worker. Duplicates only find each other when
+  they reach the same worker.
+- `postgres`: rows in `idempotency_keys`, shared by all workers. The first
+  worker claims the key with an insert; the others poll the row until the
+  response is stored. The claim is renewed while its request runs, so a
+  slow request keeps its key; one left by a crashed worker lapses after
+  `LOCK_SECONDS`.
+
+Usage:
+
+    from app.libs.idempotency import idempotency
+
+    return await idempotency.run(
+        user.sub, "quests.create", idempotency_key, request.model_dump(mode="json"),
+        lambda: create_user_quest(request, user),
+    )
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Awaitable, Callable
+
+from app.libs.database import db_connection
+from app.libs.metrics import Counter
+
+BACKEND = os.environ.get("IDEMPOTENCY_BACKEND", "memory")
+TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+LOCK_SECONDS = 60
+POLL_SECONDS = 0.2
+PURGE_INTERVAL_SECONDS = 3600
+MAX_KEY_LENGTH = 255
+MAX_ENTRIES = 100_000
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    response JSONB,
+    locked_until TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, scope, key)
+)
+"""
+
+# Takes the key unless another request holds a live claim or a stored response
+CLAIM_SQL = """
+INSERT INTO idempotency_keys AS k (user_id, scope, key, fingerprint, locked_until, expires_at)
+VALUES ($1, $2, $3, $4, NOW() + make_interval(secs => $5), NOW() + make_interval(secs => $6))
+ON CONFLICT (user_id, scope, key) DO UPDATE SET
+    fingerprint = EXCLUDED.fingerprint,
+    response = NULL,
+    locked_until = EXCLUDED.locked_until,
+    expires_at = EXCLUDED.expires_at
+WHERE k.expires_at < NOW() OR (k.response IS NULL AND k.locked_until < NOW())
+RETURNING true
+"""
+
+REQUESTS = Counter("idempotent_requests_total", "Requests with an idempotency key by outcome")
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    response: Any
+    expires_at: float
+
+
+@dataclass
+class InFlight:
+    fingerprint: str
+    done: asyncio.Event
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def to_json(result: Any) -> Any:
+    """Pydantic responses become plain JSON so replays validate like a fresh response"""
+    return result.model_dump(mode="json") if hasattr(result, "model_dump") else result
+
+
+def reused_key() -> IdempotencyConflict:
+    return IdempotencyConflict("Idempotency-Key was already used with a different request", 422)
+
+
+class IdempotencyStore:
+    def __init__(self, shared: bool):
+        self.shared = shared
+        # Insertion order is expiry order, since every entry lives for TTL_SECONDS
+        self._responses: dict[tuple[str, str, str], StoredResponse] = {}
+        self._in_flight: dict[tuple[str, str, str], InFlight] = {}
+        self._schema_ready = False
+        self._next_purge = 0.0
+
+    def _remember(self, full_key: tuple[str, str, str], fp: str, response: Any) -> None:
+        now = monotonic()
+        self._responses.pop(full_key, None)
+        self._responses[full_key] = StoredResponse(fp, response, now + TTL_SECONDS)
+        while True:
+            oldest = next(iter(self._responses))
+            if self._responses[oldest].expires_at > now and len(self._responses) <= MAX_ENTRIES:
+                break
+            del self._responses[oldest]
+
+    def _lookup(self, full_key: tuple[str, str, str], fp: str):
+        entry = self._responses.get(full_key)
+        if entry is None or entry.expires_at <= monotonic():
+            return None
+        if entry.fingerprint != fp:
+            raise reused_key()
+        return entry
+
+    async def run(
+        self, user_id: str, scope: str, key: str | None, payload: Any, work: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run `work` once per key, returning the stored response to repeats of the request"""
+        if key is None:
+            return await work()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyConflict(f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters", 400)
+
+        full_key = (user_id, scope, key)
+        fp = fingerprint(payload)
+        while True:
+            entry = self._lookup(full_key, fp)
+            if entry is not None:
+                REQUESTS.inc(outcome="replayed")
+                return entry.response
+            pending = self._in_flight.get(full_key)
+            if pending is None:
+                break
+            if pending.fingerprint != fp:
+                raise reused_key()
+            await pending.done.wait()
+
+        in_flight = InFlight(fp, asyncio.Event())
+        self._in_flight[full_key] = in_flight
+        try:
+            if self.shared:
+                return await self._run_shared(full_key, fp, work)
+            result = await work()
+            self._remember(full_key, fp, to_json(result))
+            REQUESTS.inc(outcome="executed")
+            return result
+        finally:
+            del self._in_flight[full_key]
+            in_flight.done.set()
+
+    async def _ensure_schema(self, conn) -> None:
+        if not self._schema_ready:
+            await conn.execute(SCHEMA_SQL)
+            self._schema_ready = True
+
+    async def _purge_expired(self, conn) -> None:
+        if monotonic() < self._next_purge:
+            return
+        self._next_purge = monotonic() + PURGE_INTERVAL_SECONDS
+        await conn.execute("DELETE FROM idempotency_keys WHERE expires_at < NOW()")
+
+    async def _claim(self, full_key: tuple[str, str, str], fp: str) -> tuple[bool, Any]:
+        """Claim the key in Postgres, or read the response another worker stored for it"""
+        deadline = monotonic() + LOCK_SECONDS
+        while True:
+            async with db_connection() as conn:
+                await self._ensure_schema(conn)
+                await self._purge_expired(conn)
+                if await conn.fetchval(CLAIM_SQL, *full_key, fp, LOCK_SECONDS, TTL_SECONDS):
+                    return True, None
+                row = await conn.fetchrow(
+                    """
+                    SELECT fingerprint, response
+                    FROM idempotency_keys
+                    WHERE user_id = $1 AND scope = $2 AND key = $3
+                    """,
+                    *full_key,
+                )
+            # The row can vanish between the two statements when its request failed
+            if row is not None:
+                if row["fingerprint"] != fp:
+                    raise reused_key()
+                if row["response"] is not None:
+                    return False, json.loads(row["response"])
+            if monotonic() > deadline:
+                raise IdempotencyConflict("A request with this Idempotency-Key is still being processed", 409)
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def _renew_claim(self, full_key: tuple[str, str, str], fp: str) -> None:
+        """Push the claim's expiry forward while its request runs, so no other worker retakes the key"""
+        while True:
+            await asyncio.sleep(LOCK_SECONDS / 3)
+            try:
+                async with db_connection() as conn:
+                    await conn.execute(
+                        """
+                        UPDATE idempotency_keys
+                        SET locked_until = NOW() + make_interval(secs => $5)
+                        WHERE user_id = $1 AND scope = $2 AND key = $3
+                          AND fingerprint = $4 AND response IS NULL
+                        """,
+                        *full_key,
+                        fp,
+                        LOCK_SECONDS,
+                    )
+            except Exception as e:
+                # Try again on the next round, the claim is still good for a while
+                print(f"Failed to renew idempotency claim: {e}")
+
+    async def _run_shared(self, full_key: tuple[str, str, str], fp: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        claimed, response = await self._claim(full_key, fp)
+        if not claimed:
+            self._remember(full_key, fp, response)
+            REQUESTS.inc(outcome="replayed")
+            return response
+
+        renewal = asyncio.create_task(self._renew_claim(full_key, fp))
+        try:
+            result = await work()
+        except BaseException:
+            async with db_connection() as conn:
+                await conn.execute(
+                    "DELETE FROM idempotency_keys WHERE user_id = $1 AND scope = $2 AND key = $3",
+                    *full_key,
+                )
+            raise
+        finally:
+            renewal.cancel()
+
+        response = to_json(result)
+        async with db_connection() as conn:
+            await conn.execute(
+                """
+                UPDATE idempotency_keys
+                SET response = $4
+                WHERE user_id = $1 AND scope = $2 AND key = $3
+                """,
+                *full_key,
+                json.dumps(response),
+            )
+        self._remember(full_key, fp, response)
+        REQUESTS.inc(outcome="executed")
+        return result
+
+
+idempotency = IdempotencyStore(shared=BACKEND == "postgres")
@@ -0,0 +1,254 @@
+"""In-memory top-K index of the best current quest streaks.
+
+The leaderboard is updated incrementally: a completion pushes the new streak
+of its quest (from the outbox task it enqueues), deleting a quest drops it, and the nightly rollover drops
+every quest that was not completed yesterday or today (its streak is broken).
+The index is checkpointed to the `streak_leaderboard` table periodically and
+reloaded from it on startup. While that table is empty (the first start), the
+index is seeded from the completed days of every quest instead. When several
+workers run, each change is also broadcast over Postgres NOTIFY so every
+worker's index stays the same; only the worker that made a change checkpoints
+it.
+
+Usage:
+
+    from app.libs.leaderboard import leaderboard
+
+    leaderboard.update(quest_id, user_id, title, streak, date.today())
+    await leaderboard.broadcast(conn, quest_id)
+    top = leaderboard.top(10)
+"""
+
+import asyncio
+import json
+from bisect import bisect_left, insort
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+
+from app.libs.database import connect_direct, db_connection
+from app.libs.partitions import ensure_schema as ensure_archive_schema
+from app.libs.pg_listener import WORKER_ID, pg_listener
+
+CHECKPOINT_INTERVAL_SECONDS = 30
+CHANNEL = "leaderboard_updates"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS streak_leaderboard (
+    quest_id INTEGER PRIMARY KEY REFERENCES quests(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    streak INTEGER NOT NULL,
+    last_completed DATE NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+
+# Current streak of every quest completed today or yesterday: consecutive days
+# share the same date + (position counting back from the latest day)
+SEED_SQL = """
+WITH days AS (
+    SELECT DISTINCT c.quest_id, c.date
+    FROM quest_check_days c
+    WHERE c.date <= $1
+      AND c.quest_id IN (SELECT quest_id FROM quest_check_days WHERE date BETWEEN $1::date - 1 AND $1)
+),
+runs AS (
+    SELECT quest_id, date,
+           date + (ROW_NUMBER() OVER (PARTITION BY quest_id ORDER BY date DESC))::int AS run,
+           MAX(date) OVER (PARTITION BY quest_id) + 1 AS latest_run
+    FROM days
+)
+SELECT q.id AS quest_id, q.user_id, q.title, COUNT(*)::int AS streak, MAX(r.date) AS last_completed
+FROM runs r
+JOIN quests q ON q.id = r.quest_id
+WHERE r.run = r.latest_run
+GROUP BY q.id, q.user_id, q.title
+"""
+
+
+@dataclass
+class LeaderboardEntry:
+    quest_id: int
+    user_id: str
+    title: str
+    streak: int
+    last_completed: date
+
+
+class StreakLeaderboard:
+    """Quests with a live streak, kept sorted by streak (desc) then quest id"""
+
+    def __init__(self):
+        self._entries: dict[int, LeaderboardEntry] = {}
+        self._order: list[tuple[int, int]] = []
+        self._dirty: set[int] = set()
+        self._removed: set[int] = set()
+        self._rolled_over_on: date | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _unlink(self, quest_id: int) -> LeaderboardEntry | None:
+        entry = self._entries.pop(quest_id, None)
+        if entry is not None:
+            key = (-entry.streak, quest_id)
+            del self._order[bisect_left(self._order, key)]
+        return entry
+
+    def _link(self, entry: LeaderboardEntry) -> None:
+        self._unlink(entry.quest_id)
+        self._entries[entry.quest_id] = entry
+        insort(self._order, (-entry.streak, entry.quest_id))
+
+    def update(self, quest_id: int, user_id: str, title: str, streak: int, last_completed: date) -> None:
+        """Record the current streak of a quest"""
+        if streak <= 0:
+            self.remove(quest_id)
+            return
+        self._link(LeaderboardEntry(quest_id, user_id, title, streak, last_completed))
+        self._dirty.add(quest_id)
+        self._removed.discard(quest_id)
+
+    def remove(self, quest_id: int) -> None:
+        self._unlink(quest_id)
+        self._dirty.discard(quest_id)
+        self._removed.add(quest_id)
+
+    def top(self, k: int) -> list[LeaderboardEntry]:
+        return [self._entries[quest_id] for _, quest_id in self._order[:k]]
+
+    def rollover(self, today: date) -> int:
+        """Drop streaks that were not extended yesterday or today, return how many broke"""
+        cutoff = today - timedelta(days=1)
+        broken = [e.quest_id for e in self._entries.values() if e.last_completed < cutoff]
+        for quest_id in broken:
+            self.remove(quest_id)
+        self._rolled_over_on = today
+        return len(broken)
+
+    async def broadcast(self, conn, quest_id: int) -> None:
+        """Send the quest's current entry (or its removal) to the other workers"""
+        entry = self._entries.get(quest_id)
+        payload = {
+            "origin": WORKER_ID,
+            "quest_id": quest_id,
+            "entry": asdict(entry) if entry is not None else None,
+        }
+        try:
+            await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, json.dumps(payload, default=str))
+        except Exception as e:
+            print(f"Failed to broadcast leaderboard update: {e}")
+
+    def on_notification(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message["origin"] == WORKER_ID:
+            return
+        entry = message["entry"]
+        if entry is None:
+            self._unlink(message["quest_id"])
+        else:
+            entry["last_completed"] = date.fromisoformat(entry["last_completed"])
+            self._link(LeaderboardEntry(**entry))
+
+    async def load(self, conn, today: date | None = None) -> None:
+        """Rebuild the index from the last checkpoint, or from the completed days when there is none"""
+        await conn.execute(SCHEMA_SQL)
+        rows = await conn.fetch(
+            "SELECT quest_id, user_id, title, streak, last_completed FROM streak_leaderboard"
+        )
+        seeded = not rows
+        if seeded:
+            # The seed reads the quest_check_days view, which may not exist yet on a first deploy
+            await ensure_archive_schema(conn)
+            rows = await conn.fetch(SEED_SQL, today or date.today())
+        self._entries = {
+            row["quest_id"]: LeaderboardEntry(
+                row["quest_id"], row["user_id"], row["title"], row["streak"], row["last_completed"]
+            )
+            for row in rows
+        }
+        self._order = sorted((-e.streak, e.quest_id) for e in self._entries.values())
+        self._dirty.clear()
+        self._removed.clear()
+        if seeded and self._entries:
+            print(f"Leaderboard seeded with {len(self)} streaks")
+            self._dirty.update(self._entries)
+            await self.checkpoint(conn)
+
+    async def checkpoint(self, conn) -> None:
+        """Write entries changed since the last checkpoint"""
+        dirty = [self._entries[q] for q in self._dirty if q in self._entries]
+        removed = list(self._removed)
+        self._dirty.clear()
+        self._removed.clear()
+        try:
+            async with conn.transaction():
+                if dirty:
+                    await conn.executemany(
+                        """
+                        INSERT INTO streak_leaderboard (quest_id, user_id, title, streak, last_completed)
+                        SELECT $1, $2, $3, $4, $5
+                        WHERE EXISTS (SELECT 1 FROM quests WHERE id = $1)
+                        ON CONFLICT (quest_id)
+                        DO UPDATE SET
+                            title = EXCLUDED.title,
+                            streak = EXCLUDED.streak,
+                            last_completed = EXCLUDED.last_completed,
+                            updated_at = NOW()
+                        """,
+                        [(e.quest_id, e.user_id, e.title, e.streak, e.last_completed) for e in dirty],
+                    )
+                if removed:
+                    await conn.execute(
+                        "DELETE FROM streak_leaderboard WHERE quest_id = ANY($1::int[])", removed
+                    )
+        except Exception:
+            # Keep the changes for the next attempt
+            self._dirty.update(e.quest_id for e in dirty)
+            self._removed.update(removed)
+            raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL_SECONDS)
+            if self._rolled_over_on != date.today():
+                broken = self.rollover(date.today())
+                print(f"Leaderboard rollover: {broken} streaks broken")
+            if not self._dirty and not self._removed:
+                continue
+            try:
+                async with db_connection() as conn:
+                    await self.checkpoint(conn)
+            except Exception as e:
+                print(f"Leaderboard checkpoint failed: {e}")
+
+    async def start(self) -> None:
+        """Load the last checkpoint and start the checkpoint/rollover loop"""
+        pg_listener.add_listener(CHANNEL, self.on_notification)
+        await pg_listener.start(connect_direct)
+        try:
+            async with db_connection() as conn:
+                await self.load(conn)
+            self.rollover(date.today())
+            print(f"Leaderboard loaded with {len(self)} streaks")
+        except Exception as e:
+            print(f"Leaderboard load failed: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the loop and write a final checkpoint"""
+        await pg_listener.stop()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._dirty or self._removed:
+            try:
+                async with db_connection() as conn:
+                    await self.checkpoint(conn)
+            except Exception as e:
+                print(f"Final leaderboard checkpoint failed: {e}")
+
+
+leaderboard = StreakLeaderboard()
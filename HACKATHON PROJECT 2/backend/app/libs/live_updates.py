@@ -0,0 +1,101 @@
+"""Live change events for connected clients, delivered through Postgres NOTIFY.
+
+Writers call `publish` on the connection doing the write, so the event is sent
+when that write commits. Every worker receives it on its shared listener
+connection and fans it out in-process to the subscribers of that user.
+
+Each subscriber has a bounded queue. When a slow client lets it fill up, the
+oldest event is dropped and the client gets a `resync` event telling it to
+refetch; a client that keeps overflowing is disconnected.
+
+Usage:
+
+    from app.libs.live_updates import publish
+
+    await publish(conn, user.sub, "quest.created", quest.model_dump(mode="json"))
+"""
+
+import asyncio
+import json
+
+from app.libs.metrics import Counter, Gauge
+
+CHANNEL = "live_updates"
+SUBSCRIBER_QUEUE_SIZE = 100
+MAX_OVERFLOWS = 3
+MAX_PAYLOAD_BYTES = 7900  # NOTIFY payloads must stay under 8000 bytes
+
+SUBSCRIBERS = Gauge("live_subscribers", "Connected live-update subscribers in this worker")
+DROPPED = Counter("live_events_dropped_total", "Live events dropped for slow subscribers")
+
+
+def encode_event(user_id: str, event_type: str, data: dict | None = None) -> str:
+    payload = json.dumps({"user_id": user_id, "type": event_type, "data": data}, default=str)
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+        # Too large for NOTIFY: clients refetch on an event without data
+        payload = json.dumps({"user_id": user_id, "type": event_type, "data": None})
+    return payload
+
+
+async def publish(conn, user_id: str, event_type: str, data: dict | None = None) -> None:
+    """Send a change event to every connected client of the user"""
+    payload = encode_event(user_id, event_type, data)
+    try:
+        await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+    except Exception as e:
+        print(f"Failed to publish live event {event_type}: {e}")
+
+
+class Subscriber:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflows = 0
+        self.closed = asyncio.Event()
+
+    def deliver(self, event: dict) -> None:
+        if self.closed.is_set():
+            return
+        if self.queue.full():
+            self.overflows += 1
+            DROPPED.inc()
+            if self.overflows > MAX_OVERFLOWS:
+                self.closed.set()
+                return
+            # Replace everything queued with a single resync marker
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "data": None})
+            return
+        self.queue.put_nowait(event)
+
+
+class LiveHub:
+    def __init__(self):
+        self._subscribers: dict[str, set[Subscriber]] = {}
+
+    def subscribe(self, user_id: str) -> Subscriber:
+        subscriber = Subscriber(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        SUBSCRIBERS.set(sum(len(s) for s in self._subscribers.values()))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+        SUBSCRIBERS.set(sum(len(s) for s in self._subscribers.values()))
+
+    def on_notification(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except json.JSONDecodeError:
+            print(f"Ignoring malformed live event: {payload[:100]}")
+            return
+        for subscriber in list(self._subscribers.get(event.get("user_id"), ())):
+            subscriber.deliver({"type": event.get("type"), "data": event.get("data")})
+
+
+live_hub = LiveHub()
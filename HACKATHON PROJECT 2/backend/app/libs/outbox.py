@@ -0,0 +1,234 @@
+"""Transactional outbox for side effects that should not run on the request path.
+
+Routers enqueue typed tasks with the connection that makes the main change, so
+a task is stored if and only if that transaction commits. The task runner,
+started in the app lifespan, claims due tasks with `FOR UPDATE SKIP LOCKED`
+and runs up to `OUTBOX_CONCURRENCY` of them at a time (default 4), each on its
+own pooled connection. A finished task is deleted. A failed one is retried
+with exponential backoff; after `MAX_ATTEMPTS` it is kept as `dead` for
+inspection. Claims hold a lease, so the tasks of a worker that dies are picked
+up again once it expires. Enqueuing sends a NOTIFY so idle runners wake up on
+commit instead of waiting for the next poll.
+
+A handler's database writes commit together with the task's deletion. Effects
+outside the database (broadcasts, HTTP calls) must tolerate a task running more
+than once.
+
+Usage:
+
+    from app.libs.outbox import OutboxTask, enqueue, task_handler
+
+    class RecomputeStreaks(OutboxTask):
+        task_type: ClassVar[str] = "quests.recompute_streaks"
+        quest_ids: list[int]
+
+    @task_handler(RecomputeStreaks)
+    async def recompute_streaks(conn, task: RecomputeStreaks) -> None:
+        ...
+
+    async with conn.transaction():
+        ...
+        await enqueue(conn, RecomputeStreaks(quest_ids=[1, 2]))
+"""
+
+import asyncio
+import os
+import random
+from typing import Awaitable, Callable, ClassVar
+
+from pydantic import BaseModel
+
+from app.libs.database import connect_direct, db_connection
+from app.libs.metrics import Counter
+from app.libs.pg_listener import pg_listener
+
+CHANNEL = "outbox"
+CONCURRENCY = int(os.environ.get("OUTBOX_CONCURRENCY", "4"))
+POLL_INTERVAL_SECONDS = 5
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 600
+STOP_GRACE_SECONDS = 10
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS outbox_tasks (
+    id BIGSERIAL PRIMARY KEY,
+    task_type TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS outbox_tasks_due_idx ON outbox_tasks (run_after) WHERE status = 'pending';
+"""
+
+TASKS = Counter("outbox_tasks_total", "Outbox tasks run by type and outcome")
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the outbox table on first use"""
+    global _schema_ready
+    if not _schema_ready:
+        await conn.execute(SCHEMA_SQL)
+        # Inside the caller's transaction the table only exists once that commits
+        _schema_ready = not conn.is_in_transaction()
+
+
+class OutboxTask(BaseModel):
+    """Base class of task payloads; subclasses set `task_type`"""
+
+    task_type: ClassVar[str]
+
+
+_handlers: dict[str, tuple[type[OutboxTask], Callable[..., Awaitable[None]]]] = {}
+
+
+def task_handler(task_class: type[OutboxTask]):
+    """Register `handler(conn, task)` as the runner of a task type"""
+    def register(handler):
+        _handlers[task_class.task_type] = (task_class, handler)
+        return handler
+    return register
+
+
+async def enqueue(conn, task: OutboxTask, delay_seconds: float = 0) -> None:
+    """Store a task in the caller's transaction; it runs after that transaction commits"""
+    if task.task_type not in _handlers:
+        raise ValueError(f"No handler registered for task type {task.task_type}")
+    await ensure_schema(conn)
+    await conn.execute(
+        """
+        INSERT INTO outbox_tasks (task_type, payload, run_after)
+        VALUES ($1, $2::jsonb, NOW() + make_interval(secs => $3))
+        """,
+        task.task_type,
+        task.model_dump_json(),
+        float(delay_seconds),
+    )
+    await conn.execute("SELECT pg_notify($1, '')", CHANNEL)
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1)
+
+
+class TaskRunner:
+    def __init__(self, concurrency: int = CONCURRENCY):
+        self.concurrency = concurrency
+        self._wakeup = asyncio.Event()
+        self._running: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+        self._registered = False
+
+    def wake(self, _payload: str = "") -> None:
+        self._wakeup.set()
+
+    async def claim(self, conn, limit: int) -> list:
+        """Lease up to `limit` due tasks to this runner"""
+        await ensure_schema(conn)
+        return await conn.fetch(
+            """
+            UPDATE outbox_tasks
+            SET attempts = attempts + 1,
+                run_after = NOW() + make_interval(secs => $2)
+            WHERE id IN (
+                SELECT id FROM outbox_tasks
+                WHERE status = 'pending' AND run_after <= NOW()
+                ORDER BY run_after
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, task_type, payload, attempts
+            """,
+            limit,
+            float(LEASE_SECONDS),
+        )
+
+    async def execute(self, row) -> None:
+        task_type = row["task_type"]
+        try:
+            if task_type not in _handlers:
+                raise LookupError(f"No handler registered for task type {task_type}")
+            task_class, handler = _handlers[task_type]
+            task = task_class.model_validate_json(row["payload"])
+            async with db_connection() as conn:
+                async with conn.transaction():
+                    await handler(conn, task)
+                    await conn.execute("DELETE FROM outbox_tasks WHERE id = $1", row["id"])
+            TASKS.inc(task_type=task_type, outcome="done")
+        except Exception as e:
+            dead = row["attempts"] >= MAX_ATTEMPTS
+            print(f"Outbox task {row['id']} ({task_type}) failed on attempt {row['attempts']}: {e}")
+            TASKS.inc(task_type=task_type, outcome="dead" if dead else "retry")
+            try:
+                async with db_connection() as conn:
+                    await conn.execute(
+                        """
+                        UPDATE outbox_tasks
+                        SET status = $2,
+                            last_error = $3,
+                            run_after = NOW() + make_interval(secs => $4)
+                        WHERE id = $1
+                        """,
+                        row["id"],
+                        "dead" if dead else "pending",
+                        str(e)[:1000],
+                        backoff_seconds(row["attempts"]),
+                    )
+            except Exception as e:
+                # The lease runs out and the task is retried then
+                print(f"Failed to record outbox task {row['id']} failure: {e}")
+
+    def _spawn(self, row) -> None:
+        task = asyncio.create_task(self.execute(row))
+        self._running.add(task)
+
+        def done(t):
+            self._running.discard(t)
+            self.wake()
+
+        task.add_done_callback(done)
+
+    async def _run(self) -> None:
+        while True:
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                try:
+                    async with db_connection() as conn:
+                        rows = await self.claim(conn, free)
+                    for row in rows:
+                        self._spawn(row)
+                except Exception as e:
+                    print(f"Outbox claim failed: {e}")
+            # Woken by new tasks (NOTIFY) and by finished ones freeing a slot
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self) -> None:
+        """Start claiming and running tasks; pair with stop()"""
+        if not self._registered:
+            pg_listener.add_listener(CHANNEL, self.wake)
+            self._registered = True
+        await pg_listener.start(connect_direct)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop claiming and give running tasks a moment to finish"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._running:
+            await asyncio.wait(self._running, timeout=STOP_GRACE_SECONDS)
+        await pg_listener.stop()
+
+
+task_runner = TaskRunner()
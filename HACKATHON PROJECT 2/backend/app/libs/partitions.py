@@ -0,0 +1,336 @@
+"""Monthly range partitioning and archival of quest_checks and daily_completions.
+
+`migrate` converts both tables, once, into tables partitioned by month on
+`date`, copying the existing rows. Lookups bounded to a day, such as today's
+check of a quest or today's completion count, then only touch one partition.
+After that, the maintenance loop creates the partitions for the next
+`MONTHS_AHEAD` months every day, so inserts always have a partition to land
+in.
+
+When `PARTITION_ARCHIVE_AFTER_MONTHS` is set, the loop also archives whole
+months older than that. The months are compacted into summary rows and their
+partitions are dropped:
+
+- `quest_check_summaries`: one row per quest and month, with a bitmask of the
+  completed days. The `quest_check_days` view unions it with `quest_checks`,
+  and everything that reads a quest's full history (bitmap rebuilds, export,
+  import de-duplication) reads the view, so streaks come out the same.
+- `daily_completion_summaries`: completions and active days per user and month.
+
+Run the one-time conversion with `make migrate-partitions` (or
+`python -m app.libs.partitions migrate`). Until then the maintenance loop
+leaves the plain tables alone.
+"""
+
+import asyncio
+import os
+import sys
+from datetime import date
+
+from app.libs.database import db_connection
+
+MONTHS_AHEAD = 3
+MAINTENANCE_INTERVAL_SECONDS = 24 * 60 * 60
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("PARTITION_ARCHIVE_AFTER_MONTHS", "0"))
+
+PARTITIONED_TABLES = ["quest_checks", "daily_completions"]
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS quest_check_summaries (
+    quest_id INTEGER NOT NULL REFERENCES quests(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    days INTEGER NOT NULL,
+    PRIMARY KEY (quest_id, month)
+);
+CREATE TABLE IF NOT EXISTS daily_completion_summaries (
+    user_id TEXT NOT NULL,
+    month DATE NOT NULL,
+    completions INTEGER NOT NULL,
+    active_days INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month)
+);
+CREATE OR REPLACE VIEW quest_check_days AS
+SELECT quest_id, date, created_at FROM quest_checks
+UNION ALL
+SELECT s.quest_id, s.month + d.i AS date, NULL::timestamptz AS created_at
+FROM quest_check_summaries s
+CROSS JOIN generate_series(0, 30) AS d(i)
+WHERE s.days & (1 << d.i) <> 0;
+"""
+
+# Constraints of the partitioned tables; unique keys must include the partition key
+PARTITIONED_CONSTRAINTS = {
+    "quest_checks": [
+        "UNIQUE (quest_id, date)",
+        "FOREIGN KEY (quest_id) REFERENCES quests(id) ON DELETE CASCADE",
+    ],
+    "daily_completions": [
+        "UNIQUE (user_id, date)",
+    ],
+}
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the summary tables and the quest_check_days view.
+
+    Runs at startup (a readiness step of the quests router) and before
+    maintenance, not on the request path.
+    """
+    global _schema_ready
+    if not _schema_ready:
+        async with conn.transaction():
+            # Workers starting together would otherwise replace the view at the same time
+            # and fail with "tuple concurrently updated"
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('partition_schema'))")
+            await conn.execute(SCHEMA_SQL)
+        _schema_ready = not conn.is_in_transaction()
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    return await conn.fetchval(
+        """
+        SELECT EXISTS(
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = $1 AND pg_table_is_visible(c.oid)
+        )
+        """,
+        table,
+    )
+
+
+async def ensure_partitions(conn, table: str, first: date, last: date) -> None:
+    """Create the monthly partitions covering first..last (inclusive) that do not exist yet"""
+    month = month_start(first)
+    while month <= last:
+        end = add_months(month, 1)
+        await conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(table, month)}
+            PARTITION OF {table} FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')
+            """
+        )
+        month = end
+
+
+async def ensure_partitions_for_range(conn, first: date | None, last: date | None) -> None:
+    """Make sure quest_checks can take rows dated first..last, e.g. before a bulk import"""
+    if first is None or not await is_partitioned(conn, "quest_checks"):
+        return
+    await ensure_partitions(conn, "quest_checks", first, last)
+
+
+async def migrate_table(conn, table: str) -> None:
+    """Swap a plain table for a monthly partitioned copy with the same rows"""
+    legacy = f"{table}_unpartitioned"
+    today = date.today()
+    async with conn.transaction():
+        await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        await conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        await conn.execute(
+            f"""
+            CREATE TABLE {table} (
+                LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED
+            ) PARTITION BY RANGE (date)
+            """
+        )
+        for constraint in PARTITIONED_CONSTRAINTS[table]:
+            await conn.execute(f"ALTER TABLE {table} ADD {constraint}")
+
+        first = await conn.fetchval(f"SELECT MIN(date) FROM {legacy}") or today
+        await ensure_partitions(conn, table, first, add_months(month_start(today), MONTHS_AHEAD))
+        await conn.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+
+        has_id = await conn.fetchval(
+            """
+            SELECT EXISTS(
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = $1 AND column_name = 'id' AND table_schema = current_schema()
+            )
+            """,
+            table,
+        )
+        if has_id:
+            await conn.execute(f"CREATE INDEX ON {table} (id)")
+            sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", table)
+            if sequence is not None:
+                # Identity column: continue after the copied ids
+                await conn.execute(
+                    f"SELECT setval($1, (SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)",
+                    sequence,
+                )
+            else:
+                # Serial column: keep using its sequence once the legacy table is dropped
+                sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", legacy)
+                if sequence is not None:
+                    await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+        await conn.execute(f"DROP TABLE {legacy}")
+
+
+async def migrate(conn) -> list[str]:
+    """Partition every table that is not partitioned yet, return the ones converted"""
+    migrated = []
+    for table in PARTITIONED_TABLES:
+        if not await is_partitioned(conn, table):
+            await migrate_table(conn, table)
+            migrated.append(table)
+    await ensure_schema(conn)
+    return migrated
+
+
+async def list_partitions(conn, table: str) -> list[tuple[str, date]]:
+    """(name, month) of each monthly partition of a table, oldest first"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = $1
+        ORDER BY c.relname
+        """,
+        table,
+    )
+    partitions = []
+    prefix = f"{table}_y"
+    for row in rows:
+        name = row["relname"]
+        if name.startswith(prefix):
+            suffix = name[len(prefix):]
+            partitions.append((name, date(int(suffix[:4]), int(suffix[5:7]), 1)))
+    return partitions
+
+
+async def archive_quest_checks_partition(conn, name: str) -> None:
+    await conn.execute(
+        f"""
+        INSERT INTO quest_check_summaries (quest_id, month, days)
+        SELECT quest_id,
+               date_trunc('month', date)::date,
+               bit_or(1 << (extract(day FROM date)::int - 1))
+        FROM {name}
+        GROUP BY 1, 2
+        ON CONFLICT (quest_id, month)
+        DO UPDATE SET days = quest_check_summaries.days | EXCLUDED.days
+        """
+    )
+
+
+async def archive_daily_completions_partition(conn, name: str) -> None:
+    await conn.execute(
+        f"""
+        INSERT INTO daily_completion_summaries (user_id, month, completions, active_days)
+        SELECT user_id,
+               date_trunc('month', date)::date,
+               SUM(completion_count),
+               COUNT(*)
+        FROM {name}
+        GROUP BY 1, 2
+        ON CONFLICT (user_id, month)
+        DO UPDATE SET
+            completions = daily_completion_summaries.completions + EXCLUDED.completions,
+            active_days = daily_completion_summaries.active_days + EXCLUDED.active_days
+        """
+    )
+
+
+ARCHIVERS = {
+    "quest_checks": archive_quest_checks_partition,
+    "daily_completions": archive_daily_completions_partition,
+}
+
+
+async def archive(conn, before: date) -> list[str]:
+    """Compact and drop the monthly partitions that end on or before `before`"""
+    archived = []
+    for table in PARTITIONED_TABLES:
+        if not await is_partitioned(conn, table):
+            continue
+        for name, month in await list_partitions(conn, table):
+            if add_months(month, 1) > before:
+                break
+            async with conn.transaction():
+                # One worker per partition; one that waited finds it already archived
+                await conn.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext('partition_archive'), hashtext($1))", name
+                )
+                if await conn.fetchval("SELECT to_regclass($1)", name) is None:
+                    continue
+                await ARCHIVERS[table](conn, name)
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                await conn.execute(f"DROP TABLE {name}")
+            archived.append(name)
+    return archived
+
+
+async def maintain(conn, today: date | None = None) -> None:
+    """Create upcoming partitions and archive old months when enabled"""
+    if today is None:
+        today = date.today()
+    await ensure_schema(conn)
+    async with conn.transaction():
+        # One worker at a time; archive() takes its own lock per partition
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('partition_maintenance'))")
+        for table in PARTITIONED_TABLES:
+            if await is_partitioned(conn, table):
+                await ensure_partitions(conn, table, today, add_months(month_start(today), MONTHS_AHEAD))
+    if ARCHIVE_AFTER_MONTHS > 0:
+        archived = await archive(conn, add_months(month_start(today), -ARCHIVE_AFTER_MONTHS))
+        if archived:
+            print(f"Archived partitions: {', '.join(archived)}")
+
+
+class PartitionMaintainer:
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with db_connection() as conn:
+                    await maintain(conn)
+            except Exception as e:
+                print(f"Partition maintenance failed: {e}")
+            await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+partition_maintainer = PartitionMaintainer()
+
+
+async def main(command: str) -> None:
+    async with db_connection() as conn:
+        if command == "migrate":
+            migrated = await migrate(conn)
+            print(f"Partitioned: {', '.join(migrated) or 'nothing to do'}")
+        elif command == "maintain":
+            await maintain(conn)
+        else:
+            raise SystemExit(f"Unknown command {command}, expected migrate or maintain")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "maintain"))
@@ -0,0 +1,128 @@
+"""Micro-batching of rival persona generations.
+
+Persona requests arriving within `PERSONA_BATCH_WINDOW_MS` of each other (up to
+`PERSONA_BATCH_MAX_SIZE` of them) are sent to the LLM as one structured prompt
+asking for N personas. The results are handed back to the waiting callers in
+order. If the batched response cannot be parsed, or an entry in it is invalid,
+the affected requests fall back to individual calls. A window of 0 disables
+batching.
+
+A batch runs under the latest deadline of its requests (none if one of them
+has none), so one impatient request cannot cut the batch short for the
+others. Each caller still stops waiting at its own deadline.
+
+Usage:
+
+    from app.libs.persona_batcher import PersonaBatcher
+
+    batcher = PersonaBatcher(generate_batch, generate_one)
+    persona = await batcher.submit(request)
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from app.libs.metrics import Counter
+from app.libs.resilience import remaining_seconds, set_deadline
+
+BATCHES = Counter("persona_batches_total", "Persona generation batches sent to the LLM by outcome")
+
+
+class PersonaBatcher:
+    def __init__(
+        self,
+        generate_batch: Callable[[list[Any]], list[dict | None]],
+        generate_one: Callable[[Any], dict],
+        window_seconds: float | None = None,
+        max_size: int | None = None,
+        call: Callable[..., Awaitable[Any]] | None = None,
+    ):
+        """`generate_batch` and `generate_one` are blocking and run in worker threads.
+
+        `generate_batch` returns one persona per request, None for entries it could not
+        produce, and raises if the whole response is unusable. `call` runs them, e.g.
+        `Upstream.call` to go through a circuit breaker; it defaults to `asyncio.to_thread`.
+        """
+        self.generate_batch = generate_batch
+        self.generate_one = generate_one
+        self.call = call or asyncio.to_thread
+        self.window_seconds = (
+            window_seconds
+            if window_seconds is not None
+            else int(os.environ.get("PERSONA_BATCH_WINDOW_MS", "50")) / 1000
+        )
+        self.max_size = max_size or int(os.environ.get("PERSONA_BATCH_MAX_SIZE", "8"))
+        # (request, future, monotonic deadline or None)
+        self._pending: list[tuple[Any, asyncio.Future, float | None]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # The loop only keeps weak references to tasks, so running batches are held here
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, request: Any) -> dict:
+        """Wait for the persona of one request, raises if it could not be generated"""
+        if self.window_seconds <= 0 or self.max_size <= 1:
+            return await self.call(self.generate_one, request)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        remaining = remaining_seconds()
+        deadline = None if remaining is None else time.monotonic() + remaining
+        self._pending.append((request, future, deadline))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+
+        if remaining is None:
+            return await future
+        # Cancels the future on timeout; the batch then skips it
+        return await asyncio.wait_for(future, max(remaining, 0))
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[Any, asyncio.Future, float | None]]) -> None:
+        # The task has its own copy of the context of whichever request started it
+        deadlines = [deadline for _, _, deadline in batch]
+        set_deadline(None if None in deadlines else max(deadlines) - time.monotonic())
+
+        requests = [request for request, _, _ in batch]
+        results: list[dict | None] = [None] * len(batch)
+
+        if len(batch) > 1:
+            try:
+                results = await self.call(self.generate_batch, requests)
+                if len(results) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} personas, got {len(results)}")
+                BATCHES.inc(outcome="ok" if all(results) else "partial")
+            except Exception as e:
+                print(f"Batched persona generation failed, falling back to single calls: {e}")
+                BATCHES.inc(outcome="failed")
+                results = [None] * len(batch)
+
+        async def resolve(index: int) -> None:
+            _, future, _ = batch[index]
+            if future.done():
+                # Its caller gave up at its deadline
+                return
+            try:
+                persona = results[index]
+                if persona is None:
+                    persona = await self.call(self.generate_one, requests[index])
+                if not future.done():
+                    future.set_result(persona)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+        await asyncio.gather(*(resolve(i) for i in range(len(batch))))
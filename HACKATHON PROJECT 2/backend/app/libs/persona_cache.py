@@ -0,0 +1,127 @@
+"""Content-addressed cache of LLM rival persona generations.
+
+Entries are keyed by a SHA-256 of the rendered chat messages and the model
+parameters, so two requests share an entry only when they would send the exact
+same completion request. The in-memory tier is a size-bounded LRU; when
+`PERSONA_CACHE_PERSISTENT=true` misses fall through to the
+`rival_persona_cache` table, which survives restarts and is shared by workers.
+
+`PERSONA_CACHE_REUSE_RATE` (0..1, default 0.9) is the probability that a
+request may be answered from the cache at all. Requests that skip the cache
+generate a fresh persona and replace the stored one, which keeps some variety
+in rivals generated from the same prompt.
+
+Usage:
+
+    from app.libs.persona_cache import persona_cache
+
+    key = persona_cache.key(messages, model="gpt-4o-mini", temperature=0.8)
+    persona = await persona_cache.get(conn, key)
+"""
+
+import hashlib
+import json
+import os
+import random
+from collections import OrderedDict
+
+from app.libs.metrics import Counter, Gauge
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rival_persona_cache (
+    prompt_hash TEXT PRIMARY KEY,
+    persona JSONB NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+LOOKUPS = Counter("persona_cache_lookups_total", "Rival persona cache lookups by result")
+ENTRIES = Gauge("persona_cache_entries", "Rival personas held in the in-memory cache")
+
+
+class PersonaCache:
+    def __init__(self, max_entries: int, reuse_rate: float, persistent: bool):
+        self.max_entries = max_entries
+        self.reuse_rate = reuse_rate
+        self.persistent = persistent
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._schema_ready = False
+
+    @staticmethod
+    def key(messages: list[dict], **params) -> str:
+        payload = json.dumps({"messages": messages, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def should_reuse(self) -> bool:
+        reuse = random.random() < self.reuse_rate
+        if not reuse:
+            LOOKUPS.inc(result="bypass")
+        return reuse
+
+    async def _ensure_schema(self, conn) -> None:
+        if not self._schema_ready:
+            await conn.execute(SCHEMA_SQL)
+            self._schema_ready = True
+
+    def _remember(self, key: str, persona: dict) -> None:
+        self._entries[key] = persona
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        ENTRIES.set(len(self._entries))
+
+    async def get(self, conn, key: str) -> dict | None:
+        persona = self._entries.get(key)
+        if persona is not None:
+            self._entries.move_to_end(key)
+            LOOKUPS.inc(result="memory_hit")
+            return dict(persona)
+
+        if self.persistent:
+            try:
+                await self._ensure_schema(conn)
+                raw = await conn.fetchval(
+                    """
+                    UPDATE rival_persona_cache SET hits = hits + 1
+                    WHERE prompt_hash = $1
+                    RETURNING persona
+                    """,
+                    key,
+                )
+            except Exception as e:
+                print(f"Persona cache lookup failed: {e}")
+                raw = None
+            if raw is not None:
+                persona = json.loads(raw)
+                self._remember(key, persona)
+                LOOKUPS.inc(result="db_hit")
+                return dict(persona)
+
+        LOOKUPS.inc(result="miss")
+        return None
+
+    async def put(self, conn, key: str, persona: dict) -> None:
+        self._remember(key, dict(persona))
+        if self.persistent:
+            try:
+                await self._ensure_schema(conn)
+                await conn.execute(
+                    """
+                    INSERT INTO rival_persona_cache (prompt_hash, persona)
+                    VALUES ($1, $2)
+                    ON CONFLICT (prompt_hash)
+                    DO UPDATE SET persona = EXCLUDED.persona, created_at = NOW()
+                    """,
+                    key,
+                    json.dumps(persona),
+                )
+            except Exception as e:
+                print(f"Persona cache store failed: {e}")
+
+
+persona_cache = PersonaCache(
+    max_entries=int(os.environ.get("PERSONA_CACHE_MAX_ENTRIES", "1024")),
+    reuse_rate=float(os.environ.get("PERSONA_CACHE_REUSE_RATE", "0.9")),
+    persistent=os.environ.get("PERSONA_CACHE_PERSISTENT") == "true",
+)
@@ -0,0 +1,87 @@
+"""One Postgres LISTEN connection per worker, shared by every channel.
+
+Callbacks are plain functions called with the notification payload on the
+event loop; they must not block. The connection is re-established with backoff
+if it drops.
+
+Usage:
+
+    from app.libs.pg_listener import pg_listener
+
+    pg_listener.add_listener("live_updates", on_payload)
+    await pg_listener.start(connect)
+    ...
+    await pg_listener.stop()
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Callable
+
+RECONNECT_DELAY_SECONDS = 1
+MAX_RECONNECT_DELAY_SECONDS = 30
+
+# Identifies this worker process in broadcasts so it can skip its own messages
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class PgListener:
+    def __init__(self):
+        self._callbacks: dict[str, list[Callable[[str], None]]] = {}
+        self._conn = None
+        self._task: asyncio.Task | None = None
+        self._users = 0
+
+    def add_listener(self, channel: str, callback: Callable[[str], None]) -> None:
+        """Register a callback; takes effect on the next (re)connect if already running"""
+        is_new_channel = channel not in self._callbacks
+        self._callbacks.setdefault(channel, []).append(callback)
+        if is_new_channel and self._conn is not None and not self._conn.is_closed():
+            asyncio.create_task(self._conn.add_listener(channel, self._dispatch))
+
+    def _dispatch(self, conn, pid, channel: str, payload: str) -> None:
+        for callback in self._callbacks.get(channel, []):
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Listener for '{channel}' failed: {e}")
+
+    async def _run(self, connect) -> None:
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            try:
+                self._conn = await connect()
+                for channel in self._callbacks:
+                    await self._conn.add_listener(channel, self._dispatch)
+                print(f"Listening on {list(self._callbacks)}")
+                delay = RECONNECT_DELAY_SECONDS
+                while not self._conn.is_closed():
+                    await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Postgres listener connection failed: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+    async def start(self, connect) -> None:
+        """Start listening; every subsystem calling start must call stop"""
+        self._users += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(connect))
+
+    async def stop(self) -> None:
+        """Close the connection once the last subsystem using it has stopped"""
+        self._users -= 1
+        if self._users > 0:
+            return
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+
+pg_listener = PgListener()
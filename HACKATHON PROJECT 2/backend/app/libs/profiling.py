@@ -0,0 +1,247 @@
+"""Opt-in statistical profiling of single requests.
+
+With `PROFILING_ENABLED=true` the app installs `ProfilingMiddleware`. It
+profiles a request when either:
+
+- it carries `X-Profile: <token>` matching the `PROFILING_TOKEN` secret, or
+- it is picked at random at `PROFILING_SAMPLE_RATE` (0..1, default 0).
+
+While a profiled request runs, a thread samples its stack every
+`PROFILING_INTERVAL_MS` (default 1). It takes the running frames when the
+request is on the CPU, and its chain of awaits when the request is waiting on
+the database or an upstream. Each profile writes two files to `PROFILING_DIR`,
+named `<id>-<method>-<path>`:
+
+- `.folded`: stacks in folded format, for flamegraph.pl, inferno or
+  speedscope.
+- `.json`: the duration, plus a per-phase breakdown estimated from the
+  samples: auth, db_acquire, db_query, upstream, validation, serialization
+  and handler.
+
+The response carries `X-Profile-Id: <id>`. Work in tasks the request spawns
+(e.g. `run_concurrently`) shows up as the await that waits for it.
+
+When disabled, the middleware is not installed at all, so there is no
+overhead. Non-profiled requests pass through with one header scan.
+
+Usage (main.py):
+
+    from app.libs.profiling import PROFILING_ENABLED, ProfilingMiddleware
+
+    if PROFILING_ENABLED:
+        app.add_middleware(ProfilingMiddleware)
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter as Tally
+
+from app.libs.metrics import Counter
+from app.libs.secret_store import secret_store
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED") == "true"
+SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+INTERVAL_SECONDS = float(os.environ.get("PROFILING_INTERVAL_MS", "1")) / 1000
+PROFILE_DIR = os.environ.get("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+MAX_SECONDS = 30
+HEADER = b"x-profile"
+
+# (phase, path fragment, function qualname or None); the outermost matching frame decides
+PHASE_RULES = [
+    ("auth", "auth_mw.py", None),
+    ("serialization", "fastapi/routing.py", "serialize_response"),
+    ("upstream", "app/libs/resilience.py", "Upstream.call"),
+    ("upstream", "openai/", None),
+    ("upstream", "requests/", None),
+    ("db_acquire", "app/libs/database.py", "get_db_connection"),
+    ("db_acquire", "asyncpg/pool.py", None),
+    ("db_query", "asyncpg/", None),
+    ("serialization", "pydantic/", "BaseModel.model_dump"),
+    ("serialization", "pydantic/", "BaseModel.model_dump_json"),
+    ("validation", "pydantic/", None),
+]
+HANDLER_PHASE = "handler"
+AWAITING = "(awaiting)"
+
+PROFILES = Counter("request_profiles_total", "Requests profiled by trigger")
+
+# The sampler thread only runs when the event loop thread hands over the GIL,
+# so the switch interval is lowered to the sampling interval while profiling
+_active_profiles = 0
+_default_switch_interval = sys.getswitchinterval()
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def classify(frames: list) -> str:
+    for frame in frames:
+        path = frame.f_code.co_filename.replace(os.sep, "/")
+        for phase, fragment, qualname in PHASE_RULES:
+            if fragment in path and (qualname is None or frame.f_code.co_qualname == qualname):
+                return phase
+    return HANDLER_PHASE
+
+
+def running_stack(frame, root) -> list | None:
+    """Frames from root to the leaf if root is on this thread stack, i.e. the request is running"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            frames.reverse()
+            return frames
+        frame = frame.f_back
+    return None
+
+
+def awaiting_stack(task: asyncio.Task, root) -> list:
+    """Frames from root down the task's chain of suspended awaits"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        if frame is root or frames:
+            frames.append(frame)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return frames
+
+
+class Profile:
+    def __init__(self, method: str, path: str, trigger: str, task: asyncio.Task, root):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.task = task
+        self.root = root
+        self.thread_id = threading.get_ident()
+        self.stacks: Tally[str] = Tally()
+        self.phases: Tally[str] = Tally()
+        self.waiting = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name=f"profile-{self.id}", daemon=True)
+
+    def _sample(self) -> None:
+        deadline = time.monotonic() + MAX_SECONDS
+        while not self._stop.wait(INTERVAL_SECONDS) and time.monotonic() < deadline:
+            frames = running_stack(sys._current_frames().get(self.thread_id), self.root)
+            labels = None
+            if frames is None:
+                frames = awaiting_stack(self.task, self.root)
+                self.waiting += 1
+                labels = [frame_label(f) for f in frames] + [AWAITING]
+            if not frames:
+                continue
+            self.stacks[";".join(labels or map(frame_label, frames))] += 1
+            self.phases[classify(frames)] += 1
+
+    def start(self) -> None:
+        global _active_profiles
+        _active_profiles += 1
+        sys.setswitchinterval(min(_default_switch_interval, INTERVAL_SECONDS))
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        global _active_profiles
+        self.duration = time.perf_counter() - self.started
+        self._stop.set()
+        self._thread.join()
+        _active_profiles -= 1
+        if not _active_profiles:
+            sys.setswitchinterval(_default_switch_interval)
+
+    def report(self, status: int | None) -> dict:
+        samples = sum(self.phases.values()) or 1
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "trigger": self.trigger,
+            "duration_ms": round(self.duration * 1000, 3),
+            "interval_ms": INTERVAL_SECONDS * 1000,
+            "samples": sum(self.phases.values()),
+            "waiting_samples": self.waiting,
+            # Phase times are the request's duration split by each phase's share of samples
+            "phases": {
+                phase: {
+                    "ms": round(self.duration * 1000 * count / samples, 3),
+                    "share": round(count / samples, 3),
+                }
+                for phase, count in self.phases.most_common()
+            },
+        }
+
+    def write(self, status: int | None) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{self.id}-{self.method}-{re.sub(r'[^A-Za-z0-9]+', '_', self.path).strip('_')}")
+        with open(base + ".folded", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w") as f:
+            json.dump(self.report(status), f, indent=2)
+        return base
+
+
+def profile_trigger(scope) -> str | None:
+    """Why this request should be profiled, or None"""
+    for name, value in scope["headers"]:
+        if name == HEADER:
+            token = secret_store.get("PROFILING_TOKEN")
+            if token and hmac.compare_digest(value, token.encode("utf-8")):
+                return "header"
+            break
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; add it before the other middleware so it runs in the endpoint's task"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        trigger = profile_trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        PROFILES.inc(trigger=trigger)
+        profile = Profile(scope["method"], scope["path"], trigger, asyncio.current_task(), sys._getframe())
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop()
+            try:
+                path = await asyncio.to_thread(profile.write, status)
+                print(f"Profiled {profile.method} {profile.path} in {profile.duration * 1000:.1f}ms: {path}.folded")
+            except OSError as e:
+                print(f"Failed to write profile {profile.id}: {e}")
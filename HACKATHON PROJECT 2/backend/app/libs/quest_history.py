@@ -0,0 +1,263 @@
+"""Compact per-quest, per-year completion bitmaps.
+
+Every quest keeps one 366-bit bitset per calendar year in
+`quest_history_bitmaps`, maintained alongside `quest_checks`. Bit N is set when
+the quest was completed on day N of the year (January 1st is bit 0). The bytes
+use Postgres' `set_bit` ordering, i.e. bit N is bit N % 8 of byte N // 8, which
+is the same as `int.from_bytes(bits, "little")`. Rebuilds and backfills read
+the `quest_check_days` view, so days in archived months still count.
+
+Usage:
+
+    from app.libs.quest_history import mark_completed, get_streaks
+
+    await mark_completed(conn, quest_id, date.today())
+    current_streak, longest_streak = await get_streaks(conn, quest_id)
+
+`python -m app.libs.quest_history backfill` (`make backfill-bitmaps`) rebuilds
+the bitmaps of every quest from its completed days, e.g. once after deploying.
+"""
+
+import asyncio
+import sys
+from datetime import date
+
+from app.libs.database import db_connection
+from app.libs.partitions import ensure_schema as ensure_archive_schema
+
+YEAR_BITS = 366
+YEAR_BYTES = (YEAR_BITS + 7) // 8
+BACKFILL_BATCH_SIZE = 1000
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS quest_history_bitmaps (
+    quest_id INTEGER NOT NULL REFERENCES quests(id) ON DELETE CASCADE,
+    year SMALLINT NOT NULL,
+    bits BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (quest_id, year)
+)
+"""
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the bitmap table once per process.
+
+    The quest_check_days view that rebuilds read is created at startup, see
+    `app.libs.partitions.ensure_schema`.
+    """
+    global _schema_ready
+    if not _schema_ready:
+        await conn.execute(SCHEMA_SQL)
+        _schema_ready = True
+
+
+def day_index(day: date) -> int:
+    """Bit position of a date within its year's bitmap"""
+    return day.timetuple().tm_yday - 1
+
+
+def days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+
+def bits_from_bytes(raw: bytes | None) -> int:
+    return int.from_bytes(raw, "little") if raw else 0
+
+
+def bits_to_bytes(bits: int) -> bytes:
+    return bits.to_bytes(YEAR_BYTES, "little")
+
+
+def bits_from_dates(dates) -> int:
+    bits = 0
+    for day in dates:
+        bits |= 1 << day_index(day)
+    return bits
+
+
+def longest_run(bits: int) -> int:
+    """Length of the longest run of set bits"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def trailing_run(bits: int, end: int) -> int:
+    """Length of the run of set bits ending at (and including) bit `end`"""
+    if end < 0:
+        return 0
+    gaps = ~bits & ((1 << (end + 1)) - 1)
+    if not gaps:
+        return end + 1
+    return end - (gaps.bit_length() - 1)
+
+
+def concat_years(year_bits: dict[int, int]) -> int:
+    """Join consecutive yearly bitmaps into one bitset, oldest year in the low bits"""
+    if not year_bits:
+        return 0
+    combined = 0
+    offset = 0
+    for year in range(min(year_bits), max(year_bits) + 1):
+        combined |= year_bits.get(year, 0) << offset
+        offset += days_in_year(year)
+    return combined
+
+
+def current_streak_from_bits(year_bits: dict[int, int], today: date) -> int:
+    """Consecutive completed days ending today, or yesterday if today is still open.
+
+    A run that ended before yesterday is broken, so the streak is 0 then.
+    """
+    year_bits = {y: b for y, b in year_bits.items() if y <= today.year}
+    if not year_bits:
+        return 0
+    first_year = min(year_bits)
+    combined = concat_years({**year_bits, today.year: year_bits.get(today.year, 0)})
+    end = (today - date(first_year, 1, 1)).days
+    if not combined >> end & 1:
+        end -= 1
+    return trailing_run(combined, end)
+
+
+async def mark_completed(conn, quest_id: int, day: date) -> None:
+    """Set the bit for `day` in the quest's bitmap.
+
+    Call after inserting the completion into `quest_checks`. A quest with no
+    bitmaps yet, e.g. one completed before they existed, gets them built from all
+    its completed days first, since the read-side backfill only runs while a quest
+    has no bitmap rows at all.
+    """
+    await ensure_schema(conn)
+    has_bitmaps = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM quest_history_bitmaps WHERE quest_id = $1)", quest_id
+    )
+    if not has_bitmaps:
+        await rebuild_bitmaps(conn, [quest_id])
+    query = """
+    INSERT INTO quest_history_bitmaps (quest_id, year, bits)
+    VALUES ($1, $2, set_bit(decode(repeat('00', $4), 'hex'), $3, 1))
+    ON CONFLICT (quest_id, year)
+    DO UPDATE SET
+        bits = set_bit(quest_history_bitmaps.bits, $3, 1),
+        updated_at = NOW()
+    """
+    await conn.execute(query, quest_id, day.year, day_index(day), YEAR_BYTES)
+
+
+async def rebuild_bitmaps(conn, quest_ids: list[int]) -> None:
+    """Recompute the bitmaps of the given quests from their completed days"""
+    if not quest_ids:
+        return
+    await ensure_schema(conn)
+    rows = await conn.fetch(
+        "SELECT quest_id, date FROM quest_check_days WHERE quest_id = ANY($1::int[])",
+        quest_ids,
+    )
+    bitmaps: dict[tuple[int, int], int] = {}
+    for row in rows:
+        key = (row["quest_id"], row["date"].year)
+        bitmaps[key] = bitmaps.get(key, 0) | 1 << day_index(row["date"])
+
+    await conn.executemany(
+        """
+        INSERT INTO quest_history_bitmaps (quest_id, year, bits)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (quest_id, year)
+        DO UPDATE SET bits = EXCLUDED.bits, updated_at = NOW()
+        """,
+        [(quest_id, year, bits_to_bytes(bits)) for (quest_id, year), bits in bitmaps.items()],
+    )
+
+
+async def get_year_bitmaps(conn, quest_id: int, read_only: bool = False) -> dict[int, int]:
+    """Load all stored bitmaps of a quest as {year: bits}.
+
+    On a read-only (replica) connection the one-time backfill is computed in
+    memory instead of being written.
+    """
+    if not read_only:
+        await ensure_schema(conn)
+    rows = await conn.fetch(
+        "SELECT year, bits FROM quest_history_bitmaps WHERE quest_id = $1", quest_id
+    )
+    if not rows:
+        # Quests completed before bitmaps existed: backfill once from quest_checks
+        if read_only:
+            dates = await conn.fetch("SELECT date FROM quest_check_days WHERE quest_id = $1", quest_id)
+            year_bits: dict[int, int] = {}
+            for row in dates:
+                day = row["date"]
+                year_bits[day.year] = year_bits.get(day.year, 0) | (1 << day_index(day))
+            return year_bits
+        has_checks = await conn.fetchval(
+            "SELECT EXISTS(SELECT 1 FROM quest_check_days WHERE quest_id = $1)", quest_id
+        )
+        if not has_checks:
+            return {}
+        await rebuild_bitmaps(conn, [quest_id])
+        return await get_year_bitmaps(conn, quest_id)
+    return {row["year"]: bits_from_bytes(row["bits"]) for row in rows}
+
+
+async def get_streaks(conn, quest_id: int, today: date | None = None, read_only: bool = False) -> tuple[int, int]:
+    """Return (current_streak, longest_streak) computed from the bitmaps"""
+    if today is None:
+        today = date.today()
+    year_bits = await get_year_bitmaps(conn, quest_id, read_only=read_only)
+    return current_streak_from_bits(year_bits, today), longest_run(concat_years(year_bits))
+
+
+async def get_streaks_for(conn, quest_ids: list[int], today: date | None = None) -> dict[int, tuple[int, int]]:
+    """Return {quest_id: (current_streak, longest_streak)} for many quests with one query"""
+    if today is None:
+        today = date.today()
+    await ensure_schema(conn)
+    rows = await conn.fetch(
+        "SELECT quest_id, year, bits FROM quest_history_bitmaps WHERE quest_id = ANY($1::int[])",
+        quest_ids,
+    )
+    by_quest: dict[int, dict[int, int]] = {quest_id: {} for quest_id in quest_ids}
+    for row in rows:
+        by_quest[row["quest_id"]][row["year"]] = bits_from_bytes(row["bits"])
+    return {
+        quest_id: (current_streak_from_bits(year_bits, today), longest_run(concat_years(year_bits)))
+        for quest_id, year_bits in by_quest.items()
+    }
+
+
+async def backfill_all(conn) -> int:
+    """Rebuild the bitmaps of every quest with completions, in batches; returns the number of quests"""
+    await ensure_archive_schema(conn)
+    await ensure_schema(conn)
+    last_id = 0
+    total = 0
+    while True:
+        quest_ids = await conn.fetch(
+            "SELECT DISTINCT quest_id FROM quest_check_days WHERE quest_id > $1 ORDER BY quest_id LIMIT $2",
+            last_id,
+            BACKFILL_BATCH_SIZE,
+        )
+        if not quest_ids:
+            return total
+        batch = [row["quest_id"] for row in quest_ids]
+        async with conn.transaction():
+            await rebuild_bitmaps(conn, batch)
+        total += len(batch)
+        last_id = batch[-1]
+
+
+async def main(command: str) -> None:
+    if command != "backfill":
+        raise SystemExit(f"Unknown command {command}, expected backfill")
+    async with db_connection() as conn:
+        print(f"Rebuilt the bitmaps of {await backfill_all(conn)} quests")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "backfill"))
@@ -0,0 +1,147 @@
+"""Per-user token bucket rate limits for expensive endpoints.
+
+Each `RateLimit` allows `requests` calls per `per_seconds` to every key (the
+user's `sub`), with bursts of up to `burst` calls. Buckets refill continuously.
+A denied call does not use a token, and it raises `RateLimited`, which the app
+turns into a 429 with a `Retry-After` header.
+
+`RATE_LIMIT_BACKEND` picks where the buckets live:
+
+- `memory` (default): a dict in this worker. The allow path is a dict lookup
+  and a little arithmetic, under a microsecond. With several workers, each
+  worker enforces the limit on its own.
+- `postgres`: one `rate_limit_buckets` row per key, updated by one atomic
+  upsert, so all workers share the limit. This costs a round trip per call. If
+  the database cannot be reached, the worker falls back to its own buckets.
+
+Limits can be overridden per name with `RATE_LIMIT_<NAME>="<requests>/<seconds>"`,
+e.g. `RATE_LIMIT_RIVAL_GENERATE=20/3600`.
+
+Usage:
+
+    from app.libs.rate_limit import RateLimit
+
+    generate_limit = RateLimit("rival_generate", requests=5, per_seconds=60)
+
+    await generate_limit.check(user.sub)  # raises RateLimited
+"""
+
+import os
+from time import monotonic
+
+from app.libs.database import db_connection
+from app.libs.metrics import Counter
+
+BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+MAX_TRACKED_KEYS = 100_000
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tokens DOUBLE PRECISION NOT NULL,
+    allowed BOOLEAN NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (name, key)
+)
+"""
+
+# Refill by the elapsed time, then take a token if there is a whole one
+TAKE_TOKEN_SQL = """
+INSERT INTO rate_limit_buckets AS b (name, key, tokens, allowed, updated_at)
+VALUES ($1, $2, $3 - 1, true, clock_timestamp())
+ON CONFLICT (name, key) DO UPDATE SET
+    tokens = CASE
+        WHEN LEAST($3, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * $4) >= 1
+        THEN LEAST($3, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * $4) - 1
+        ELSE LEAST($3, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * $4)
+    END,
+    allowed = LEAST($3, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * $4) >= 1,
+    updated_at = clock_timestamp()
+RETURNING tokens, allowed
+"""
+
+# Only denials are counted, to keep the allow path cheap
+LIMITED = Counter("rate_limited_total", "Calls rejected by a rate limit, by limit")
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the shared bucket table on first use"""
+    global _schema_ready
+    if not _schema_ready:
+        await conn.execute(SCHEMA_SQL)
+        _schema_ready = True
+
+
+class RateLimited(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Rate limit {name} exceeded, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def limit_from_env(name: str, requests: int, per_seconds: float) -> tuple[int, float]:
+    value = os.environ.get(f"RATE_LIMIT_{name.upper()}")
+    if not value:
+        return requests, per_seconds
+    count, _, seconds = value.partition("/")
+    return int(count), float(seconds)
+
+
+class RateLimit:
+    def __init__(self, name: str, requests: int, per_seconds: float, burst: int | None = None):
+        requests, per_seconds = limit_from_env(name, requests, per_seconds)
+        self.name = name
+        self.rate = requests / per_seconds
+        self.burst = burst if burst is not None else requests
+        self.shared = BACKEND == "postgres"
+        self._buckets: dict[str, list[float]] = {}
+
+    def _sweep(self, now: float) -> None:
+        """Forget keys whose bucket has refilled completely"""
+        full_after = self.burst / self.rate
+        self._buckets = {k: b for k, b in self._buckets.items() if now - b[1] < full_after}
+
+    def try_acquire(self, key: str) -> float:
+        """Take a token from the local bucket; 0 when allowed, else seconds until one is available"""
+        now = monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_KEYS:
+                self._sweep(now)
+            self._buckets[key] = [self.burst - 1, now]
+            return 0
+        tokens = bucket[0] + (now - bucket[1]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    async def try_acquire_shared(self, key: str) -> float:
+        """Take a token from the key's shared bucket in Postgres, same result as try_acquire"""
+        async with db_connection() as conn:
+            await ensure_schema(conn)
+            row = await conn.fetchrow(TAKE_TOKEN_SQL, self.name, key, float(self.burst), self.rate)
+        if row["allowed"]:
+            return 0
+        return (1 - row["tokens"]) / self.rate
+
+    async def check(self, key: str) -> None:
+        """Use one call of the key's allowance, raising RateLimited when it is used up"""
+        if self.shared:
+            try:
+                retry_after = await self.try_acquire_shared(key)
+            except Exception as e:
+                print(f"Shared rate limit {self.name} unavailable, using the local one: {e}")
+                retry_after = self.try_acquire(key)
+        else:
+            retry_after = self.try_acquire(key)
+        if retry_after:
+            LIMITED.inc(limit=self.name)
+            raise RateLimited(self.name, retry_after)
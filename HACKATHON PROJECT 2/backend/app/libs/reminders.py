@@ -0,0 +1,287 @@
+"""Daily reminders for users who still have quests open for today.
+
+Every `LOOKAHEAD_MINUTES` the scheduler loads the users whose reminder time
+falls in the next window and who have at least one quest without a
+`quest_checks` row for today. It loads them with keyset-paginated, set-based
+queries of `LOAD_BATCH_USERS` users each, never one query per user. The users
+go into a timer wheel with one slot per minute of the day. A ticker pops the
+slot of each minute as it passes. With one query per slot it re-checks which of
+those users still have open quests and claims them in `reminder_log`, which
+keeps it to one reminder per user per day across restarts and workers. It then
+hands the batch to the sender. The claims commit only once the sender has
+accepted the batch; if it fails they roll back and the slot is retried on the
+next tick.
+
+Reminder times are minutes of the day in server time, per user in
+`reminder_preferences`, or `REMINDER_DEFAULT_TIME` (default 20:00) for users
+without a preference. `REMINDER_SENDER` picks the sender: `log` (default)
+prints, and `file` appends JSON lines to `REMINDER_FILE` for local runs and
+tests.
+
+Usage:
+
+    from app.libs.reminders import reminder_scheduler
+
+    reminder_scheduler.start()
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, time, timedelta
+
+from app.libs.database import db_connection
+from app.libs.metrics import Counter
+
+MINUTES_PER_DAY = 24 * 60
+LOOKAHEAD_MINUTES = 60
+CATCH_UP_MINUTES = 30
+LOAD_BATCH_USERS = 10_000
+
+
+def parse_minute(value: str) -> int:
+    """Minute of the day of an HH:MM time"""
+    parsed = time.fromisoformat(value)
+    return parsed.hour * 60 + parsed.minute
+
+
+DEFAULT_REMINDER_MINUTE = parse_minute(os.environ.get("REMINDER_DEFAULT_TIME", "20:00"))
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS reminder_preferences (
+    user_id TEXT PRIMARY KEY,
+    remind_minute SMALLINT NOT NULL CHECK (remind_minute >= 0 AND remind_minute < 1440),
+    enabled BOOLEAN NOT NULL DEFAULT true,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS reminder_log (
+    user_id TEXT NOT NULL,
+    day DATE NOT NULL,
+    sent_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, day)
+);
+CREATE INDEX IF NOT EXISTS quests_user_id_idx ON quests (user_id);
+"""
+
+REMINDERS = Counter("reminders_total", "Daily reminders by outcome")
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the reminder tables on first use"""
+    global _schema_ready
+    if not _schema_ready:
+        await conn.execute(SCHEMA_SQL)
+        _schema_ready = True
+
+
+@dataclass
+class Reminder:
+    user_id: str
+    day: date
+    open_quests: int
+
+
+class LogSender:
+    async def send(self, reminders: list[Reminder]) -> None:
+        for reminder in reminders:
+            print(f"Reminder for {reminder.user_id}: {reminder.open_quests} quests left today")
+
+
+class FileSender:
+    def __init__(self, path: str):
+        self.path = path
+
+    async def send(self, reminders: list[Reminder]) -> None:
+        lines = "".join(json.dumps(asdict(r), default=str) + "\n" for r in reminders)
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(lines)
+
+
+def sender_from_env():
+    if os.environ.get("REMINDER_SENDER") == "file":
+        return FileSender(os.environ.get("REMINDER_FILE", "reminders.jsonl"))
+    return LogSender()
+
+
+class TimerWheel:
+    """Items bucketed by minute of the day"""
+
+    def __init__(self, slots: int = MINUTES_PER_DAY):
+        self._slots: list[dict[str, int]] = [{} for _ in range(slots)]
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, slot: int, user_id: str, open_quests: int) -> None:
+        bucket = self._slots[slot]
+        if user_id not in bucket:
+            self._size += 1
+        bucket[user_id] = open_quests
+
+    def pop(self, slot: int) -> dict[str, int]:
+        bucket = self._slots[slot]
+        self._slots[slot] = {}
+        self._size -= len(bucket)
+        return bucket
+
+    def clear(self) -> None:
+        self._slots = [{} for _ in self._slots]
+        self._size = 0
+
+
+async def load_due_users(conn, day: date, start_minute: int, end_minute: int):
+    """Yield batches of (user_id, remind_minute, open_quests) due in [start, end) and not yet reminded"""
+    cursor = ""
+    while True:
+        rows = await conn.fetch(
+            """
+            SELECT q.user_id,
+                   COALESCE(p.remind_minute, $3) AS remind_minute,
+                   COUNT(*) AS open_quests
+            FROM quests q
+            LEFT JOIN reminder_preferences p ON p.user_id = q.user_id
+            WHERE q.user_id > $1
+              AND COALESCE(p.enabled, true)
+              AND COALESCE(p.remind_minute, $3) >= $4
+              AND COALESCE(p.remind_minute, $3) < $5
+              AND NOT EXISTS (
+                  SELECT 1 FROM quest_checks qc
+                  WHERE qc.quest_id = q.id AND qc.date = $2
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM reminder_log l
+                  WHERE l.user_id = q.user_id AND l.day = $2
+              )
+            GROUP BY q.user_id, p.remind_minute
+            ORDER BY q.user_id
+            LIMIT $6
+            """,
+            cursor,
+            day,
+            DEFAULT_REMINDER_MINUTE,
+            start_minute,
+            end_minute,
+            LOAD_BATCH_USERS,
+        )
+        if rows:
+            yield rows
+        if len(rows) < LOAD_BATCH_USERS:
+            return
+        cursor = rows[-1]["user_id"]
+
+
+async def claim_reminders(conn, day: date, user_ids: list[str]) -> set[str]:
+    """Users that still have open quests and were not reminded today, marked as reminded"""
+    rows = await conn.fetch(
+        """
+        INSERT INTO reminder_log (user_id, day)
+        SELECT u.user_id, $2
+        FROM unnest($1::text[]) AS u(user_id)
+        WHERE EXISTS (
+            SELECT 1 FROM quests q
+            WHERE q.user_id = u.user_id
+              AND NOT EXISTS (
+                  SELECT 1 FROM quest_checks qc
+                  WHERE qc.quest_id = q.id AND qc.date = $2
+              )
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+        """,
+        user_ids,
+        day,
+    )
+    return {row["user_id"] for row in rows}
+
+
+class ReminderScheduler:
+    def __init__(self, sender=None):
+        self.sender = sender or sender_from_env()
+        self.wheel = TimerWheel()
+        self._day: date | None = None
+        self._loaded_until = 0
+        self._last_tick = -1
+        self._task: asyncio.Task | None = None
+
+    async def load(self, conn, day: date, start_minute: int, end_minute: int) -> int:
+        """Fill the wheel with users due in [start, end), return how many were added"""
+        added = 0
+        async for rows in load_due_users(conn, day, start_minute, end_minute):
+            for row in rows:
+                self.wheel.add(row["remind_minute"], row["user_id"], row["open_quests"])
+            added += len(rows)
+        return added
+
+    async def fire(self, conn, day: date, slot: int) -> int:
+        """Send the reminders of one wheel slot, return how many were sent"""
+        due = self.wheel.pop(slot)
+        if not due:
+            return 0
+        claimed: set[str] = set()
+        try:
+            # Other workers claiming the same users wait for this transaction
+            async with conn.transaction():
+                claimed = await claim_reminders(conn, day, list(due))
+                if claimed:
+                    await self.sender.send([Reminder(user_id, day, due[user_id]) for user_id in claimed])
+        except Exception:
+            # Nothing stays claimed; keep the slot for the next tick
+            for user_id, open_quests in due.items():
+                self.wheel.add(slot, user_id, open_quests)
+            if claimed:
+                REMINDERS.inc(len(claimed), outcome="failed")
+            raise
+        REMINDERS.inc(len(due) - len(claimed), outcome="skipped")
+        if not claimed:
+            return 0
+        REMINDERS.inc(len(claimed), outcome="sent")
+        return len(claimed)
+
+    async def tick(self, now: datetime) -> None:
+        day = now.date()
+        minute = now.hour * 60 + now.minute
+        if day != self._day:
+            # New day (or first tick): start over, catching up on the last few minutes
+            self.wheel.clear()
+            self._day = day
+            self._last_tick = max(minute - CATCH_UP_MINUTES, 0) - 1
+            self._loaded_until = self._last_tick + 1
+
+        async with db_connection() as conn:
+            await ensure_schema(conn)
+            if self._loaded_until <= minute:
+                end = min(minute + LOOKAHEAD_MINUTES, MINUTES_PER_DAY)
+                added = await self.load(conn, day, self._loaded_until, end)
+                print(f"Reminder wheel loaded {added} users for minutes {self._loaded_until}-{end}")
+                self._loaded_until = end
+            for slot in range(self._last_tick + 1, minute + 1):
+                await self.fire(conn, day, slot)
+            self._last_tick = minute
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick(datetime.now())
+            except Exception as e:
+                print(f"Reminder tick failed: {e}")
+            now = datetime.now()
+            next_minute = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+            await asyncio.sleep((next_minute - now).total_seconds())
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,262 @@
+"""Storage interface of the quests, rivals and payments routers.
+
+Handlers open a `Session` from the configured repository and call its methods
+instead of running SQL themselves. A session is one unit of work: with
+Postgres it holds one pooled connection (`read_only` sessions go to the
+replica, same as `get_db_connection`). Writes that belong together run in
+`db.transaction()`. Change events, cache invalidation and leaderboard
+broadcasts are sent through the session as well, after that transaction has
+committed.
+
+`REPOSITORY_BACKEND` picks the implementation:
+
+- `postgres` (default): `app.libs.repository_postgres`
+- `memory`: `app.libs.repository_memory`, which keeps everything in indexed
+  dicts and sorted lists in this process. The API then runs on one machine
+  with no database, e.g. for local runs and load tests. Data is lost on
+  restart. Run a single worker. Postgres-only features, such as export, import,
+  reminders, the rival interaction log, the outbox and cross-worker
+  broadcasts, are not available.
+
+Rows come back as mappings with the same keys as the Postgres columns.
+
+Usage:
+
+    from app.libs.repository import repository
+
+    async with repository.session(user_id=user.sub) as db:
+        quest_row = await db.create_quest(user.sub, title)
+        await db.publish(user.sub, "quest.created", {...})
+
+    sub_info, rivals = await repository.run_concurrently(
+        lambda db: db.subscription_info(user.sub),
+        lambda db: db.list_rivals(user.sub),
+        user_id=user.sub,
+    )
+"""
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Mapping
+
+from app.libs.database import POOL_MAX_SIZE
+
+# Sessions one run_concurrently call may hold at once. With Postgres each is a pooled
+# connection, so a single request never takes more than a third of the pool
+MAX_FAN_OUT = int(os.environ.get("REPOSITORY_MAX_FAN_OUT", str(max(1, POOL_MAX_SIZE // 3))))
+
+
+class Session(ABC):
+    """One unit of work against the store; a backend missing any method fails when instantiated"""
+
+    read_only: bool = False
+
+    @abstractmethod
+    def transaction(self) -> AbstractAsyncContextManager[None]:
+        """Commit the writes made inside `async with db.transaction():` together, or none of them"""
+
+    # Quests and completions
+    @abstractmethod
+    async def create_quest(self, user_id: str, title: str) -> Mapping:
+        """Insert a quest, returning id, user_id, title, created_at"""
+
+    @abstractmethod
+    async def get_quest(self, user_id: str, quest_id: int) -> Mapping | None:
+        """The user's quest with this id"""
+
+    @abstractmethod
+    async def list_quests(self, user_id: str, today: date) -> list[Mapping]:
+        """The user's quests, newest first, with `completed_today`"""
+
+    @abstractmethod
+    async def count_quests(self, user_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def recent_quest_titles(self, user_id: str, limit: int) -> list[str]:
+        """Titles of the user's newest quests"""
+
+    @abstractmethod
+    async def delete_quest(self, user_id: str, quest_id: int) -> int | None:
+        """Delete a quest with its completions, returning its id if it existed"""
+
+    @abstractmethod
+    async def is_completed(self, quest_id: int, day: date) -> bool:
+        ...
+
+    @abstractmethod
+    async def add_completion(self, quest_id: int, day: date) -> Mapping:
+        """Record a completion, returning id, quest_id, date, created_at"""
+
+    @abstractmethod
+    async def current_streak(self, quest_id: int) -> int:
+        """Days in the run ending today or yesterday; 0 once the run is broken"""
+
+    @abstractmethod
+    async def year_bitmaps(self, quest_id: int) -> dict[int, int]:
+        """Completion bitmaps of a quest as {year: bits}, see `app.libs.quest_history`"""
+
+    @abstractmethod
+    async def daily_completions(self, user_id: str, day: date) -> int:
+        ...
+
+    @abstractmethod
+    async def increment_daily_completions(self, user_id: str, day: date) -> int:
+        """Count one more completion for the user on that day, returning the new count"""
+
+    @abstractmethod
+    async def record_completion(
+        self, user_id: str, quest_id: int, title: str, streak: int, completions_today: int, day: date
+    ) -> None:
+        """Award rival XP, update the leaderboard and queue the rival's reaction; call in the completion's transaction"""
+
+    # Subscriptions
+    @abstractmethod
+    async def subscription_info(self, user_id: str) -> dict:
+        """Premium flag, when it lapses and limits, see `app.libs.entitlements`"""
+
+    @abstractmethod
+    async def active_subscription(self, user_id: str) -> Mapping | None:
+        """The user's active, unexpired subscription ending last"""
+
+    @abstractmethod
+    async def upsert_subscription(
+        self, user_id: str, subscription_type: str, start_date: datetime, end_date: datetime
+    ) -> None:
+        """Activate the user's subscription for the period; cached entitlements are dropped once it commits"""
+
+    # Rivals
+    @abstractmethod
+    async def list_rivals(self, user_id: str) -> list[Mapping]:
+        """The user's rivals in slot order"""
+
+    @abstractmethod
+    async def active_rival(self, user_id: str) -> Mapping | None:
+        """The first active rival in slot order"""
+
+    @abstractmethod
+    async def count_rivals(self, user_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def create_rival(
+        self,
+        user_id: str,
+        name: str,
+        archetype: str,
+        taunt: str,
+        personality_type: str,
+        rival_order: int,
+        is_active: bool,
+    ) -> Mapping:
+        """Insert a level 1 rival, returning the full row"""
+
+    @abstractmethod
+    async def cached_persona(self, key: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    async def store_persona(self, key: str, persona: dict) -> None:
+        ...
+
+    # Payments
+    @abstractmethod
+    async def create_payment(
+        self,
+        user_id: str,
+        reference: str,
+        amount: Decimal,
+        currency: str,
+        status: str,
+        payment_type: str,
+        metadata: dict,
+    ) -> None:
+        ...
+
+    @abstractmethod
+    async def update_payment_status(self, user_id: str, reference: str, status: str, transaction_id) -> None:
+        """Store the verified status of one of the user's payments"""
+
+    @abstractmethod
+    async def mark_payment_webhook_received(self, reference: str) -> None:
+        ...
+
+    # Events
+    @abstractmethod
+    async def publish(self, user_id: str, event_type: str, data: dict | None = None) -> None:
+        """Send a live change event to the user's clients, see `app.libs.live_updates`"""
+
+    @abstractmethod
+    async def broadcast_leaderboard(self, quest_id: int) -> None:
+        """Share a local leaderboard change with the other workers"""
+
+    @abstractmethod
+    async def invalidate_responses(self, user_id: str, routes: list[str]) -> None:
+        """Evict the user's cached responses of these routes, see `app.libs.response_cache`"""
+
+
+class Repository(ABC):
+    name: str
+    uses_postgres: bool
+
+    @abstractmethod
+    async def open_session(self, read_only: bool = False, user_id: str | None = None) -> Session:
+        """Start a session; end it with close_session"""
+
+    @abstractmethod
+    async def close_session(self, session: Session) -> None:
+        ...
+
+    async def warm_up(self) -> None:
+        """Create connections and caches up front instead of on the first requests"""
+
+    @asynccontextmanager
+    async def session(self, read_only: bool = False, user_id: str | None = None):
+        db = await self.open_session(read_only=read_only, user_id=user_id)
+        try:
+            yield db
+        finally:
+            await self.close_session(db)
+
+    async def run_concurrently(self, *queries, read_only: bool = True, user_id: str | None = None) -> list:
+        """Run independent queries at the same time, each in its own session.
+
+        Each query is a callable taking a session and returning an awaitable; results come
+        back in order. If one fails the others are cancelled and its error is raised.
+
+        Every running query holds its own pooled connection (list_quests takes 3 of the
+        default 10), so at most MAX_FAN_OUT run at once and the rest wait for a session.
+        """
+        slots = asyncio.Semaphore(MAX_FAN_OUT)
+
+        async def run(query):
+            async with slots:
+                async with self.session(read_only=read_only, user_id=user_id) as db:
+                    return await query(db)
+
+        tasks = [asyncio.ensure_future(run(query)) for query in queries]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+def repository_from_env() -> Repository:
+    backend = os.environ.get("REPOSITORY_BACKEND", "postgres")
+    if backend == "memory":
+        from app.libs.repository_memory import MemoryRepository
+        return MemoryRepository()
+    if backend == "postgres":
+        from app.libs.repository_postgres import PostgresRepository
+        return PostgresRepository()
+    raise RuntimeError(f"Unknown REPOSITORY_BACKEND {backend}, expected postgres or memory")
+
+
+repository = repository_from_env()
@@ -0,0 +1,300 @@
+"""In-process implementation of the repository, for local runs and load tests.
+
+Everything lives in one `MemoryStore`:
+
+- Records by id in dicts.
+- Per-user indexes as sorted lists: quest ids in creation order, and rival
+  (slot, id) pairs in slot order.
+- Completions per quest by day, plus each quest's yearly completion bitmaps,
+  updated on every completion. Streaks use the same bitmap code as Postgres.
+
+No method awaits anything, so each call runs atomically on the event loop and
+sessions need no locking. Events go straight to this process's live hub. XP is
+applied to the active rival right away instead of through the event log.
+"""
+
+import itertools
+from bisect import bisect_left, insort
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from app.libs.leaderboard import leaderboard
+from app.libs.live_updates import encode_event, live_hub
+from app.libs.persona_cache import persona_cache
+from app.libs.quest_history import current_streak_from_bits, day_index
+from app.libs.repository import Repository, Session
+from app.libs.response_cache import invalidate_responses
+from app.libs.rival_xp import level_for_experience, xp_for_completion
+
+DEFAULT_DAILY_COMPLETION_LIMIT = 5
+DEFAULT_MAX_RIVALS = 1
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MemoryStore:
+    def __init__(self):
+        self.quest_ids = itertools.count(1)
+        self.check_ids = itertools.count(1)
+        self.rival_ids = itertools.count(1)
+        self.payment_ids = itertools.count(1)
+
+        self.quests: dict[int, dict] = {}
+        self.quests_by_user: dict[str, list[int]] = {}
+        self.checks: dict[int, dict[date, dict]] = {}
+        self.bitmaps: dict[int, dict[int, int]] = {}
+        self.daily_completions: dict[tuple[str, date], int] = {}
+        self.subscriptions: dict[str, dict] = {}
+        self.rivals: dict[int, dict] = {}
+        self.rivals_by_user: dict[str, list[tuple[int, int]]] = {}
+        self.payments: dict[str, dict] = {}
+
+    def user_rivals(self, user_id: str) -> list[dict]:
+        return [self.rivals[rival_id] for _, rival_id in self.rivals_by_user.get(user_id, [])]
+
+
+class MemorySession(Session):
+    def __init__(self, store: MemoryStore, read_only: bool):
+        self.store = store
+        self.read_only = read_only
+
+    @asynccontextmanager
+    async def transaction(self):
+        # Nothing to commit; writes are applied as they are made and not rolled back
+        yield
+
+    # Quests and completions
+    async def create_quest(self, user_id: str, title: str) -> dict:
+        quest = {"id": next(self.store.quest_ids), "user_id": user_id, "title": title, "created_at": now()}
+        self.store.quests[quest["id"]] = quest
+        # Ids only grow, so appending keeps the index sorted
+        self.store.quests_by_user.setdefault(user_id, []).append(quest["id"])
+        return dict(quest)
+
+    async def get_quest(self, user_id: str, quest_id: int) -> dict | None:
+        quest = self.store.quests.get(quest_id)
+        if quest is None or quest["user_id"] != user_id:
+            return None
+        return dict(quest)
+
+    async def list_quests(self, user_id: str, today: date) -> list[dict]:
+        return [
+            {**self.store.quests[quest_id], "completed_today": today in self.store.checks.get(quest_id, {})}
+            for quest_id in reversed(self.store.quests_by_user.get(user_id, []))
+        ]
+
+    async def count_quests(self, user_id: str) -> int:
+        return len(self.store.quests_by_user.get(user_id, []))
+
+    async def recent_quest_titles(self, user_id: str, limit: int) -> list[str]:
+        quest_ids = self.store.quests_by_user.get(user_id, [])[::-1][:limit]
+        return [self.store.quests[quest_id]["title"] for quest_id in quest_ids]
+
+    async def delete_quest(self, user_id: str, quest_id: int) -> int | None:
+        if await self.get_quest(user_id, quest_id) is None:
+            return None
+        del self.store.quests[quest_id]
+        user_quests = self.store.quests_by_user[user_id]
+        del user_quests[bisect_left(user_quests, quest_id)]
+        self.store.checks.pop(quest_id, None)
+        self.store.bitmaps.pop(quest_id, None)
+        return quest_id
+
+    async def is_completed(self, quest_id: int, day: date) -> bool:
+        return day in self.store.checks.get(quest_id, {})
+
+    async def add_completion(self, quest_id: int, day: date) -> dict:
+        checks = self.store.checks.setdefault(quest_id, {})
+        if day in checks:
+            raise ValueError(f"Quest {quest_id} is already completed on {day}")
+        check = {"id": next(self.store.check_ids), "quest_id": quest_id, "date": day, "created_at": now()}
+        checks[day] = check
+        year_bits = self.store.bitmaps.setdefault(quest_id, {})
+        year_bits[day.year] = year_bits.get(day.year, 0) | 1 << day_index(day)
+        return dict(check)
+
+    async def current_streak(self, quest_id: int) -> int:
+        return current_streak_from_bits(self.store.bitmaps.get(quest_id, {}), date.today())
+
+    async def year_bitmaps(self, quest_id: int) -> dict[int, int]:
+        return dict(self.store.bitmaps.get(quest_id, {}))
+
+    async def daily_completions(self, user_id: str, day: date) -> int:
+        return self.store.daily_completions.get((user_id, day), 0)
+
+    async def increment_daily_completions(self, user_id: str, day: date) -> int:
+        count = self.store.daily_completions.get((user_id, day), 0) + 1
+        self.store.daily_completions[(user_id, day)] = count
+        return count
+
+    async def record_completion(
+        self, user_id: str, quest_id: int, title: str, streak: int, completions_today: int, day: date
+    ) -> None:
+        leaderboard.update(quest_id, user_id, title, streak, day)
+        rival = next((r for r in self.store.user_rivals(user_id) if r["is_active"]), None)
+        if rival is None:
+            return
+        previous_level = rival["level"]
+        rival["experience"] += xp_for_completion(streak)
+        rival["level"] = level_for_experience(rival["experience"])
+        await self.publish(user_id, "rival.updated", {
+            "rival_id": rival["id"],
+            "level": rival["level"],
+            "experience": rival["experience"],
+            "leveled_up": rival["level"] > previous_level,
+        })
+
+    # Subscriptions
+    async def subscription_info(self, user_id: str) -> dict:
+        subscription = self.store.subscriptions.get(user_id)
+        if subscription is None:
+            return {
+                'is_premium': False,
+                'premium_until': None,
+                'daily_completion_limit': DEFAULT_DAILY_COMPLETION_LIMIT,
+                'max_rivals': DEFAULT_MAX_RIVALS
+            }
+        limit = subscription["daily_completion_limit"]
+        max_rivals = subscription["max_rivals"]
+        is_premium = subscription["status"] == "active" and subscription["end_date"] > now()
+        return {
+            'is_premium': is_premium,
+            'premium_until': subscription["end_date"] if is_premium else None,
+            'daily_completion_limit': DEFAULT_DAILY_COMPLETION_LIMIT if limit is None else limit,
+            'max_rivals': DEFAULT_MAX_RIVALS if max_rivals is None else max_rivals
+        }
+
+    async def active_subscription(self, user_id: str) -> dict | None:
+        subscription = self.store.subscriptions.get(user_id)
+        if subscription is None or subscription["status"] != "active" or subscription["end_date"] <= now():
+            return None
+        return dict(subscription)
+
+    async def upsert_subscription(
+        self, user_id: str, subscription_type: str, start_date: datetime, end_date: datetime
+    ) -> None:
+        subscription = self.store.subscriptions.setdefault(user_id, {
+            "user_id": user_id,
+            "auto_renew": False,
+            "daily_completion_limit": None,
+            "max_rivals": None,
+            "created_at": now(),
+        })
+        subscription.update({
+            "subscription_type": subscription_type,
+            "status": "active",
+            # Naive datetimes are local time, as Postgres reads them for timestamptz
+            "start_date": start_date.astimezone(timezone.utc),
+            "end_date": end_date.astimezone(timezone.utc),
+            "updated_at": now(),
+        })
+
+    # Rivals
+    async def list_rivals(self, user_id: str) -> list[dict]:
+        return [dict(rival) for rival in self.store.user_rivals(user_id)]
+
+    async def active_rival(self, user_id: str) -> dict | None:
+        rival = next((r for r in self.store.user_rivals(user_id) if r["is_active"]), None)
+        return dict(rival) if rival is not None else None
+
+    async def count_rivals(self, user_id: str) -> int:
+        return len(self.store.rivals_by_user.get(user_id, []))
+
+    async def create_rival(
+        self,
+        user_id: str,
+        name: str,
+        archetype: str,
+        taunt: str,
+        personality_type: str,
+        rival_order: int,
+        is_active: bool,
+    ) -> dict:
+        rival = {
+            "id": next(self.store.rival_ids),
+            "user_id": user_id,
+            "name": name,
+            "archetype": archetype,
+            "taunt": taunt,
+            "personality_type": personality_type,
+            "level": 1,
+            "experience": 0,
+            "rival_order": rival_order,
+            "is_active": is_active,
+            "created_at": now(),
+        }
+        self.store.rivals[rival["id"]] = rival
+        insort(self.store.rivals_by_user.setdefault(user_id, []), (rival_order, rival["id"]))
+        return dict(rival)
+
+    async def cached_persona(self, key: str) -> dict | None:
+        return await persona_cache.get(None, key)
+
+    async def store_persona(self, key: str, persona: dict) -> None:
+        await persona_cache.put(None, key, persona)
+
+    # Payments
+    async def create_payment(
+        self,
+        user_id: str,
+        reference: str,
+        amount: Decimal,
+        currency: str,
+        status: str,
+        payment_type: str,
+        metadata: dict,
+    ) -> None:
+        self.store.payments[reference] = {
+            "id": next(self.store.payment_ids),
+            "user_id": user_id,
+            "paystack_reference": reference,
+            "amount": amount,
+            "currency": currency,
+            "status": status,
+            "payment_type": payment_type,
+            "metadata": metadata,
+            "paystack_transaction_id": None,
+            "verified_at": None,
+            "webhook_received_at": None,
+            "created_at": now(),
+        }
+
+    async def update_payment_status(self, user_id: str, reference: str, status: str, transaction_id) -> None:
+        payment = self.store.payments.get(reference)
+        if payment is not None and payment["user_id"] == user_id:
+            payment.update(status=status, paystack_transaction_id=transaction_id, verified_at=now())
+
+    async def mark_payment_webhook_received(self, reference: str) -> None:
+        payment = self.store.payments.get(reference)
+        if payment is not None:
+            payment["webhook_received_at"] = now()
+
+    # Events
+    async def publish(self, user_id: str, event_type: str, data: dict | None = None) -> None:
+        live_hub.on_notification(encode_event(user_id, event_type, data))
+
+    async def broadcast_leaderboard(self, quest_id: int) -> None:
+        # Single process: the local leaderboard is the only one
+        pass
+
+    async def invalidate_responses(self, user_id: str, routes: list[str]) -> None:
+        await invalidate_responses(None, user_id, routes)
+
+
+class MemoryRepository(Repository):
+    name = "memory"
+    uses_postgres = False
+
+    def __init__(self):
+        self.store = MemoryStore()
+        # There is no database behind the persistent persona tier
+        persona_cache.persistent = False
+
+    async def open_session(self, read_only: bool = False, user_id: str | None = None) -> MemorySession:
+        return MemorySession(self.store, read_only)
+
+    async def close_session(self, session: MemorySession) -> None:
+        pass
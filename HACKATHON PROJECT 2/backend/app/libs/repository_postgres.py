@@ -0,0 +1,377 @@
+"""Postgres implementation of the repository, on the pooled asyncpg connections.
+
+Each session holds one connection from `app.libs.database`, so the routing
+(replica for read-only sessions, read-your-writes pinning) is unchanged.
+`session.conn` stays available for the Postgres-only features.
+
+The side effects of a completion (leaderboard, rival reaction) and of a
+subscription change (entitlement and response cache eviction in every worker)
+are enqueued to the outbox in the write's transaction, so they run once it
+commits, even if this worker dies right after.
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import ClassVar
+
+from app.libs.database import POOL_MIN_SIZE, get_db_connection, has_replica, release_db_connection
+from app.libs.entitlements import get_user_subscription_info, invalidate_entitlements
+from app.libs.leaderboard import leaderboard
+from app.libs.live_updates import publish
+from app.libs.outbox import OutboxTask, enqueue, ensure_schema as ensure_outbox_schema, task_handler
+from app.libs.persona_cache import persona_cache
+from app.libs.quest_history import ensure_schema as ensure_history_schema, get_streaks, get_year_bitmaps, mark_completed
+from app.libs.response_cache import SUBSCRIPTION_ROUTES, invalidate_responses
+from app.libs.repository import Repository, Session
+from app.libs.rival_interactions import CompletionEvent, interaction_engine
+from app.libs.rival_xp import ensure_schema as ensure_xp_schema, record_completion
+
+# Matches no rows; only used to run the read queries once during warm-up
+WARM_UP_USER_ID = ""
+
+RIVAL_COLUMNS = """
+    id, user_id, name, archetype, taunt, personality_type,
+    level, experience, rival_order, is_active, created_at
+"""
+
+
+class CompletionRecorded(OutboxTask):
+    task_type: ClassVar[str] = "quests.completion_recorded"
+    user_id: str
+    quest_id: int
+    title: str
+    streak: int
+    completions_today: int
+    day: date
+
+
+@task_handler(CompletionRecorded)
+async def apply_completion(conn, task: CompletionRecorded) -> None:
+    """Push the quest's new streak to every worker's leaderboard and queue the rival's reaction"""
+    leaderboard.update(task.quest_id, task.user_id, task.title, task.streak, task.day)
+    await leaderboard.broadcast(conn, task.quest_id)
+    interaction_engine.submit(CompletionEvent(task.user_id, task.title, task.streak, task.completions_today))
+
+
+class SubscriptionChanged(OutboxTask):
+    task_type: ClassVar[str] = "payments.subscription_changed"
+    user_id: str
+
+
+@task_handler(SubscriptionChanged)
+async def evict_subscription_caches(conn, task: SubscriptionChanged) -> None:
+    """Drop the user's cached entitlements and subscription responses in every worker"""
+    await invalidate_entitlements(conn, task.user_id)
+    await invalidate_responses(conn, task.user_id, SUBSCRIPTION_ROUTES)
+
+
+class PostgresSession(Session):
+    def __init__(self, conn, read_only: bool):
+        self.conn = conn
+        self.read_only = read_only
+
+    @asynccontextmanager
+    async def transaction(self):
+        # DDL inside the transaction would roll back with it while the process-wide
+        # "schema ready" flags stay set, so the tables written to are created first
+        await ensure_history_schema(self.conn)
+        await ensure_xp_schema(self.conn)
+        await ensure_outbox_schema(self.conn)
+        async with self.conn.transaction():
+            yield
+
+    # Quests and completions
+    async def create_quest(self, user_id: str, title: str):
+        query = """
+        INSERT INTO quests (user_id, title)
+        VALUES ($1, $2)
+        RETURNING id, user_id, title, created_at
+        """
+        return await self.conn.fetchrow(query, user_id, title)
+
+    async def get_quest(self, user_id: str, quest_id: int):
+        query = """
+        SELECT id, user_id, title, created_at
+        FROM quests
+        WHERE id = $1 AND user_id = $2
+        """
+        return await self.conn.fetchrow(query, quest_id, user_id)
+
+    async def list_quests(self, user_id: str, today: date) -> list:
+        query = """
+        SELECT q.id, q.user_id, q.title, q.created_at,
+               EXISTS(
+                   SELECT 1 FROM quest_checks qc
+                   WHERE qc.quest_id = q.id AND qc.date = $2
+               ) as completed_today
+        FROM quests q
+        WHERE q.user_id = $1
+        ORDER BY q.created_at DESC
+        """
+        return await self.conn.fetch(query, user_id, today)
+
+    async def count_quests(self, user_id: str) -> int:
+        query = "SELECT COUNT(*) FROM quests WHERE user_id = $1"
+        return await self.conn.fetchval(query, user_id)
+
+    async def recent_quest_titles(self, user_id: str, limit: int) -> list[str]:
+        query = "SELECT title FROM quests WHERE user_id = $1 ORDER BY created_at DESC LIMIT $2"
+        return [row['title'] for row in await self.conn.fetch(query, user_id, limit)]
+
+    async def delete_quest(self, user_id: str, quest_id: int) -> int | None:
+        # Completions go with the quest (ON DELETE CASCADE)
+        query = """
+        DELETE FROM quests
+        WHERE id = $1 AND user_id = $2
+        RETURNING id
+        """
+        return await self.conn.fetchval(query, quest_id, user_id)
+
+    async def is_completed(self, quest_id: int, day: date) -> bool:
+        query = """
+        SELECT EXISTS(
+            SELECT 1 FROM quest_checks
+            WHERE quest_id = $1 AND date = $2
+        )
+        """
+        return await self.conn.fetchval(query, quest_id, day)
+
+    async def add_completion(self, quest_id: int, day: date):
+        query = """
+        INSERT INTO quest_checks (quest_id, date)
+        VALUES ($1, $2)
+        RETURNING id, quest_id, date, created_at
+        """
+        row = await self.conn.fetchrow(query, quest_id, day)
+        await mark_completed(self.conn, quest_id, day)
+        return row
+
+    async def current_streak(self, quest_id: int) -> int:
+        current_streak, _ = await get_streaks(self.conn, quest_id, read_only=self.read_only)
+        return current_streak
+
+    async def year_bitmaps(self, quest_id: int) -> dict[int, int]:
+        return await get_year_bitmaps(self.conn, quest_id, read_only=self.read_only)
+
+    async def daily_completions(self, user_id: str, day: date) -> int:
+        query = """
+        SELECT COALESCE(completion_count, 0)
+        FROM daily_completions
+        WHERE user_id = $1 AND date = $2
+        """
+        return await self.conn.fetchval(query, user_id, day) or 0
+
+    async def increment_daily_completions(self, user_id: str, day: date) -> int:
+        query = """
+        INSERT INTO daily_completions (user_id, date, completion_count, last_updated)
+        VALUES ($1, $2, 1, NOW())
+        ON CONFLICT (user_id, date)
+        DO UPDATE SET
+            completion_count = daily_completions.completion_count + 1,
+            last_updated = NOW()
+        RETURNING completion_count
+        """
+        return await self.conn.fetchval(query, user_id, day)
+
+    async def record_completion(
+        self, user_id: str, quest_id: int, title: str, streak: int, completions_today: int, day: date
+    ) -> None:
+        await record_completion(self.conn, user_id, quest_id, streak)
+        await enqueue(self.conn, CompletionRecorded(
+            user_id=user_id,
+            quest_id=quest_id,
+            title=title,
+            streak=streak,
+            completions_today=completions_today,
+            day=day,
+        ))
+
+    # Subscriptions
+    async def subscription_info(self, user_id: str) -> dict:
+        return await get_user_subscription_info(self.conn, user_id)
+
+    async def active_subscription(self, user_id: str):
+        query = """
+        SELECT subscription_type, status, start_date, end_date, auto_renew
+        FROM user_subscriptions
+        WHERE user_id = $1 AND status = 'active' AND end_date > NOW()
+        ORDER BY end_date DESC
+        LIMIT 1
+        """
+        return await self.conn.fetchrow(query, user_id)
+
+    async def upsert_subscription(
+        self, user_id: str, subscription_type: str, start_date: datetime, end_date: datetime
+    ) -> None:
+        await self.conn.execute(
+            """
+            INSERT INTO user_subscriptions (user_id, subscription_type, status, start_date, end_date)
+            VALUES ($1, $2, 'active', $3, $4)
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                subscription_type = $2,
+                status = 'active',
+                start_date = $3,
+                end_date = $4,
+                updated_at = NOW()
+            """,
+            user_id,
+            subscription_type,
+            start_date,
+            end_date
+        )
+        await enqueue(self.conn, SubscriptionChanged(user_id=user_id))
+
+    # Rivals
+    async def list_rivals(self, user_id: str) -> list:
+        query = f"""
+        SELECT {RIVAL_COLUMNS}
+        FROM rivals
+        WHERE user_id = $1
+        ORDER BY rival_order ASC
+        """
+        return await self.conn.fetch(query, user_id)
+
+    async def active_rival(self, user_id: str):
+        query = f"""
+        SELECT {RIVAL_COLUMNS}
+        FROM rivals
+        WHERE user_id = $1 AND is_active = true
+        ORDER BY rival_order ASC
+        LIMIT 1
+        """
+        return await self.conn.fetchrow(query, user_id)
+
+    async def count_rivals(self, user_id: str) -> int:
+        query = "SELECT COUNT(*) FROM rivals WHERE user_id = $1"
+        return await self.conn.fetchval(query, user_id)
+
+    async def create_rival(
+        self,
+        user_id: str,
+        name: str,
+        archetype: str,
+        taunt: str,
+        personality_type: str,
+        rival_order: int,
+        is_active: bool,
+    ):
+        query = f"""
+        INSERT INTO rivals (user_id, name, archetype, taunt, personality_type,
+                           level, experience, rival_order, is_active)
+        VALUES ($1, $2, $3, $4, $5, 1, 0, $6, $7)
+        RETURNING {RIVAL_COLUMNS}
+        """
+        return await self.conn.fetchrow(
+            query, user_id, name, archetype, taunt, personality_type, rival_order, is_active
+        )
+
+    async def cached_persona(self, key: str) -> dict | None:
+        return await persona_cache.get(self.conn, key)
+
+    async def store_persona(self, key: str, persona: dict) -> None:
+        await persona_cache.put(self.conn, key, persona)
+
+    # Payments
+    async def create_payment(
+        self,
+        user_id: str,
+        reference: str,
+        amount: Decimal,
+        currency: str,
+        status: str,
+        payment_type: str,
+        metadata: dict,
+    ) -> None:
+        await self.conn.execute(
+            """
+            INSERT INTO payments (user_id, paystack_reference, amount, currency, status, payment_type, metadata)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """,
+            user_id,
+            reference,
+            amount,
+            currency,
+            status,
+            payment_type,
+            json.dumps(metadata)
+        )
+
+    async def update_payment_status(self, user_id: str, reference: str, status: str, transaction_id) -> None:
+        await self.conn.execute(
+            """
+            UPDATE payments
+            SET status = $1, paystack_transaction_id = $2, verified_at = NOW()
+            WHERE paystack_reference = $3 AND user_id = $4
+            """,
+            status,
+            transaction_id,
+            reference,
+            user_id
+        )
+
+    async def mark_payment_webhook_received(self, reference: str) -> None:
+        await self.conn.execute(
+            """
+            UPDATE payments
+            SET webhook_received_at = NOW()
+            WHERE paystack_reference = $1
+            """,
+            reference
+        )
+
+    # Events
+    async def publish(self, user_id: str, event_type: str, data: dict | None = None) -> None:
+        await publish(self.conn, user_id, event_type, data)
+
+    async def broadcast_leaderboard(self, quest_id: int) -> None:
+        await leaderboard.broadcast(self.conn, quest_id)
+
+    async def invalidate_responses(self, user_id: str, routes: list[str]) -> None:
+        await invalidate_responses(self.conn, user_id, routes)
+
+
+class PostgresRepository(Repository):
+    name = "postgres"
+    uses_postgres = True
+
+    async def open_session(self, read_only: bool = False, user_id: str | None = None) -> PostgresSession:
+        conn = await get_db_connection(read_only=read_only, user_id=user_id)
+        return PostgresSession(conn, read_only)
+
+    async def close_session(self, session: PostgresSession) -> None:
+        await release_db_connection(session.conn)
+
+    async def warm_session(self, db: PostgresSession) -> None:
+        """Run the hot read queries once, so the connection has them prepared"""
+        today = date.today()
+        await db.list_quests(WARM_UP_USER_ID, today)
+        await db.get_quest(WARM_UP_USER_ID, 0)
+        await db.count_quests(WARM_UP_USER_ID)
+        await db.is_completed(0, today)
+        await db.daily_completions(WARM_UP_USER_ID, today)
+        await db.year_bitmaps(0)
+        await db.active_subscription(WARM_UP_USER_ID)
+        await db.list_rivals(WARM_UP_USER_ID)
+        await db.active_rival(WARM_UP_USER_ID)
+        await db.count_rivals(WARM_UP_USER_ID)
+
+    async def warm_up(self) -> None:
+        """Open the pools' idle connections and fill each one's statement cache.
+
+        asyncpg prepares and caches statements per connection, so all of the pool's
+        connections are held at once to warm each of them. Writes are left out since
+        they cannot run without side effects.
+        """
+        for read_only in ([False, True] if has_replica() else [False]):
+            sessions = []
+            try:
+                for _ in range(POOL_MIN_SIZE):
+                    sessions.append(await self.open_session(read_only=read_only))
+                await asyncio.gather(*(self.warm_session(db) for db in sessions))
+            finally:
+                for db in sessions:
+                    await self.close_session(db)
@@ -0,0 +1,244 @@
+"""Circuit breakers, deadlines and concurrency caps for calls to upstream services.
+
+Each upstream (Paystack, OpenAI) gets an `Upstream` with:
+
+- a circuit breaker: after `failure_threshold` consecutive failures it opens and
+  rejects calls immediately for `reset_seconds`, then lets one trial call through
+  (half-open) and closes again if it succeeds;
+- a concurrency cap: at most `max_concurrency` calls in flight, callers wait for a
+  slot only as long as their deadline allows;
+- a timeout: each call gets the smaller of the upstream's timeout and what is left
+  of the incoming request's deadline.
+
+The request deadline is set per request by `deadline_middleware` from the
+`X-Request-Timeout-Ms` header, or `REQUEST_DEADLINE_SECONDS` by default.
+Timeouts, concurrency limits and thresholds can be overridden per upstream with
+`<NAME>_TIMEOUT_SECONDS`, `<NAME>_MAX_CONCURRENCY`, `<NAME>_FAILURE_THRESHOLD` and
+`<NAME>_RESET_SECONDS`, e.g. `PAYSTACK_TIMEOUT_SECONDS=5`.
+
+Usage:
+
+    from app.libs.resilience import Upstream, UpstreamUnavailable
+
+    paystack = Upstream("paystack", timeout_seconds=10, max_concurrency=20)
+
+    # Blocking functions run in a thread and receive the call's `timeout`
+    response = await paystack.call(requests.get, url, headers=headers)
+
+    # Streams hold a slot for their whole duration
+    async with openai.guard() as slot:
+        stream = await client.chat.completions.create(..., timeout=slot.timeout)
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from app.libs.metrics import Counter, Gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "25"))
+
+CIRCUIT_STATE = Gauge("upstream_circuit_state", "Circuit breaker state by upstream (0 closed, 1 half-open, 2 open)")
+CALLS = Counter("upstream_calls_total", "Upstream calls by upstream and outcome")
+IN_FLIGHT = Gauge("upstream_in_flight", "Upstream calls in flight by upstream")
+
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that is failing, saturated or out of time"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float | None = None):
+        super().__init__(f"{upstream} unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def set_deadline(seconds: float | None) -> None:
+    """Set the deadline of the current request, `seconds` from now; None removes it"""
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def remaining_seconds() -> float | None:
+    """Time left before the current request's deadline, None when it has none"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+async def deadline_middleware(request, call_next):
+    """Start each request's deadline from its timeout header or the default budget"""
+    seconds = DEFAULT_DEADLINE_SECONDS
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            seconds = min(seconds, max(int(header), 0) / 1000)
+        except ValueError:
+            pass
+    set_deadline(seconds)
+    return await call_next(request)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED], upstream=name)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            print(f"Circuit for {self.name} is now {state}")
+        self.state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], upstream=self.name)
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_seconds - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; a half-open circuit admits one trial at a time"""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                return False
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def release_trial(self) -> None:
+        """End a half-open trial that finished without a verdict, e.g. it was cancelled"""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_in_flight = False
+        self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+@dataclass
+class CallSlot:
+    timeout: float
+    failed: bool = False
+
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        timeout_seconds: float = 10,
+        max_concurrency: int = 16,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30,
+        is_failure: Callable[[Any], bool] | None = None,
+    ):
+        """`is_failure` flags results that should count against the breaker, e.g. 5xx responses"""
+        prefix = name.upper()
+        self.name = name
+        self.timeout_seconds = float(os.environ.get(f"{prefix}_TIMEOUT_SECONDS", timeout_seconds))
+        self.max_concurrency = int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", max_concurrency))
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.environ.get(f"{prefix}_FAILURE_THRESHOLD", failure_threshold)),
+            reset_seconds=float(os.environ.get(f"{prefix}_RESET_SECONDS", reset_seconds)),
+        )
+        self.is_failure = is_failure
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._in_flight = 0
+
+    def budget(self) -> float:
+        """Timeout for a call made now: the upstream timeout capped by the request deadline"""
+        remaining = remaining_seconds()
+        if remaining is None:
+            return self.timeout_seconds
+        return min(self.timeout_seconds, remaining)
+
+    def _reject(self, outcome: str, reason: str, retry_after: float | None = None):
+        CALLS.inc(upstream=self.name, outcome=outcome)
+        return UpstreamUnavailable(self.name, reason, retry_after)
+
+    @asynccontextmanager
+    async def guard(self):
+        """Hold a slot for one call, yielding its `CallSlot`.
+
+        The call counts as a success when the block exits normally, unless the slot was
+        marked failed, and as a failure when it raises.
+        """
+        if not self.breaker.allow():
+            raise self._reject("rejected_open", "circuit open", self.breaker.retry_after())
+        try:
+            budget = self.budget()
+            if budget <= 0:
+                raise self._reject("rejected_deadline", "request deadline exceeded")
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=budget)
+            except TimeoutError:
+                raise self._reject("rejected_busy", "too many concurrent calls", 1)
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+        self._in_flight += 1
+        IN_FLIGHT.set(self._in_flight, upstream=self.name)
+        # The wait for a slot used up part of the budget
+        slot = CallSlot(timeout=max(self.budget(), 0.001))
+        try:
+            yield slot
+        except TimeoutError:
+            self.breaker.record_failure()
+            CALLS.inc(upstream=self.name, outcome="timeout")
+            raise UpstreamUnavailable(self.name, "timed out")
+        except Exception:
+            self.breaker.record_failure()
+            CALLS.inc(upstream=self.name, outcome="failure")
+            raise
+        else:
+            if slot.failed:
+                self.breaker.record_failure()
+                CALLS.inc(upstream=self.name, outcome="failure")
+            else:
+                self.breaker.record_success()
+                CALLS.inc(upstream=self.name, outcome="success")
+        finally:
+            self.breaker.release_trial()
+            self._in_flight -= 1
+            IN_FLIGHT.set(self._in_flight, upstream=self.name)
+            self._slots.release()
+
+    async def call(self, fn: Callable, *args, **kwargs):
+        """Run `fn(*args, timeout=..., **kwargs)`, in a thread unless it is a coroutine function"""
+        async with self.guard() as slot:
+            kwargs["timeout"] = slot.timeout
+            if asyncio.iscoroutinefunction(fn):
+                call = fn(*args, **kwargs)
+            else:
+                call = asyncio.to_thread(fn, *args, **kwargs)
+            result = await asyncio.wait_for(call, timeout=slot.timeout)
+            if self.is_failure is not None and self.is_failure(result):
+                slot.failed = True
+            return result
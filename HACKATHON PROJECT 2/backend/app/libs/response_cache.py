@@ -0,0 +1,110 @@
+"""Per-user cache of serialized read responses, evicted by the writes that change them.
+
+Clients poll `GET /quests/list`, `/rivals/list`, `/rivals/get` and
+`/payments/subscription-status`. Their JSON bodies are kept per route and user
+in a size-bounded LRU (`app.libs.cache`), so a repeat poll is a dict lookup.
+
+Entries expire at the next local midnight, since `completed_today`, streaks and
+`days_remaining` depend on the date, or earlier when the handler passes an
+`expires_at` (e.g. when a subscription lapses). Writes evict exactly the
+affected routes of the affected user, in every worker, through the cache bus.
+
+A read that was running while its key was invalidated does not store its
+response, since it may have read the data from before the write. Writes inside
+a transaction are covered too: the cache bus echoes the invalidation back to
+this worker when the transaction commits.
+
+Usage:
+
+    from app.libs.response_cache import QUESTS_LIST, invalidate_responses, response_cache
+
+    body = response_cache.lookup(QUESTS_LIST, user.sub)
+    if body is not None:
+        return Response(body, media_type="application/json")
+    token = response_cache.token()
+    response = ...
+    return response_cache.store(QUESTS_LIST, user.sub, response, token)
+
+    await invalidate_responses(conn, user.sub, [QUESTS_LIST])
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+
+from app.libs.cache import LocalCache
+from app.libs.cache_bus import cache_bus
+
+CACHE_NAME = "responses"
+MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "50000"))
+
+QUESTS_LIST = "quests.list"
+RIVALS_LIST = "rivals.list"
+RIVAL_GET = "rivals.get"
+SUBSCRIPTION_STATUS = "payments.subscription_status"
+
+# Routes whose responses include rivals, XP or entitlements
+RIVAL_ROUTES = [RIVALS_LIST, RIVAL_GET]
+SUBSCRIPTION_ROUTES = [SUBSCRIPTION_STATUS, QUESTS_LIST, RIVALS_LIST]
+
+
+def seconds_until(expires_at: datetime | None = None) -> float:
+    """Seconds until the next local midnight, or until expires_at if that is sooner"""
+    now = datetime.now().astimezone()
+    expiry = datetime.combine(date.today() + timedelta(days=1), time()).astimezone()
+    if expires_at is not None:
+        expiry = min(expiry, expires_at.astimezone())
+    return (expiry - now).total_seconds()
+
+
+class ResponseCache(LocalCache):
+    def __init__(self, name: str, max_entries: int):
+        super().__init__(name, max_entries=max_entries)
+        # Invalidation counter, and the counter value at each key's last invalidation
+        self._generation = 0
+        self._invalidated: dict[str, int] = {}
+        self._floor = 0
+
+    @staticmethod
+    def key(route: str, user_id: str) -> str:
+        return f"{route}:{user_id}"
+
+    def lookup(self, route: str, user_id: str) -> bytes | None:
+        return self.get(self.key(route, user_id))
+
+    def token(self) -> int:
+        """Take before reading the data of a response, and pass to store()"""
+        return self._generation
+
+    def store(self, route: str, user_id: str, response, token: int, expires_at: datetime | None = None):
+        """Cache the serialized response unless its key was invalidated since token; returns response"""
+        key = self.key(route, user_id)
+        if token < self._floor or self._invalidated.get(key, 0) > token:
+            return response
+        ttl = seconds_until(expires_at)
+        if ttl > 0:
+            self.set(key, response.model_dump_json().encode("utf-8"), ttl_seconds=ttl)
+        return response
+
+    def delete(self, key: str) -> None:
+        self._generation += 1
+        if len(self._invalidated) >= self.max_entries:
+            # Forget the per-key history; reads started before now are not stored
+            self._invalidated.clear()
+            self._floor = self._generation
+        self._invalidated[key] = self._generation
+        super().delete(key)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._invalidated.clear()
+        self._floor = self._generation
+        super().clear()
+
+
+response_cache = ResponseCache(CACHE_NAME, max_entries=MAX_ENTRIES)
+
+
+async def invalidate_responses(conn, user_id: str, routes: list[str]) -> None:
+    """Evict the user's cached responses of these routes in every worker (only this one when conn is None)"""
+    keys = [ResponseCache.key(route, user_id) for route in routes]
+    await cache_bus.invalidate(conn, CACHE_NAME, keys, echo=True)
@@ -0,0 +1,220 @@
+"""Rival reactions to quest completions, built off the request path.
+
+`complete_today` only submits a `CompletionEvent` to an in-process queue. A
+background worker drains the queue in batches, looks up each user's active
+rival, renders a reaction from the precompiled templates of the rival's
+personality and writes the batch to `rival_interactions`. When an `enrich`
+callable is given, each batch of rendered messages is passed through it (one
+LLM call per batch) before being stored; the template text is kept if that
+fails.
+
+Usage:
+
+    from app.libs.rival_interactions import CompletionEvent, interaction_engine
+
+    interaction_engine.submit(CompletionEvent(user_id, quest_title, streak, completions_today))
+"""
+
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import date
+from string import Template
+
+from app.libs.database import db_connection
+
+QUEUE_SIZE = 10_000
+BATCH_SIZE = 200
+BATCH_WINDOW_SECONDS = 0.5
+
+STREAK_MILESTONES = {3, 7, 14, 30, 50, 100, 365}
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rival_interactions (
+    id SERIAL PRIMARY KEY,
+    rival_id INTEGER NOT NULL REFERENCES rivals(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    interaction_type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    user_completions_today INTEGER NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS rival_interactions_rival_id_idx ON rival_interactions (rival_id, id DESC);
+"""
+
+# Placeholders: $rival, $quest, $streak, $user_count, $rival_count
+_RAW_TEMPLATES = {
+    "competitive": {
+        "milestone": ["$streak days on '$quest'? Fine. I'll just have to go harder.", "A $streak-day streak. Impressive... for now."],
+        "ahead": ["$user_count quests today vs my $rival_count. Enjoy the lead while it lasts.", "You're ahead. That won't happen twice."],
+        "behind": ["$rival_count to $user_count. Keep up if you can!", "Is that all? I've already cleared $rival_count today."],
+        "tied": ["$user_count each. Next quest decides it.", "Tied at $user_count. Not for long."],
+    },
+    "encouraging": {
+        "milestone": ["$streak days of '$quest'! I'm so proud to be your rival!", "Look at that $streak-day streak shine!"],
+        "ahead": ["$user_count quests today! You're leading us both forward.", "You're ahead of me, and I love to see it!"],
+        "behind": ["I'm at $rival_count, you're at $user_count. You've got this!", "One more quest and you're right with me!"],
+        "tied": ["$user_count and $user_count. What a team we make!", "Neck and neck! Let's both keep going."],
+    },
+    "mystical": {
+        "milestone": ["The runes foretold $streak days of '$quest'. They were right.", "$streak dawns of devotion. The stars take note."],
+        "ahead": ["$user_count trials passed this day. The omens bend toward you.", "Your path burns brighter than mine today."],
+        "behind": ["$rival_count seals broken on my side. The void awaits your answer.", "The oracle counts $user_count for you, $rival_count for me."],
+        "tied": ["Balance. $user_count and $user_count. The scales tremble.", "Our fates align at $user_count."],
+    },
+    "warrior": {
+        "milestone": ["$streak days holding the line on '$quest'. Honorable.", "A $streak-day campaign. You fight like a veteran."],
+        "ahead": ["$user_count battles won today. I salute you, for now.", "You took the field first. Well fought."],
+        "behind": ["My blade has fallen $rival_count times today. Yours only $user_count.", "Draw your sword. I lead $rival_count to $user_count."],
+        "tied": ["$user_count victories each. Let the next duel decide.", "Even at $user_count. Steel yourself."],
+    },
+    "trickster": {
+        "milestone": ["$streak days of '$quest'? Did you trick the calendar?", "A $streak-day streak! Suspicious. Very suspicious."],
+        "ahead": ["$user_count already? Who's been swapping my quest log?", "You're ahead? Must be a glitch. Surely."],
+        "behind": ["$rival_count for me, $user_count for you. Catch me if you can!", "Tick tock, $user_count quests won't win the day."],
+        "tied": ["$user_count all! Or is it? Count again.", "Tied at $user_count. Or am I one ahead? Hehe."],
+    },
+}
+
+TEMPLATES = {
+    personality: {kind: [Template(t) for t in texts] for kind, texts in kinds.items()}
+    for personality, kinds in _RAW_TEMPLATES.items()
+}
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the interactions table once per process"""
+    global _schema_ready
+    if not _schema_ready:
+        await conn.execute(SCHEMA_SQL)
+        _schema_ready = True
+
+
+@dataclass
+class CompletionEvent:
+    user_id: str
+    quest_title: str
+    streak: int
+    user_completions_today: int
+
+
+def rival_completions_today(rival_id: int, level: int, today: date) -> int:
+    """Deterministic daily pace of a rival, growing with its level"""
+    seed = hashlib.blake2b(f"{rival_id}:{today.isoformat()}".encode(), digest_size=2).digest()
+    return 1 + level // 2 + int.from_bytes(seed, "big") % 3
+
+
+def render_interaction(rival: dict, event: CompletionEvent, today: date) -> tuple[str, str]:
+    """Pick the interaction type and render its message, return (interaction_type, message)"""
+    rival_count = rival_completions_today(rival["id"], rival["level"], today)
+    if event.streak in STREAK_MILESTONES:
+        kind = "milestone"
+    elif event.user_completions_today > rival_count:
+        kind = "ahead"
+    elif event.user_completions_today < rival_count:
+        kind = "behind"
+    else:
+        kind = "tied"
+
+    templates = TEMPLATES.get(rival["personality_type"], TEMPLATES["competitive"])[kind]
+    template = templates[(event.user_completions_today + event.streak) % len(templates)]
+    message = template.safe_substitute(
+        rival=rival["name"],
+        quest=event.quest_title[:60],
+        streak=event.streak,
+        user_count=event.user_completions_today,
+        rival_count=rival_count,
+    )
+    return kind, message
+
+
+class InteractionEngine:
+    def __init__(self):
+        self._queue: asyncio.Queue[CompletionEvent] = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._task: asyncio.Task | None = None
+
+    def submit(self, event: CompletionEvent) -> None:
+        """Queue a completion for the background worker, never blocks"""
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            print("Rival interaction queue full, dropping event")
+
+    async def _next_batch(self) -> list[CompletionEvent]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + BATCH_WINDOW_SECONDS
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def process_batch(self, conn, batch: list[CompletionEvent], enrich=None) -> int:
+        """Render and store the interactions for a batch, return how many were written"""
+        await ensure_schema(conn)
+
+        rival_rows = await conn.fetch(
+            """
+            SELECT DISTINCT ON (user_id) id, user_id, name, personality_type, level
+            FROM rivals
+            WHERE user_id = ANY($1::text[]) AND is_active = true
+            ORDER BY user_id, rival_order ASC
+            """,
+            list({event.user_id for event in batch}),
+        )
+        rivals = {row["user_id"]: row for row in rival_rows}
+
+        today = date.today()
+        records = []
+        for event in batch:
+            rival = rivals.get(event.user_id)
+            if rival is None:
+                continue
+            kind, message = render_interaction(rival, event, today)
+            records.append([rival["id"], event.user_id, kind, message, event.user_completions_today])
+
+        if records and enrich is not None:
+            try:
+                messages = await enrich([(rivals[r[1]], r[3]) for r in records])
+                for record, message in zip(records, messages):
+                    if message:
+                        record[3] = message[:200]
+            except Exception as e:
+                print(f"Rival interaction enrichment failed: {e}")
+
+        if records:
+            await conn.executemany(
+                """
+                INSERT INTO rival_interactions (rival_id, user_id, interaction_type, message, user_completions_today)
+                VALUES ($1, $2, $3, $4, $5)
+                """,
+                records,
+            )
+        return len(records)
+
+    async def _run(self, enrich) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                async with db_connection() as conn:
+                    await self.process_batch(conn, batch, enrich)
+            except Exception as e:
+                print(f"Rival interaction batch of {len(batch)} failed: {e}")
+
+    def start(self, enrich=None) -> None:
+        self._task = asyncio.create_task(self._run(enrich))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+interaction_engine = InteractionEngine()
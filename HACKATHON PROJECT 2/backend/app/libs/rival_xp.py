@@ -0,0 +1,182 @@
+"""Rival XP and leveling driven by quest completions.
+
+A completion appends one row to the `rival_xp_events` table in the
+completion's transaction, so the XP is stored if and only if the completion
+is, and an idempotent replay of the request finds both already there. A NOTIFY sent with
+the row wakes the consumers once that transaction commits. A background
+consumer drains the log in batches. It sums the XP per user and adds it to each
+user's active rival with one UPDATE per batch, recomputing the level. The batch
+is deleted in the same transaction, so after a crash or restart every event is
+applied exactly once. Several workers can consume at the same time (`FOR UPDATE
+SKIP LOCKED`). XP earned while a user has no active rival is dropped.
+
+Usage:
+
+    from app.libs.rival_xp import record_completion
+
+    async with conn.transaction():
+        ...  # the completion's writes
+        await record_completion(conn, user.sub, quest_id, streak)
+"""
+
+import asyncio
+
+from app.libs.database import connect_direct, db_connection
+from app.libs.live_updates import publish
+from app.libs.pg_listener import pg_listener
+from app.libs.response_cache import RIVAL_ROUTES, invalidate_responses
+
+BATCH_SIZE = 1000
+BATCH_WINDOW_SECONDS = 0.5
+POLL_INTERVAL_SECONDS = 5
+CHANNEL = "rival_xp"
+
+XP_PER_COMPLETION = 10
+MAX_STREAK_BONUS = 10
+XP_PER_LEVEL = 100
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rival_xp_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    quest_id INTEGER NOT NULL,
+    xp INTEGER NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+_schema_ready = False
+
+
+async def ensure_schema(conn) -> None:
+    """Create the XP event log on first use"""
+    global _schema_ready
+    if not _schema_ready:
+        await conn.execute(SCHEMA_SQL)
+        # Inside the caller's transaction the table only exists once that commits
+        _schema_ready = not conn.is_in_transaction()
+
+
+def xp_for_completion(streak: int) -> int:
+    """Base XP plus one per streak day, capped"""
+    return XP_PER_COMPLETION + min(max(streak, 0), MAX_STREAK_BONUS)
+
+
+def level_for_experience(experience: int) -> int:
+    return 1 + experience // XP_PER_LEVEL
+
+
+async def record_completion(conn, user_id: str, quest_id: int, streak: int) -> None:
+    """Append the XP of a quest completion for the consumer to apply, in the completion's transaction"""
+    await ensure_schema(conn)
+    await conn.execute(
+        "INSERT INTO rival_xp_events (user_id, quest_id, xp) VALUES ($1, $2, $3)",
+        user_id,
+        quest_id,
+        xp_for_completion(streak),
+    )
+    # Delivered on commit, when the consumers can see the event
+    await conn.execute("SELECT pg_notify($1, '')", CHANNEL)
+
+
+class RivalXpEngine:
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._registered = False
+
+    def wake(self, _payload: str = "") -> None:
+        self._wakeup.set()
+
+    async def apply_batch(self, conn) -> int:
+        """Apply up to BATCH_SIZE pending events, return how many were consumed"""
+        await ensure_schema(conn)
+        async with conn.transaction():
+            events = await conn.fetch(
+                """
+                DELETE FROM rival_xp_events
+                WHERE id IN (
+                    SELECT id FROM rival_xp_events
+                    ORDER BY id
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING user_id, xp
+                """,
+                BATCH_SIZE,
+            )
+            if not events:
+                return 0
+
+            totals: dict[str, int] = {}
+            for event in events:
+                totals[event["user_id"]] = totals.get(event["user_id"], 0) + event["xp"]
+
+            rows = await conn.fetch(
+                """
+                WITH gains AS (
+                    SELECT r.id, g.xp
+                    FROM unnest($1::text[], $2::int[]) AS g(user_id, xp)
+                    JOIN LATERAL (
+                        SELECT id FROM rivals
+                        WHERE user_id = g.user_id AND is_active = true
+                        ORDER BY rival_order ASC
+                        LIMIT 1
+                    ) r ON true
+                )
+                UPDATE rivals
+                SET experience = rivals.experience + gains.xp,
+                    level = 1 + (rivals.experience + gains.xp) / $3
+                FROM gains
+                WHERE rivals.id = gains.id
+                RETURNING rivals.id, rivals.user_id, rivals.level, rivals.experience, gains.xp
+                """,
+                list(totals),
+                list(totals.values()),
+                XP_PER_LEVEL,
+            )
+            for row in rows:
+                previous_level = level_for_experience(row["experience"] - row["xp"])
+                await publish(conn, row["user_id"], "rival.updated", {
+                    "rival_id": row["id"],
+                    "level": row["level"],
+                    "experience": row["experience"],
+                    "leveled_up": row["level"] > previous_level,
+                })
+                await invalidate_responses(conn, row["user_id"], RIVAL_ROUTES)
+        return len(events)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                # Let completions arriving close together share a batch
+                await asyncio.sleep(BATCH_WINDOW_SECONDS)
+            self._wakeup.clear()
+            try:
+                async with db_connection() as conn:
+                    # Drain everything pending, including events left over from a restart
+                    while await self.apply_batch(conn) == BATCH_SIZE:
+                        pass
+            except Exception as e:
+                print(f"Rival XP batch failed: {e}")
+
+    async def start(self) -> None:
+        """Start consuming; pair with stop()"""
+        if not self._registered:
+            pg_listener.add_listener(CHANNEL, self.wake)
+            self._registered = True
+        await pg_listener.start(connect_direct)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await pg_listener.stop()
+
+
+rival_xp_engine = RivalXpEngine()
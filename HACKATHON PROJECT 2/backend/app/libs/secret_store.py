@@ -0,0 +1,180 @@
+"""Cached secrets, loaded once and refreshed in the background.
+
+Secrets are read from a backend chosen by `SECRETS_BACKEND`:
+
+- `databutton` (default): `db.secrets`
+- `env`: environment variables
+- `file`: a JSON object of name -> value at `SECRETS_FILE` (default `secrets.json`)
+
+Values are cached in memory. `start()` loads the known keys and re-reads them every
+`SECRETS_REFRESH_SECONDS` (default 300) and on SIGHUP. Objects built from a secret
+(headers, key bytes, clients, pools) go through `derived()` or `on_change()` so they
+are rebuilt only when the value actually changes.
+
+Usage:
+
+    from app.libs.secret_store import secret_store
+
+    api_key = secret_store.get("OPENAI_API_KEY")
+    openai_client = secret_store.derived("OPENAI_API_KEY", lambda key: OpenAI(api_key=key))
+    client = openai_client.get()  # None while the secret is not set
+"""
+
+import asyncio
+import json
+import os
+import signal
+from typing import Any, Callable
+
+import databutton as db
+
+from app.env import Mode, mode
+
+# Secrets of the deployed service end in _PROD, those of the workspace in _DEV
+ENV_SUFFIX = "PROD" if mode == Mode.PROD else "DEV"
+
+KNOWN_SECRETS = [
+    f"DATABASE_URL_ADMIN_{ENV_SUFFIX}",
+    f"DATABASE_URL_REPLICA_{ENV_SUFFIX}",
+    "PAYSTACK_SECRET_KEY",
+    "OPENAI_API_KEY",
+    "PROFILING_TOKEN",
+]
+
+REFRESH_SECONDS = float(os.environ.get("SECRETS_REFRESH_SECONDS", "300"))
+
+
+class DatabuttonBackend:
+    def get(self, name: str) -> str | None:
+        try:
+            return db.secrets.get(name) or None
+        except Exception:
+            return None
+
+
+class EnvBackend:
+    def get(self, name: str) -> str | None:
+        return os.environ.get(name) or None
+
+
+class FileBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self._values: dict[str, str] = {}
+        self._mtime: float | None = None
+
+    def get(self, name: str) -> str | None:
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    self._values = json.load(f)
+                self._mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"Failed to read secrets file {self.path}: {e}")
+        return self._values.get(name) or None
+
+
+def backend_from_env():
+    kind = os.environ.get("SECRETS_BACKEND", "databutton")
+    if kind == "env":
+        return EnvBackend()
+    if kind == "file":
+        return FileBackend(os.environ.get("SECRETS_FILE", "secrets.json"))
+    return DatabuttonBackend()
+
+
+class Derived:
+    """An object built from a secret, rebuilt when the secret's value changes"""
+
+    def __init__(self, store: "SecretStore", name: str, build: Callable[[str], Any]):
+        self.store = store
+        self.name = name
+        self.build = build
+        self._value: str | None = None
+        self._result: Any = None
+
+    def get(self) -> Any:
+        value = self.store.get(self.name)
+        if value is None:
+            return None
+        if value != self._value:
+            self._result = self.build(value)
+            self._value = value
+        return self._result
+
+
+class SecretStore:
+    def __init__(self, backend=None):
+        self.backend = backend or backend_from_env()
+        self._values: dict[str, str | None] = {}
+        self._callbacks: dict[str, list[Callable[[str | None], None]]] = {}
+        self._task: asyncio.Task | None = None
+
+    def get(self, name: str) -> str | None:
+        """Cached value of a secret; the first read of a key not loaded at startup goes to the backend"""
+        if name not in self._values:
+            self._values[name] = self.backend.get(name)
+        return self._values[name]
+
+    def derived(self, name: str, build: Callable[[str], Any]) -> Derived:
+        return Derived(self, name, build)
+
+    def on_change(self, name: str, callback: Callable[[str | None], None]) -> None:
+        """Call `callback(new_value)` whenever a refresh finds a new value for the secret"""
+        self._callbacks.setdefault(name, []).append(callback)
+
+    async def refresh(self) -> list[str]:
+        """Re-read every known secret, return the names whose value changed"""
+        names = list(dict.fromkeys(KNOWN_SECRETS + list(self._values)))
+        values = await asyncio.to_thread(lambda: {name: self.backend.get(name) for name in names})
+        changed = []
+        for name, value in values.items():
+            loaded = name in self._values
+            if loaded and self._values[name] == value:
+                continue
+            self._values[name] = value
+            if loaded:
+                changed.append(name)
+                for callback in self._callbacks.get(name, []):
+                    try:
+                        callback(value)
+                    except Exception as e:
+                        print(f"Secret change handler for {name} failed: {e}")
+        if changed:
+            print(f"Secrets changed: {', '.join(changed)}")
+        return changed
+
+    def refresh_soon(self) -> None:
+        asyncio.get_running_loop().create_task(self.refresh())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(REFRESH_SECONDS)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Secrets refresh failed: {e}")
+
+    async def start(self) -> None:
+        """Load the known secrets and keep them fresh until stop()"""
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.refresh_soon)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # No signal support here (e.g. Windows or not the main thread)
+                pass
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            try:
+                asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass
+
+
+secret_store = SecretStore()
@@ -0,0 +1,67 @@
+"""Helpers for streaming responses: Server-Sent Event framing and incremental JSON.
+
+Usage:
+
+    from app.libs.streaming import JsonObjectScanner, sse_event
+
+    scanner = JsonObjectScanner()
+    for chunk in chunks:
+        yield sse_event("token", {"text": chunk})
+        obj = scanner.feed(chunk)
+        if obj is not None:
+            ...
+"""
+
+import json
+
+
+def sse_event(event: str, data) -> str:
+    """Frame one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class JsonObjectScanner:
+    """Finds the end of the first top-level JSON object in a stream of text chunks.
+
+    Characters before the opening brace (e.g. a markdown fence) are ignored.
+    Braces inside strings and escaped quotes are handled, so the object is
+    parsed exactly once, as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self._buffer: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.done = False
+
+    def feed(self, chunk: str) -> dict | None:
+        """Consume a chunk, return the parsed object once it is complete"""
+        if self.done:
+            return None
+        for char in chunk:
+            if self._depth == 0:
+                if char != "{":
+                    continue
+                self._depth = 1
+                self._buffer.append(char)
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    return json.loads("".join(self._buffer))
+        return None
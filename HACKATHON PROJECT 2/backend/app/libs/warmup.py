@@ -0,0 +1,98 @@
+"""Startup warm-up and readiness.
+
+Subsystems register warm-up steps, and the app lifespan runs them all
+concurrently before the worker reports ready. Each step initializes something
+that would otherwise be created lazily by the first request: the JWKS keys,
+the database pools and their statement caches, and the OpenAI and Paystack
+clients.
+
+`/readyz` returns 200 only once every required step has succeeded, so the load
+balancer sends traffic to warm workers only. It goes back to 503 on shutdown so
+the worker is drained first. Required steps that fail are retried in the
+background with backoff. Optional steps, such as clients whose secret may not
+be set, never hold readiness back. `/healthz` only says that the process is up.
+
+Usage:
+
+    from app.libs.warmup import readiness
+
+    readiness.add_step("openai", warm_openai_clients, required=False)
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable
+
+from app.libs.metrics import Gauge
+
+STEP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_STEP_TIMEOUT_SECONDS", "10"))
+RETRY_DELAY_SECONDS = 1
+MAX_RETRY_DELAY_SECONDS = 30
+
+READY = Gauge("worker_ready", "1 once the worker has warmed up and accepts traffic")
+
+
+class Readiness:
+    def __init__(self):
+        self._steps: dict[str, tuple[Callable[[], Awaitable[None]], bool]] = {}
+        self._status: dict[str, str] = {}
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def add_step(self, name: str, warm: Callable[[], Awaitable[None]], required: bool = True) -> None:
+        """Register a warm-up coroutine function; required steps gate readiness"""
+        self._steps[name] = (warm, required)
+        self._status[name] = "pending"
+
+    def is_ready(self) -> bool:
+        if self._stopping:
+            return False
+        return all(self._status[name] == "ok" for name, (_, required) in self._steps.items() if required)
+
+    def report(self) -> dict:
+        return {"ready": self.is_ready(), "steps": dict(self._status)}
+
+    async def _run_step(self, name: str) -> bool:
+        warm, _ = self._steps[name]
+        try:
+            await asyncio.wait_for(warm(), STEP_TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e!r}")
+            self._status[name] = f"failed: {e!r}"[:200]
+            return False
+        self._status[name] = "ok"
+        return True
+
+    async def _retry(self, names: list[str]) -> None:
+        delay = RETRY_DELAY_SECONDS
+        while names:
+            await asyncio.sleep(delay)
+            results = await asyncio.gather(*(self._run_step(name) for name in names))
+            names = [name for name, ok in zip(names, results) if not ok]
+            delay = min(delay * 2, MAX_RETRY_DELAY_SECONDS)
+            READY.set(1 if self.is_ready() else 0)
+
+    async def start(self) -> None:
+        """Run every step once, then keep retrying the required ones that failed"""
+        self._stopping = False
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        names = list(self._steps)
+        results = await asyncio.gather(*(self._run_step(name) for name in names))
+        READY.set(1 if self.is_ready() else 0)
+        print(f"Warm-up finished in {loop.time() - started:.2f}s: {self._status}")
+
+        failed = [name for name, ok in zip(names, results) if not ok and self._steps[name][1]]
+        if failed:
+            self._task = asyncio.create_task(self._retry(failed))
+
+    def stop(self) -> None:
+        """Report not ready from now on, e.g. while shutting down"""
+        self._stopping = True
+        READY.set(0)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+readiness = Readiness()
@@ -0,0 +1,169 @@
+"""Benchmark of Repository.run_concurrently against running a handler's queries in sequence.
+
+Each scenario runs the queries of one request either one after another in a
+single session, or through `run_concurrently` with one session per query. It
+does this at several levels of concurrent requests and reports latency and
+throughput.
+
+Modes:
+
+- `simulated`: sessions come from a pool of `POOL_MAX_SIZE` slots and every
+  query takes `BENCH_QUERY_MS` (default 5). The cost of fan-out when the pool is
+  the bottleneck shows up without a database. Runs the list_quests shape
+  (3 queries) and the full dashboard shape (6 queries), each with the default
+  MAX_FAN_OUT cap and uncapped.
+- `postgres`: the three queries of GET /quests/list through the Postgres
+  repository, for a throwaway user with 20 quests that is deleted afterwards.
+
+Run from backend/:
+
+    python -m bench.concurrency_bench simulated
+    SECRETS_BACKEND=env REPOSITORY_BACKEND=postgres DATABASE_URL_ADMIN_DEV=postgresql://... \\
+        python -m bench.concurrency_bench postgres
+
+Results are in bench/README.md.
+"""
+
+import asyncio
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import date
+
+from app.libs import repository as repository_module
+from app.libs.database import POOL_MAX_SIZE
+from app.libs.repository import Repository
+
+QUERY_SECONDS = float(os.environ.get("BENCH_QUERY_MS", "5")) / 1000
+CONCURRENCY = [1, 10, 50]
+REQUESTS_PER_LEVEL = 500
+
+
+class SimulatedSession:
+    async def query(self):
+        await asyncio.sleep(QUERY_SECONDS)
+
+
+class SimulatedRepository(Repository):
+    """Sessions wait for one of POOL_MAX_SIZE slots, like pooled connections"""
+
+    def __init__(self):
+        self.pool = asyncio.Semaphore(POOL_MAX_SIZE)
+
+    async def open_session(self, read_only: bool = False, user_id: str | None = None):
+        await self.pool.acquire()
+        return SimulatedSession()
+
+    async def close_session(self, session) -> None:
+        self.pool.release()
+
+
+async def handle(repo: Repository, concurrent: bool, queries: list, user_id: str) -> list:
+    if concurrent:
+        return await repo.run_concurrently(*queries, user_id=user_id)
+    async with repo.session(read_only=True, user_id=user_id) as db:
+        return [await query(db) for query in queries]
+
+
+async def load(repo: Repository, concurrent: bool, queries: list, user_id: str, concurrency: int) -> dict:
+    """REQUESTS_PER_LEVEL requests from `concurrency` clients that each send one at a time"""
+    latencies = []
+    remaining = REQUESTS_PER_LEVEL
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await handle(repo, concurrent, queries, user_id)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "rps": len(latencies) / elapsed,
+    }
+
+
+def print_header(title: str) -> None:
+    print(title)
+    print("| scenario                          | clients | p50 ms | p95 ms |  req/s |")
+    print("|-----------------------------------|---------|--------|--------|--------|")
+
+
+def print_row(label: str, concurrency: int, result: dict) -> None:
+    print(
+        f"| {label:<33} | {concurrency:>7} | {result['p50'] * 1000:6.1f} | "
+        f"{result['p95'] * 1000:6.1f} | {result['rps']:6.0f} |"
+    )
+
+
+async def run_scenarios(repo: Repository, name: str, queries: list, user_id: str, caps: list) -> None:
+    for concurrency in CONCURRENCY:
+        await handle(repo, True, queries, user_id)  # warm up
+        print_row(f"{name} sequential", concurrency, await load(repo, False, queries, user_id, concurrency))
+        for cap_name, cap in caps:
+            repository_module.MAX_FAN_OUT = cap
+            result = await load(repo, True, queries, user_id, concurrency)
+            print_row(f"{name} concurrent{cap_name}", concurrency, result)
+
+
+async def bench_simulated() -> None:
+    default_cap = repository_module.MAX_FAN_OUT
+    print(f"Python {platform.python_version()}, pool of {POOL_MAX_SIZE}, {QUERY_SECONDS * 1000:g}ms per query")
+    print_header(f"Simulated sessions, MAX_FAN_OUT={default_cap}")
+    repo = SimulatedRepository()
+    for name, count in [("list (3)", 3), ("dashboard (6)", 6)]:
+        queries = [lambda db: db.query()] * count
+        caps = [("", default_cap)] if count <= default_cap else [(" capped", default_cap), (" uncapped", count)]
+        await run_scenarios(repo, name, queries, "bench", caps)
+    repository_module.MAX_FAN_OUT = default_cap
+
+
+async def bench_postgres() -> None:
+    from app.apis.quests import load_user_quests
+    from app.libs.database import close_pools, connect_direct
+    from app.libs.repository import repository
+
+    user_id = f"bench-concurrency-{uuid.uuid4().hex[:8]}"
+    today = date.today()
+    async with repository.session(user_id=user_id) as db:
+        for i in range(20):
+            await db.create_quest(user_id, f"Benchmark quest {i}")
+
+    queries = [
+        lambda db: db.subscription_info(user_id),
+        lambda db: db.daily_completions(user_id, today),
+        lambda db: load_user_quests(db, user_id, today),
+    ]
+    try:
+        print(f"Python {platform.python_version()}, pool of {POOL_MAX_SIZE}")
+        print_header(f"GET /quests/list queries on Postgres, MAX_FAN_OUT={repository_module.MAX_FAN_OUT}")
+        await run_scenarios(repository, "list (3)", queries, user_id, [("", repository_module.MAX_FAN_OUT)])
+    finally:
+        conn = await connect_direct()
+        try:
+            await conn.execute("DELETE FROM quests WHERE user_id = $1", user_id)
+        finally:
+            await conn.close()
+        await close_pools()
+
+
+async def main(command: str) -> None:
+    if command == "simulated":
+        await bench_simulated()
+    elif command == "postgres":
+        await bench_postgres()
+    else:
+        raise SystemExit(f"Unknown command {command}, expected simulated or postgres")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "simulated"))
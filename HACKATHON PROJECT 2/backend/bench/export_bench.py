@@ -0,0 +1,195 @@
+"""Benchmark of the quest history export for a user with 100k completions.
+
+Modes:
+
+- `encode`: feeds synthetic rows through `encode_export`, the chunking and gzip
+  stage of GET /quests/export, with no database. Measures throughput, body
+  size and peak Python memory. A buffered export (all rows in memory, then
+  formatted at once) is measured next to it for comparison.
+- `postgres`: imports the completions for a throwaway user through
+  POST /quests/import, then downloads GET /quests/export through the app, reading
+  from the database configured for the primary. The user's quests are deleted
+  afterwards.
+
+Run from backend/:
+
+    python -m bench.export_bench encode [rows]
+    SECRETS_BACKEND=env REPOSITORY_BACKEND=postgres DATABASE_URL_ADMIN_DEV=postgresql://... \\
+        python -m bench.export_bench postgres [rows]
+
+Results are in bench/README.md.
+"""
+
+import asyncio
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import uuid
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from app.apis.quests import encode_export, format_export_rows
+
+DEFAULT_ROWS = 100_000
+QUESTS = 100
+REPEATS = 3
+FORMATS = [("ndjson", False), ("ndjson", True), ("csv", False), ("csv", True)]
+
+
+def synthetic_rows(count: int):
+    """Rows shaped like the export query's: QUESTS quests with count // QUESTS completed days each"""
+    days = count // QUESTS
+    start = date.today() - timedelta(days=days)
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for quest_id in range(1, QUESTS + 1):
+        title = f"Benchmark quest {quest_id}"
+        for day in range(days):
+            completed = start + timedelta(days=day)
+            yield {
+                "quest_id": quest_id,
+                "title": title,
+                "quest_created_at": created,
+                "date": completed,
+                "completed_at": datetime.combine(completed, datetime.min.time(), timezone.utc),
+            }
+
+
+async def aiter_rows(count: int):
+    for row in synthetic_rows(count):
+        yield row
+
+
+async def drain(chunks) -> tuple[int, int, float]:
+    """(body bytes, chunks, seconds to the first chunk) of a streamed body"""
+    started = time.perf_counter()
+    first = None
+    size = count = 0
+    async for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+        count += 1
+    return size, count, first or 0.0
+
+
+async def buffered(count: int, format: str, gzip: bool):
+    """The non-streaming alternative: fetch every row, then build one body"""
+    rows = [row async for row in aiter_rows(count)]
+    body = format_export_rows(rows, format).encode("utf-8")
+    if gzip:
+        compressor = zlib.compressobj(wbits=31)
+        body = compressor.compress(body) + compressor.flush()
+    yield body
+
+
+def measure(make_chunks) -> dict:
+    """Best of REPEATS timed runs, then one run under tracemalloc for the peak"""
+    runs = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        size, chunks, first = asyncio.run(drain(make_chunks()))
+        runs.append((time.perf_counter() - started, first))
+    seconds, first = min(runs)
+
+    tracemalloc.start()
+    asyncio.run(drain(make_chunks()))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "first": first, "bytes": size, "chunks": chunks, "peak": peak}
+
+
+def print_row(label: str, rows: int, result: dict) -> None:
+    print(
+        f"| {label:<22} | {result['seconds']:7.2f} | {rows / result['seconds']:9,.0f} | "
+        f"{result['first'] * 1000:8.1f} | {result['bytes'] / 1e6:8.2f} | {result['peak'] / 1e6:8.2f} |"
+    )
+
+
+def print_header() -> None:
+    print(f"Python {platform.python_version()} on {platform.machine()}, {os.cpu_count()} CPUs")
+    print("| export                 | seconds |   rows/s  | first ms | body MB  | peak MB  |")
+    print("|------------------------|---------|-----------|----------|----------|----------|")
+
+
+def bench_encode(rows: int) -> None:
+    print(f"encode_export, {rows:,} synthetic rows")
+    print_header()
+    for format, gzip in FORMATS:
+        label = format + (" gzip" if gzip else "")
+        print_row(f"{label} streamed", rows, measure(lambda: encode_export(aiter_rows(rows), format, gzip)))
+        print_row(f"{label} buffered", rows, measure(lambda: buffered(rows, format, gzip)))
+
+
+def bench_postgres(rows: int) -> None:
+    from fastapi.testclient import TestClient
+
+    import main
+    from databutton_app.mw.auth_mw import User, get_authorized_user
+
+    user_id = f"bench-export-{uuid.uuid4().hex[:8]}"
+    main.app.dependency_overrides[get_authorized_user] = lambda: User(sub=user_id)
+    days = rows // QUESTS
+    start = date.today() - timedelta(days=days)
+    csv_body = "title,date\n" + "".join(
+        f"Benchmark quest {q},{(start + timedelta(days=d)).isoformat()}\n"
+        for q in range(1, QUESTS + 1) for d in range(days)
+    )
+
+    with TestClient(main.app) as client:
+        try:
+            started = time.perf_counter()
+            response = client.post("/routes/quests/import?format=csv", content=csv_body.encode("utf-8"))
+            response.raise_for_status()
+            print(f"Imported {response.json()['completions_imported']:,} completions in {time.perf_counter() - started:.1f}s")
+
+            print(f"GET /quests/export, {rows:,} completions in Postgres")
+            print_header()
+            for format, gzip in FORMATS:
+                def download() -> dict:
+                    started = time.perf_counter()
+                    first = None
+                    size = chunks = 0
+                    url = f"/routes/quests/export?format={format}&gzip={str(gzip).lower()}"
+                    with client.stream("GET", url) as streamed:
+                        for chunk in streamed.iter_raw():
+                            if first is None:
+                                first = time.perf_counter() - started
+                            size += len(chunk)
+                            chunks += 1
+                    return {"seconds": time.perf_counter() - started, "first": first or 0.0,
+                            "bytes": size, "chunks": chunks}
+
+                download()  # warm the connection pool and the database's caches
+                result = min((download() for _ in range(REPEATS)), key=lambda r: r["seconds"])
+                tracemalloc.start()
+                download()
+                result["peak"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print_row(format + (" gzip" if gzip else ""), rows, result)
+        finally:
+            asyncio.run(delete_user_quests(user_id))
+
+
+async def delete_user_quests(user_id: str) -> None:
+    from app.libs.database import connect_direct
+
+    conn = await connect_direct()
+    try:
+        await conn.execute("DELETE FROM quests WHERE user_id = $1", user_id)
+    finally:
+        await conn.close()
+
+
+def main(command: str, rows: int) -> None:
+    if command == "encode":
+        bench_encode(rows)
+    elif command == "postgres":
+        bench_postgres(rows)
+    else:
+        raise SystemExit(f"Unknown command {command}, expected encode or postgres")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "encode", int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROWS)
@@ -1,12 +1,25 @@
+import asyncio
 import os
 import pathlib
 import json
 import dotenv
-from fastapi import FastAPI, APIRouter, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 dotenv.load_dotenv()
 
-from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user
+from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user, get_jwks_client
+from app.libs.database import close_pools
+from app.libs.idempotency import IdempotencyConflict
+from app.libs.metrics import render_metrics
+from app.libs.outbox import task_runner
+from app.libs.profiling import PROFILING_ENABLED, ProfilingMiddleware
+from app.libs.rate_limit import RateLimited
+from app.libs.repository import repository
+from app.libs.resilience import deadline_middleware
+from app.libs.secret_store import secret_store
+from app.libs.warmup import readiness
 
 
 def get_router_config() -> dict:
@@ -74,10 +87,67 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+async def warm_jwks(jwks_url: str) -> None:
+    """Fetch the signing keys into the cached JWKS client used to verify tokens"""
+    await asyncio.to_thread(get_jwks_client(jwks_url).get_signing_keys)
+
+
+def rate_limited(request: Request, error: RateLimited) -> JSONResponse:
+    """429 for a call over its rate limit, telling the client when to retry"""
+    return JSONResponse(
+        {"detail": "Too many requests, please try again later"},
+        status_code=429,
+        headers={"Retry-After": str(int(error.retry_after) + 1)},
+    )
+
+
+def idempotency_conflict(request: Request, error: IdempotencyConflict) -> JSONResponse:
+    """Misused Idempotency-Key: reused for another request, or its first request is still running"""
+    return JSONResponse({"detail": error.detail}, status_code=error.status_code)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await secret_store.start()
+    if repository.uses_postgres:
+        await task_runner.start()
+    readiness.add_step("database", repository.warm_up)
+    if app.state.auth_config is not None:
+        readiness.add_step("jwks", lambda: warm_jwks(app.state.auth_config.jwks_url))
+    await readiness.start()
+    yield
+    readiness.stop()
+    if repository.uses_postgres:
+        await task_runner.stop()
+    await secret_store.stop()
+    await close_pools()
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(import_api_routers())
+    # Innermost, so that it runs in the same task as the endpoint
+    if PROFILING_ENABLED:
+        app.add_middleware(ProfilingMiddleware)
+    app.middleware("http")(deadline_middleware)
+    app.add_exception_handler(RateLimited, rate_limited)
+    app.add_exception_handler(IdempotencyConflict, idempotency_conflict)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def metrics():
+        return render_metrics()
+
+    @app.get("/healthz", include_in_schema=False)
+    def healthz():
+        """Liveness: the process is up and serving"""
+        return {"status": "ok"}
+
+    @app.get("/readyz", include_in_schema=False)
+    def readyz():
+        """Readiness: 200 once warmed up (pools and keys ready), 503 before and while shutting down"""
+        report = readiness.report()
+        return JSONResponse(report, status_code=200 if report["ready"] else 503)
 
     for route in app.routes:
         if hasattr(route, "methods"):
@@ -2,4 +2,10 @@
 
 source .venv/bin/activate
 
-uvicorn main:app --reload 
+if [ "$1" = "prod" ]; then
+    # One worker process per core unless WEB_CONCURRENCY is set. In-process caches stay
+    # coherent across workers through the Postgres LISTEN/NOTIFY cache bus.
+    uvicorn main:app --host 0.0.0.0 --port "${PORT:-8000}" --workers "${WEB_CONCURRENCY:-$(nproc)}"
+else
+    uvicorn main:app --reload
+fi
@@ -0,0 +1,64 @@
+"""A worker process for tests/test_cache_bus.py, driven by JSON lines on stdin.
+
+Each line is a command; the reply is one JSON line on stdout. With `--postgres`
+the worker listens on the real cache bus and invalidates through the database,
+otherwise `invalidate` returns the NOTIFY payloads for the test to deliver.
+"""
+
+import asyncio
+import json
+import sys
+
+from app.libs.cache import LocalCache
+from app.libs.cache_bus import cache_bus
+from app.libs.database import db_connection
+from app.libs.pg_listener import WORKER_ID
+
+CACHE_NAME = "coherence_test"
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.payloads: list[str] = []
+
+    async def execute(self, query: str, channel: str, payload: str) -> None:
+        self.payloads.append(payload)
+
+
+async def handle(command: dict, cache: LocalCache, use_postgres: bool) -> dict:
+    op = command["op"]
+    if op == "worker_id":
+        return {"worker_id": WORKER_ID}
+    if op == "set":
+        cache.set(command["key"], command["value"])
+        return {}
+    if op == "get":
+        return {"value": cache.get(command["key"])}
+    if op == "invalidate":
+        if use_postgres:
+            async with db_connection() as conn:
+                await cache_bus.invalidate(conn, CACHE_NAME, command["keys"])
+            return {}
+        conn = RecordingConnection()
+        await cache_bus.invalidate(conn, CACHE_NAME, command["keys"])
+        return {"payloads": conn.payloads}
+    if op == "deliver":
+        cache_bus.on_notification(command["payload"])
+        return {}
+    raise ValueError(f"Unknown op {op}")
+
+
+async def main(use_postgres: bool) -> None:
+    cache = LocalCache(CACHE_NAME, max_entries=100)
+    if use_postgres:
+        await cache_bus.start()
+    loop = asyncio.get_running_loop()
+    print(json.dumps({"ready": WORKER_ID}), flush=True)
+    while line := await loop.run_in_executor(None, sys.stdin.readline):
+        print(json.dumps(await handle(json.loads(line), cache, use_postgres)), flush=True)
+    if use_postgres:
+        await cache_bus.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main("--postgres" in sys.argv))
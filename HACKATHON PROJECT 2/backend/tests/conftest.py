@@ -0,0 +1,5 @@
+import os
+
+# Tests read secrets from the environment and keep data in memory unless told otherwise
+os.environ.setdefault("SECRETS_BACKEND", "env")
+os.environ.setdefault("REPOSITORY_BACKEND", "memory")
@@ -0,0 +1,139 @@
+"""Cache coherence across worker processes through the cache bus."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.libs import cache_bus as cache_bus_module
+from app.libs.cache import LocalCache
+from app.libs.cache_bus import cache_bus
+from app.libs.database import DATABASE_URL_SECRETS, PRIMARY
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Worker:
+    """A separate process with its own caches and WORKER_ID"""
+
+    def __init__(self, *args: str):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(BACKEND_DIR, "tests", "cache_worker.py"), *args],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env, cwd=BACKEND_DIR,
+        )
+        self.worker_id = self._read()["ready"]
+
+    def _read(self) -> dict:
+        # Skip anything the app prints at startup
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError("cache worker exited")
+            if line.startswith("{"):
+                return json.loads(line)
+
+    def send(self, op: str, **args) -> dict:
+        self.process.stdin.write(json.dumps({"op": op, **args}) + "\n")
+        self.process.stdin.flush()
+        return self._read()
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.process.wait(timeout=10)
+
+
+@pytest.fixture
+def workers(request):
+    args = getattr(request, "param", ())
+    started = [Worker(*args) for _ in range(3)]
+    yield started
+    for worker in started:
+        worker.close()
+
+
+def broadcast(payloads: list[str], workers: list[Worker]) -> None:
+    """Deliver NOTIFY payloads to every worker, like the shared listener does"""
+    for payload in payloads:
+        for worker in workers:
+            worker.send("deliver", payload=payload)
+
+
+def fill(workers: list[Worker], keys: list[str]) -> None:
+    for worker in workers:
+        for key in keys:
+            worker.send("set", key=key, value=f"{key} in {worker.worker_id}")
+
+
+def cached(worker: Worker, key: str):
+    return worker.send("get", key=key)["value"]
+
+
+def test_invalidated_keys_are_evicted_in_every_worker(workers):
+    fill(workers, ["a", "b"])
+
+    payloads = workers[0].send("invalidate", keys=["a"])["payloads"]
+    assert cached(workers[0], "a") is None
+    broadcast(payloads, workers)
+
+    assert [cached(w, "a") for w in workers] == [None, None, None]
+    assert all(cached(w, "b") for w in workers)
+
+
+def test_none_clears_the_cache_in_every_worker(workers):
+    fill(workers, ["a", "b"])
+
+    payloads = workers[1].send("invalidate", keys=None)["payloads"]
+    assert json.loads(payloads[0])["keys"] is None
+    broadcast(payloads, workers)
+
+    assert [cached(w, key) for w in workers for key in ("a", "b")] == [None] * 6
+
+
+def test_empty_keys_evict_and_send_nothing(workers):
+    fill(workers, ["a"])
+
+    assert workers[0].send("invalidate", keys=[])["payloads"] == []
+    assert all(cached(w, "a") for w in workers)
+
+
+def test_worker_ignores_its_own_broadcast_after_refilling(workers):
+    fill(workers, ["a"])
+    payloads = workers[0].send("invalidate", keys=["a"])["payloads"]
+    # The writer re-reads the new value before its own notification arrives
+    workers[0].send("set", key="a", value="fresh")
+    broadcast(payloads, workers)
+
+    assert cached(workers[0], "a") == "fresh"
+    assert cached(workers[1], "a") is None
+
+
+def test_empty_remote_keys_do_not_clear(monkeypatch):
+    cache = LocalCache("cache_bus_unit", max_entries=10)
+    cache.set("a", 1)
+    monkeypatch.setattr(cache_bus_module, "WORKER_ID", "this-worker")
+
+    cache_bus.on_notification(json.dumps({"origin": "other", "cache": "cache_bus_unit", "keys": []}))
+    assert cache.get("a") == 1
+    cache_bus.on_notification(json.dumps({"origin": "other", "cache": "cache_bus_unit", "keys": None}))
+    assert cache.get("a") is None
+
+
+@pytest.mark.skipif(
+    not os.environ.get(DATABASE_URL_SECRETS[PRIMARY]), reason=f"needs {DATABASE_URL_SECRETS[PRIMARY]}"
+)
+@pytest.mark.parametrize("workers", [("--postgres",)], indirect=True)
+def test_invalidation_reaches_other_workers_over_postgres(workers):
+    fill(workers, ["a", "b"])
+
+    workers[0].send("invalidate", keys=["a"])
+
+    deadline = time.monotonic() + 5
+    while any(cached(w, "a") is not None for w in workers):
+        assert time.monotonic() < deadline, "workers still cache the invalidated key after 5s"
+        time.sleep(0.05)
+    assert all(cached(w, "b") for w in workers)
@@ -0,0 +1,149 @@
+"""Idempotency keys: replays, duplicates waiting for the first request, reused keys and claim renewal."""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from pydantic import BaseModel
+
+from app.libs import idempotency
+from app.libs.idempotency import IdempotencyConflict, IdempotencyStore
+
+
+class Created(BaseModel):
+    id: int
+    title: str
+
+
+class Handler:
+    """Counts its runs; each one waits for `release` when it is given"""
+
+    def __init__(self, release: asyncio.Event | None = None, fail: bool = False):
+        self.release = release
+        self.fail = fail
+        self.runs = 0
+
+    async def __call__(self):
+        self.runs += 1
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise RuntimeError("handler failed")
+        return Created(id=self.runs, title="Run 5k")
+
+
+def test_retry_gets_the_stored_response():
+    store = IdempotencyStore(shared=False)
+    handler = Handler()
+
+    async def run():
+        first = await store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler)
+        again = await store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler)
+        return first, again
+
+    first, again = asyncio.run(run())
+
+    assert handler.runs == 1
+    assert first == Created(id=1, title="Run 5k")
+    assert again == {"id": 1, "title": "Run 5k"}
+
+
+def test_keys_are_scoped_to_user_and_endpoint():
+    store = IdempotencyStore(shared=False)
+    handler = Handler()
+
+    async def run():
+        for user_id, scope in [("user1", "quests.create"), ("user2", "quests.create"), ("user1", "rivals.create")]:
+            await store.run(user_id, scope, "key1", {"title": "Run 5k"}, handler)
+
+    asyncio.run(run())
+
+    assert handler.runs == 3
+
+
+def test_duplicate_waits_for_the_running_request():
+    store = IdempotencyStore(shared=False)
+
+    async def run():
+        handler = Handler(asyncio.Event())
+        first = asyncio.create_task(store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler))
+        duplicate = asyncio.create_task(store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler))
+        await asyncio.sleep(0.01)
+        assert not duplicate.done()
+        handler.release.set()
+        return handler, await first, await duplicate
+
+    handler, first, duplicate = asyncio.run(run())
+
+    assert handler.runs == 1
+    assert duplicate == first.model_dump(mode="json")
+
+
+def test_key_reused_with_another_body_is_rejected():
+    store = IdempotencyStore(shared=False)
+
+    async def run():
+        handler = Handler(asyncio.Event())
+        running = asyncio.create_task(store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflict) as while_running:
+            await store.run("user1", "quests.create", "key1", {"title": "Swim"}, handler)
+        handler.release.set()
+        await running
+        with pytest.raises(IdempotencyConflict) as once_stored:
+            await store.run("user1", "quests.create", "key1", {"title": "Swim"}, handler)
+        return handler, while_running.value, once_stored.value
+
+    handler, while_running, once_stored = asyncio.run(run())
+
+    assert handler.runs == 1
+    assert while_running.status_code == once_stored.status_code == 422
+
+
+def test_failed_request_is_not_stored():
+    store = IdempotencyStore(shared=False)
+    handler = Handler(fail=True)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler)
+        handler.fail = False
+        return await store.run("user1", "quests.create", "key1", {"title": "Run 5k"}, handler)
+
+    assert asyncio.run(run()) == Created(id=2, title="Run 5k")
+    assert handler.runs == 2
+
+
+class ClaimConnection:
+    """Grants every claim and records the statements run against idempotency_keys"""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, query, *args):
+        self.statements.append(" ".join(query.split()))
+
+    async def fetchval(self, query, *args):
+        return True
+
+
+def test_shared_claim_is_renewed_while_the_request_runs(monkeypatch):
+    conn = ClaimConnection()
+
+    @asynccontextmanager
+    async def db_connection():
+        yield conn
+
+    monkeypatch.setattr(idempotency, "db_connection", db_connection)
+    monkeypatch.setattr(idempotency, "LOCK_SECONDS", 0.15)
+    store = IdempotencyStore(shared=True)
+
+    async def slow():
+        await asyncio.sleep(0.4)
+        return {"id": 1}
+
+    assert asyncio.run(store.run("user1", "quests.create", "key1", {}, slow)) == {"id": 1}
+
+    renewals = [s for s in conn.statements if s.startswith("UPDATE idempotency_keys SET locked_until")]
+    assert len(renewals) >= 3
+    assert conn.statements[-1].startswith("UPDATE idempotency_keys SET response")
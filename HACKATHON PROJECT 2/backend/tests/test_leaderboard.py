@@ -0,0 +1,114 @@
+"""Leaderboard seeding and what the global endpoint reveals."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import asyncpg
+import pytest
+from fastapi.testclient import TestClient
+
+from app.libs import partitions
+from app.libs.leaderboard import SEED_SQL, StreakLeaderboard, leaderboard
+
+TODAY = date(2026, 3, 10)
+
+
+class FakeConnection:
+    """Serves the checkpoint table and the seed query from lists, records checkpoint writes"""
+
+    def __init__(self, checkpoint_rows: list, seed_rows: list, has_view: bool = True):
+        self.checkpoint_rows = checkpoint_rows
+        self.seed_rows = seed_rows
+        self.has_view = has_view
+        self.seed_args = None
+        self.written = []
+
+    def is_in_transaction(self) -> bool:
+        return False
+
+    async def execute(self, query, *args):
+        if query == partitions.SCHEMA_SQL:
+            self.has_view = True
+
+    async def fetch(self, query, *args):
+        if query == SEED_SQL:
+            if not self.has_view:
+                raise asyncpg.UndefinedTableError('relation "quest_check_days" does not exist')
+            self.seed_args = args
+            return self.seed_rows
+        return self.checkpoint_rows
+
+    async def executemany(self, query, rows):
+        self.written.extend(rows)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def row(quest_id: int, streak: int, last_completed: date = TODAY) -> dict:
+    return {
+        "quest_id": quest_id, "user_id": f"user{quest_id}", "title": f"Quest {quest_id}",
+        "streak": streak, "last_completed": last_completed,
+    }
+
+
+def test_empty_checkpoint_is_seeded_from_completed_days():
+    board = StreakLeaderboard()
+    conn = FakeConnection([], [row(1, 4), row(2, 9, TODAY - timedelta(days=1))])
+
+    asyncio.run(board.load(conn, TODAY))
+
+    assert conn.seed_args == (TODAY,)
+    assert [(e.quest_id, e.streak) for e in board.top(10)] == [(2, 9), (1, 4)]
+    # The seed is checkpointed so the next start loads it
+    assert sorted(r[0] for r in conn.written) == [1, 2]
+    assert board.rollover(TODAY) == 0
+
+
+def test_first_deploy_creates_the_view_before_seeding(monkeypatch):
+    monkeypatch.setattr(partitions, "_schema_ready", False)
+    board = StreakLeaderboard()
+    conn = FakeConnection([], [row(1, 4)], has_view=False)
+
+    asyncio.run(board.load(conn, TODAY))
+
+    assert conn.seed_args == (TODAY,)
+    assert [e.quest_id for e in board.top(10)] == [1]
+
+
+def test_existing_checkpoint_is_not_reseeded():
+    board = StreakLeaderboard()
+    conn = FakeConnection([row(3, 2)], [row(1, 4)])
+
+    asyncio.run(board.load(conn, TODAY))
+
+    assert conn.seed_args is None
+    assert [e.quest_id for e in board.top(10)] == [3]
+    assert conn.written == []
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import main
+    from databutton_app.mw.auth_mw import User, get_authorized_user
+
+    monkeypatch.setattr(leaderboard, "_entries", {})
+    monkeypatch.setattr(leaderboard, "_order", [])
+    main.app.dependency_overrides[get_authorized_user] = lambda: User(sub="user1")
+    with TestClient(main.app) as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+
+def test_other_users_titles_are_hidden(client):
+    leaderboard.update(1, "user1", "Run 5k", 3, date.today())
+    leaderboard.update(2, "user2", "Call my therapist", 7, date.today())
+
+    entries = client.get("/routes/quests/leaderboard").json()["entries"]
+
+    assert [(e["quest_id"], e["title"], e["is_mine"]) for e in entries] == [
+        (2, None, False),
+        (1, "Run 5k", True),
+    ]
@@ -0,0 +1,118 @@
+"""Side effects enqueued in the write's transaction, and the outbox schema flag."""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+
+from app.libs import outbox
+from app.libs.leaderboard import leaderboard
+from app.libs.repository import repository
+from app.libs.repository_postgres import CompletionRecorded, PostgresSession, apply_completion
+from app.libs.rival_interactions import interaction_engine
+
+TODAY = date(2026, 3, 10)
+
+
+class TransactionalConnection:
+    """Keeps the statements of a transaction apart until it commits; drops them on rollback"""
+
+    def __init__(self):
+        self.committed = []
+        self.pending = None
+
+    def is_in_transaction(self) -> bool:
+        return self.pending is not None
+
+    async def execute(self, query, *args):
+        (self.committed if self.pending is None else self.pending).append((query, args))
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.pending = []
+        try:
+            yield
+            self.committed.extend(self.pending)
+        finally:
+            self.pending = None
+
+    def enqueued(self) -> list[tuple[str, dict]]:
+        return [
+            (args[0], json.loads(args[1]))
+            for query, args in self.committed
+            if "INSERT INTO outbox_tasks" in query
+        ]
+
+
+@pytest.fixture
+def fresh_schema(monkeypatch):
+    monkeypatch.setattr(outbox, "_schema_ready", False)
+
+
+def test_schema_created_in_a_rolled_back_transaction_is_created_again(fresh_schema):
+    conn = TransactionalConnection()
+
+    async def enqueue_then_fail():
+        async with conn.transaction():
+            await outbox.ensure_schema(conn)
+            raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(enqueue_then_fail())
+    assert not outbox._schema_ready
+
+    asyncio.run(outbox.ensure_schema(conn))
+    assert outbox._schema_ready
+    assert conn.committed == [(outbox.SCHEMA_SQL, ())]
+
+
+def test_completion_side_effects_are_enqueued_with_it(fresh_schema):
+    conn = TransactionalConnection()
+    db = PostgresSession(conn, read_only=False)
+
+    async def complete(fail: bool):
+        async with conn.transaction():
+            await db.record_completion("user1", 7, "Run 5k", 3, 2, TODAY)
+            if fail:
+                raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(complete(fail=True))
+    assert conn.enqueued() == []
+
+    asyncio.run(complete(fail=False))
+    assert conn.enqueued() == [(CompletionRecorded.task_type, {
+        "user_id": "user1", "quest_id": 7, "title": "Run 5k", "streak": 3,
+        "completions_today": 2, "day": TODAY.isoformat(),
+    })]
+
+
+def test_completion_task_updates_the_leaderboard_and_queues_the_reaction(monkeypatch):
+    monkeypatch.setattr(leaderboard, "_entries", {})
+    monkeypatch.setattr(leaderboard, "_order", [])
+    submitted = []
+    monkeypatch.setattr(interaction_engine, "submit", submitted.append)
+    conn = TransactionalConnection()
+    task = CompletionRecorded(user_id="user1", quest_id=7, title="Run 5k", streak=3, completions_today=2, day=TODAY)
+
+    asyncio.run(apply_completion(conn, task))
+
+    assert [(e.quest_id, e.streak, e.last_completed) for e in leaderboard.top(10)] == [(7, 3, TODAY)]
+    assert [query for query, _ in conn.committed] == ["SELECT pg_notify($1, $2)"]
+    assert [(e.user_id, e.streak, e.user_completions_today) for e in submitted] == [("user1", 3, 2)]
+
+
+def test_memory_session_updates_the_leaderboard_directly(monkeypatch):
+    monkeypatch.setattr(leaderboard, "_entries", {})
+    monkeypatch.setattr(leaderboard, "_order", [])
+
+    async def complete():
+        async with repository.session() as db:
+            async with db.transaction():
+                await db.record_completion("user1", 7, "Run 5k", 3, 2, TODAY)
+
+    asyncio.run(complete())
+
+    assert [e.quest_id for e in leaderboard.top(10)] == [7]
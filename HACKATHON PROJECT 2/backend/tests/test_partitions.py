@@ -0,0 +1,54 @@
+"""Archiving takes a lock per partition and skips partitions another worker already archived."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+from app.libs import partitions
+
+
+class FakeConnection:
+    """Two partitioned tables with one old month each; `gone` lists partitions dropped meanwhile"""
+
+    def __init__(self, gone: set[str]):
+        self.gone = gone
+        self.executed = []
+
+    def is_in_transaction(self) -> bool:
+        return False
+
+    async def execute(self, query, *args):
+        self.executed.append((" ".join(query.split()), args))
+
+    async def fetchval(self, query, *args):
+        if "pg_partitioned_table" in query:
+            return True
+        if "to_regclass" in query:
+            return None if args[0] in self.gone else args[0]
+        raise AssertionError(query)
+
+    async def fetch(self, query, table):
+        return [{"relname": partitions.partition_name(table, date(2025, 1, 1))}]
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def test_each_partition_is_archived_under_its_own_lock():
+    conn = FakeConnection(gone=set())
+
+    archived = asyncio.run(partitions.archive(conn, date(2025, 6, 1)))
+
+    assert archived == ["quest_checks_y2025m01", "daily_completions_y2025m01"]
+    locks = [args for query, args in conn.executed if "pg_advisory_xact_lock" in query]
+    assert locks == [("quest_checks_y2025m01",), ("daily_completions_y2025m01",)]
+
+
+def test_partition_archived_by_another_worker_is_skipped():
+    conn = FakeConnection(gone={"quest_checks_y2025m01"})
+
+    archived = asyncio.run(partitions.archive(conn, date(2025, 6, 1)))
+
+    assert archived == ["daily_completions_y2025m01"]
+    assert not any("quest_checks_y2025m01" in query for query, _ in conn.executed)
@@ -0,0 +1,170 @@
+"""Persona batching against a fake OpenAI-compatible server."""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+
+from app.apis import rivals
+from app.apis.rivals import PersonaRequest
+from app.libs.persona_batcher import PersonaBatcher
+from app.libs.resilience import remaining_seconds, set_deadline
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """Answers /chat/completions with as many personas as the prompt asks for"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.prompts: list[str] = []
+        self.broken_batches = False
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        self.server.prompts.append(prompt)
+
+        batch = re.search(r"with exactly (\d+) personas", prompt)
+        if batch is None:
+            content = json.dumps({"name": "Single", "archetype": "Rogue", "taunt": "Just me this time!"})
+        elif self.server.broken_batches:
+            content = "not json"
+        else:
+            content = json.dumps({
+                "personas": [
+                    {"name": f"Rival{i}", "archetype": "Warrior", "taunt": f"Catch me if you can, #{i}!"}
+                    for i in range(int(batch.group(1)))
+                ]
+            })
+
+        response = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    server = FakeOpenAI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+    monkeypatch.setattr(rivals, "get_openai_client", lambda: client)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_batcher(**kwargs) -> PersonaBatcher:
+    return PersonaBatcher(
+        rivals.generate_rival_personas, rivals.generate_single_persona,
+        call=rivals.openai_upstream.call, **kwargs
+    )
+
+
+def submit_all(batcher: PersonaBatcher, count: int) -> list:
+    async def run():
+        return await asyncio.gather(*(
+            batcher.submit(PersonaRequest(quest_context=f"User {i} runs daily", personality_type="competitive"))
+            for i in range(count)
+        ))
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_upstream_call(fake_openai):
+    personas = submit_all(make_batcher(window_seconds=0.05, max_size=8), 5)
+
+    assert len(fake_openai.prompts) == 1
+    assert "with exactly 5 personas" in fake_openai.prompts[0]
+    assert [p["name"] for p in personas] == [f"Rival{i}" for i in range(5)]
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window(fake_openai):
+    personas = submit_all(make_batcher(window_seconds=60, max_size=3), 3)
+
+    assert len(fake_openai.prompts) == 1
+    assert len(personas) == 3
+
+
+def test_unusable_batch_falls_back_to_single_calls(fake_openai):
+    fake_openai.broken_batches = True
+    personas = submit_all(make_batcher(window_seconds=0.05, max_size=8), 3)
+
+    assert len(fake_openai.prompts) == 4
+    assert [p["name"] for p in personas] == ["Single"] * 3
+
+
+def test_zero_window_disables_batching(fake_openai):
+    submit_all(make_batcher(window_seconds=0, max_size=8), 3)
+
+    assert len(fake_openai.prompts) == 3
+    assert not any("personas" in prompt for prompt in fake_openai.prompts)
+
+
+class SlowGenerator:
+    """Records the deadline each batch runs under, then takes `delay` seconds"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.batch_budgets = []
+
+    def generate_batch(self, requests):
+        self.batch_budgets.append(remaining_seconds())
+        time.sleep(self.delay)
+        return [{"name": request} for request in requests]
+
+    def generate_one(self, request):
+        return {"name": request}
+
+
+def submit_with_deadlines(batcher: PersonaBatcher, deadlines: list) -> list:
+    async def one(i, seconds):
+        set_deadline(seconds)
+        return await batcher.submit(f"request{i}")
+
+    async def run():
+        return await asyncio.gather(*(one(i, s) for i, s in enumerate(deadlines)), return_exceptions=True)
+    return asyncio.run(run())
+
+
+def test_batch_runs_under_the_latest_deadline_and_each_caller_under_its_own():
+    generator = SlowGenerator(delay=0.3)
+    batcher = PersonaBatcher(generator.generate_batch, generator.generate_one, window_seconds=0.02, max_size=8)
+
+    short, long = submit_with_deadlines(batcher, [0.1, 5])
+
+    assert 4 < generator.batch_budgets[0] < 5
+    assert isinstance(short, TimeoutError)
+    assert long == {"name": "request1"}
+
+
+def test_batch_has_no_deadline_when_one_request_has_none():
+    generator = SlowGenerator(delay=0)
+    batcher = PersonaBatcher(generator.generate_batch, generator.generate_one, window_seconds=0.02, max_size=8)
+
+    results = submit_with_deadlines(batcher, [1, None])
+
+    assert generator.batch_budgets == [None]
+    assert results == [{"name": "request0"}, {"name": "request1"}]
@@ -0,0 +1,105 @@
+"""Token buckets: refill, Retry-After and the cap on tracked keys, on a controlled clock."""
+
+import asyncio
+
+import pytest
+
+from app.libs import rate_limit
+from app.libs.rate_limit import RateLimit, RateLimited
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_retry_after_until_the_next_token(clock):
+    limit = RateLimit("test", requests=6, per_seconds=60, burst=3)
+
+    assert [limit.try_acquire("user1") for _ in range(3)] == [0, 0, 0]
+    # 0.1 tokens a second, so the next whole token is 10s away
+    assert limit.try_acquire("user1") == pytest.approx(10)
+
+    clock.now += 4
+    assert limit.try_acquire("user1") == pytest.approx(6)
+
+
+def test_tokens_refill_continuously_up_to_the_burst(clock):
+    limit = RateLimit("test", requests=6, per_seconds=60, burst=3)
+    for _ in range(3):
+        limit.try_acquire("user1")
+
+    clock.now += 10
+    assert limit.try_acquire("user1") == 0
+    assert limit.try_acquire("user1") > 0
+
+    # A long pause refills to the burst, not beyond
+    clock.now += 3600
+    assert [limit.try_acquire("user1") for _ in range(4)][:3] == [0, 0, 0]
+    assert limit.try_acquire("user1") > 0
+
+
+def test_denied_call_does_not_use_a_token(clock):
+    limit = RateLimit("test", requests=1, per_seconds=10)
+    limit.try_acquire("user1")
+
+    for _ in range(5):
+        clock.now += 1
+        limit.try_acquire("user1")
+    clock.now += 5
+    assert limit.try_acquire("user1") == 0
+
+
+def test_keys_have_separate_buckets(clock):
+    limit = RateLimit("test", requests=1, per_seconds=60)
+
+    assert limit.try_acquire("user1") == 0
+    assert limit.try_acquire("user2") == 0
+    assert limit.try_acquire("user1") > 0
+
+
+def test_sweep_forgets_full_buckets_once_the_cap_is_reached(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_TRACKED_KEYS", 3)
+    limit = RateLimit("test", requests=2, per_seconds=20)
+    limit.try_acquire("idle1")
+    limit.try_acquire("idle2")
+    clock.now += 25
+    limit.try_acquire("busy")
+
+    # Any bucket refills completely within burst / rate = 20s, so the idle ones go
+    limit.try_acquire("new")
+
+    assert set(limit._buckets) == {"busy", "new"}
+
+
+def test_check_raises_with_the_wait_and_the_app_rounds_it_up(clock):
+    import main
+
+    limit = RateLimit("test", requests=4, per_seconds=10, burst=1)
+    asyncio.run(limit.check("user1"))
+    with pytest.raises(RateLimited) as denied:
+        asyncio.run(limit.check("user1"))
+
+    assert denied.value.retry_after == pytest.approx(2.5)
+    response = main.rate_limited(None, denied.value)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_limit_is_overridden_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_TEST", "20/3600")
+
+    limit = RateLimit("test", requests=5, per_seconds=60)
+
+    assert limit.rate == pytest.approx(20 / 3600)
+    assert limit.burst == 20
@@ -0,0 +1,96 @@
+"""Read/write routing against two Postgres instances.
+
+Runs when both database URLs are set, e.g. a primary and a streaming replica:
+
+    DATABASE_URL_ADMIN_DEV=postgresql://localhost:5432/app \
+    DATABASE_URL_REPLICA_DEV=postgresql://localhost:5433/app \
+    python -m pytest tests/test_read_replica.py
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from app.libs import database
+from app.libs.database import PRIMARY, REPLICA, DATABASE_URL_SECRETS, db_connection
+
+pytestmark = pytest.mark.skipif(
+    not all(os.environ.get(name) for name in DATABASE_URL_SECRETS.values()),
+    reason=f"needs {' and '.join(DATABASE_URL_SECRETS.values())}",
+)
+
+# Identifies the server a connection is on, whichever host/port the URL uses
+SERVER_SQL = "SELECT system_identifier::text || ':' || current_setting('port') FROM pg_control_system()"
+
+
+def run(test):
+    async def wrapped():
+        try:
+            await test()
+        finally:
+            await database.close_pools()
+            database._pinned_until.clear()
+    asyncio.run(wrapped())
+
+
+async def server_of(role: str) -> str:
+    async with (await database.get_pool(role)).acquire() as conn:
+        return await conn.fetchval(SERVER_SQL)
+
+
+def test_reads_go_to_the_replica_and_writes_to_the_primary():
+    async def test():
+        primary, replica = await server_of(PRIMARY), await server_of(REPLICA)
+        assert primary != replica
+
+        async with db_connection(read_only=True, user_id="reader") as conn:
+            assert await conn.fetchval(SERVER_SQL) == replica
+        async with db_connection(user_id="writer") as conn:
+            assert await conn.fetchval(SERVER_SQL) == primary
+    run(test)
+
+
+def test_writer_reads_the_primary_until_the_pin_expires(monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_SECONDS", 0.5)
+
+    async def test():
+        primary, replica = await server_of(PRIMARY), await server_of(REPLICA)
+        async with db_connection(user_id="writer"):
+            pass
+        async with db_connection(read_only=True, user_id="writer") as conn:
+            assert await conn.fetchval(SERVER_SQL) == primary
+        async with db_connection(read_only=True, user_id="someone-else") as conn:
+            assert await conn.fetchval(SERVER_SQL) == replica
+
+        await asyncio.sleep(0.6)
+        async with db_connection(read_only=True, user_id="writer") as conn:
+            assert await conn.fetchval(SERVER_SQL) == replica
+    run(test)
+
+
+def test_replica_serves_rows_written_to_the_primary():
+    async def test():
+        async with db_connection(read_only=True) as conn:
+            if not await conn.fetchval("SELECT pg_is_in_recovery()"):
+                pytest.skip("the replica URL is not a streaming replica of the primary")
+
+        table = f"replica_check_{uuid.uuid4().hex[:8]}"
+        async with db_connection() as conn:
+            await conn.execute(f"CREATE TABLE {table} (value TEXT)")
+            await conn.execute(f"INSERT INTO {table} VALUES ('written')")
+        try:
+            deadline = time.monotonic() + 10
+            while True:
+                async with db_connection(read_only=True) as conn:
+                    exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table)
+                    if exists and await conn.fetchval(f"SELECT value FROM {table}") == "written":
+                        break
+                assert time.monotonic() < deadline, "the replica did not catch up within 10s"
+                await asyncio.sleep(0.1)
+        finally:
+            async with db_connection() as conn:
+                await conn.execute(f"DROP TABLE {table}")
+    run(test)
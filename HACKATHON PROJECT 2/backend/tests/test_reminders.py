@@ -0,0 +1,121 @@
+"""Timer wheel, keyset paging of due users, and claims that only stick once a batch is sent."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+
+from app.libs import reminders
+from app.libs.reminders import REMINDERS, ReminderScheduler, TimerWheel, load_due_users
+
+TODAY = date(2026, 3, 10)
+
+
+def test_wheel_buckets_users_by_minute():
+    wheel = TimerWheel()
+    wheel.add(600, "user1", 2)
+    wheel.add(600, "user2", 1)
+    wheel.add(601, "user3", 4)
+    # Re-adding a user updates the count without growing the wheel
+    wheel.add(600, "user1", 3)
+
+    assert len(wheel) == 3
+    assert wheel.pop(600) == {"user1": 3, "user2": 1}
+    assert wheel.pop(600) == {}
+    assert len(wheel) == 1
+
+    wheel.clear()
+    assert len(wheel) == 0
+    assert wheel.pop(601) == {}
+
+
+class DueUsersConnection:
+    """Answers the due-users query from a list of user ids, honouring its cursor and limit"""
+
+    def __init__(self, user_ids: list[str]):
+        self.user_ids = sorted(user_ids)
+        self.cursors = []
+
+    async def fetch(self, query, cursor, day, default_minute, start, end, limit):
+        self.cursors.append(cursor)
+        after = [u for u in self.user_ids if u > cursor][:limit]
+        return [{"user_id": u, "remind_minute": start, "open_quests": 1} for u in after]
+
+
+def collect(conn) -> list[list[str]]:
+    async def run():
+        return [[row["user_id"] for row in rows] async for rows in load_due_users(conn, TODAY, 0, 60)]
+    return asyncio.run(run())
+
+
+def test_due_users_are_loaded_in_keyset_pages(monkeypatch):
+    monkeypatch.setattr(reminders, "LOAD_BATCH_USERS", 2)
+    conn = DueUsersConnection(["u5", "u1", "u4", "u2", "u3"])
+
+    assert collect(conn) == [["u1", "u2"], ["u3", "u4"], ["u5"]]
+    assert conn.cursors == ["", "u2", "u4"]
+
+
+def test_full_last_page_ends_with_an_empty_query(monkeypatch):
+    monkeypatch.setattr(reminders, "LOAD_BATCH_USERS", 2)
+    conn = DueUsersConnection(["u1", "u2"])
+
+    assert collect(conn) == [["u1", "u2"]]
+    assert conn.cursors == ["", "u2"]
+
+
+class ClaimConnection:
+    """Claims every user offered; claims made in a rolled back transaction are dropped"""
+
+    def __init__(self):
+        self.claimed = set()
+        self.pending = None
+
+    async def fetch(self, query, user_ids, day):
+        self.pending.update(user_ids)
+        return [{"user_id": u} for u in user_ids]
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.pending = set()
+        try:
+            yield
+            self.claimed |= self.pending
+        finally:
+            self.pending = None
+
+
+class FailingSender:
+    def __init__(self):
+        self.fail = True
+        self.sent = []
+
+    async def send(self, batch):
+        if self.fail:
+            raise ConnectionError("push service down")
+        self.sent.extend(r.user_id for r in batch)
+
+
+def failed_count() -> float:
+    return REMINDERS._values.get((("outcome", "failed"),), 0)
+
+
+def test_failed_send_releases_the_claims_and_keeps_the_slot():
+    sender = FailingSender()
+    scheduler = ReminderScheduler(sender)
+    scheduler.wheel.add(600, "user1", 2)
+    conn = ClaimConnection()
+    failed_before = failed_count()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(scheduler.fire(conn, TODAY, 600))
+
+    assert conn.claimed == set()
+    assert failed_count() == failed_before + 1
+    assert len(scheduler.wheel) == 1
+
+    sender.fail = False
+    assert asyncio.run(scheduler.fire(conn, TODAY, 600)) == 1
+    assert sender.sent == ["user1"]
+    assert conn.claimed == {"user1"}
@@ -0,0 +1,71 @@
+"""Both repository backends implement the whole storage interface."""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.libs import outbox, quest_history, rival_xp
+from app.libs.repository import Repository, Session
+from app.libs.repository_memory import MemoryRepository, MemorySession
+from app.libs.repository_postgres import PostgresRepository, PostgresSession
+
+
+@pytest.mark.parametrize("cls", [MemorySession, PostgresSession, MemoryRepository, PostgresRepository])
+def test_backend_implements_every_method(cls):
+    assert not cls.__abstractmethods__
+
+
+def test_incomplete_backend_fails_when_instantiated():
+    class PartialSession(Session):
+        async def create_quest(self, user_id, title):
+            return {}
+
+    with pytest.raises(TypeError, match="abstract method"):
+        PartialSession()
+    with pytest.raises(TypeError, match="abstract method"):
+        Repository()
+
+
+class RecordingConnection:
+    """Records the statements run and where transactions begin and end"""
+
+    def __init__(self):
+        self.log = []
+        self.in_transaction = False
+
+    def is_in_transaction(self) -> bool:
+        return self.in_transaction
+
+    async def execute(self, query, *args):
+        self.log.append(query)
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.log.append("BEGIN")
+        self.in_transaction = True
+        try:
+            yield
+        except Exception:
+            self.log.append("ROLLBACK")
+            raise
+        finally:
+            self.in_transaction = False
+        self.log.append("COMMIT")
+
+
+def test_postgres_transaction_creates_tables_before_it_begins(monkeypatch):
+    monkeypatch.setattr(quest_history, "_schema_ready", False)
+    monkeypatch.setattr(rival_xp, "_schema_ready", False)
+    monkeypatch.setattr(outbox, "_schema_ready", False)
+    conn = RecordingConnection()
+
+    async def fail_in_transaction():
+        async with PostgresSession(conn, read_only=False).transaction():
+            raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fail_in_transaction())
+    assert conn.log[-2:] == ["BEGIN", "ROLLBACK"]
+    assert all(m.SCHEMA_SQL in conn.log for m in (quest_history, rival_xp, outbox))
+    assert quest_history._schema_ready and rival_xp._schema_ready and outbox._schema_ready
@@ -0,0 +1,237 @@
+"""Circuit breaker, deadline and concurrency cap behaviour against a fault-injecting upstream."""
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from app.libs.resilience import (
+    CLOSED,
+    DEADLINE_HEADER,
+    HALF_OPEN,
+    OPEN,
+    Upstream,
+    UpstreamUnavailable,
+    set_deadline,
+)
+
+
+class FaultyUpstream(ThreadingHTTPServer):
+    """Answers every request according to `mode`: ok, error (500), slow or hang"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FaultyUpstreamHandler)
+        self.mode = "ok"
+        self.delay = 0.0
+        self.hits = 0
+        self.release = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FaultyUpstreamHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        server = self.server
+        server.hits += 1
+        if server.mode == "slow":
+            time.sleep(server.delay)
+        elif server.mode == "hang":
+            server.release.wait(10)
+
+        status = 500 if server.mode == "error" else 200
+        body = json.dumps({
+            "status": status == 200,
+            "message": "ok" if status == 200 else "upstream error",
+            "data": {"authorization_url": f"{server.url}/checkout", "access_code": "code", "reference": "ref"},
+        }).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    do_GET = _respond
+    do_POST = _respond
+
+
+@pytest.fixture
+def stub():
+    server = FaultyUpstream()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def make_upstream(**kwargs) -> Upstream:
+    kwargs.setdefault("is_failure", lambda response: response.status_code >= 500)
+    return Upstream("stub", **kwargs)
+
+
+def test_breaker_opens_half_opens_and_closes(stub):
+    upstream = make_upstream(failure_threshold=3, reset_seconds=0.3)
+
+    async def scenario():
+        stub.mode = "error"
+        for _ in range(3):
+            assert upstream.breaker.state == CLOSED
+            await upstream.call(requests.get, stub.url)
+        assert upstream.breaker.state == OPEN
+
+        # Open: rejected without reaching the upstream
+        with pytest.raises(UpstreamUnavailable) as rejected:
+            await upstream.call(requests.get, stub.url)
+        assert rejected.value.reason == "circuit open"
+        assert 0 < rejected.value.retry_after <= 0.3
+        assert stub.hits == 3
+
+        # Half-open after the reset time: one trial at a time
+        await asyncio.sleep(0.35)
+        stub.mode = "hang"
+        stub.release.clear()
+        trial = asyncio.create_task(upstream.call(requests.get, stub.url))
+        await asyncio.sleep(0.1)
+        assert upstream.breaker.state == HALF_OPEN
+        with pytest.raises(UpstreamUnavailable):
+            await upstream.call(requests.get, stub.url)
+
+        # A successful trial closes the circuit
+        stub.mode = "ok"
+        stub.release.set()
+        assert (await trial).status_code == 200
+        assert upstream.breaker.state == CLOSED
+        assert (await upstream.call(requests.get, stub.url)).status_code == 200
+
+    asyncio.run(scenario())
+
+
+def test_failed_trial_reopens_the_circuit(stub):
+    upstream = make_upstream(failure_threshold=1, reset_seconds=0.2)
+
+    async def scenario():
+        stub.mode = "error"
+        await upstream.call(requests.get, stub.url)
+        assert upstream.breaker.state == OPEN
+        await asyncio.sleep(0.25)
+        await upstream.call(requests.get, stub.url)
+        assert upstream.breaker.state == OPEN
+        assert upstream.breaker.retry_after() > 0.1
+
+    asyncio.run(scenario())
+
+
+def test_call_timeout_is_capped_by_the_request_deadline(stub):
+    upstream = make_upstream(timeout_seconds=10)
+    stub.mode, stub.delay = "slow", 2
+    timeouts = []
+
+    def get(url, timeout):
+        timeouts.append(timeout)
+        return requests.get(url, timeout=timeout)
+
+    async def scenario():
+        set_deadline(0.3)
+        started = time.monotonic()
+        with pytest.raises(UpstreamUnavailable) as timed_out:
+            await upstream.call(get, stub.url)
+        return time.monotonic() - started, timed_out.value
+
+    elapsed, error = asyncio.run(scenario())
+    assert error.reason == "timed out"
+    assert elapsed < 1
+    assert timeouts and timeouts[0] <= 0.3
+    assert upstream.breaker.failures == 1
+
+
+def test_spent_deadline_rejects_without_calling(stub):
+    upstream = make_upstream()
+
+    async def scenario():
+        set_deadline(0)
+        with pytest.raises(UpstreamUnavailable) as rejected:
+            await upstream.call(requests.get, stub.url)
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "request deadline exceeded"
+    assert stub.hits == 0
+    # Rejections are not upstream failures
+    assert upstream.breaker.failures == 0
+
+
+def test_concurrency_cap_rejects_callers_whose_deadline_runs_out(stub):
+    upstream = make_upstream(max_concurrency=2)
+    stub.mode = "hang"
+
+    async def scenario():
+        held = [asyncio.create_task(upstream.call(requests.get, stub.url)) for _ in range(2)]
+        await asyncio.sleep(0.1)
+
+        set_deadline(0.2)
+        with pytest.raises(UpstreamUnavailable) as rejected:
+            await upstream.call(requests.get, stub.url)
+
+        stub.release.set()
+        await asyncio.gather(*held)
+        return rejected.value
+
+    error = asyncio.run(scenario())
+    assert error.reason == "too many concurrent calls"
+    assert error.retry_after == 1
+    assert stub.hits == 2
+    assert upstream.breaker.state == CLOSED
+
+
+@pytest.fixture
+def payments_client(stub, monkeypatch):
+    monkeypatch.setenv("PAYSTACK_SECRET_KEY", "sk_test")
+    import main
+    from app.apis import payments
+    from databutton_app.mw.auth_mw import User, get_authorized_user
+
+    monkeypatch.setattr(payments, "PAYSTACK_BASE_URL", stub.url)
+    monkeypatch.setattr(payments, "paystack", Upstream(
+        "paystack_test", max_concurrency=1, is_failure=lambda response: response.status_code >= 500
+    ))
+    main.app.dependency_overrides[get_authorized_user] = lambda: User(sub="payer")
+    with TestClient(main.app) as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+
+def test_saturated_upstream_returns_503_with_retry_after(stub, payments_client):
+    stub.mode = "hang"
+    body = {"email": "payer@example.com", "plan": "monthly"}
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        first = pool.submit(payments_client.post, "/routes/payments/initialize", json=body)
+        deadline = time.monotonic() + 5
+        while stub.hits == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        rejected = payments_client.post(
+            "/routes/payments/initialize", json=body, headers={DEADLINE_HEADER: "200"}
+        )
+        stub.release.set()
+        assert first.result(timeout=10).status_code == 200
+
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "2"
+    assert stub.hits == 1
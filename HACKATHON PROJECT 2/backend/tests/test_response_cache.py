@@ -0,0 +1,95 @@
+"""Reads racing an invalidation do not cache what they read before it."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+
+from app.libs.response_cache import QUESTS_LIST, RIVALS_LIST, ResponseCache, invalidate_responses, response_cache
+
+
+class Body(BaseModel):
+    value: int
+
+
+def make_cache(max_entries: int = 100) -> ResponseCache:
+    return ResponseCache("test_responses", max_entries=max_entries)
+
+
+def test_read_without_invalidation_is_stored():
+    cache = make_cache()
+    token = cache.token()
+
+    assert cache.store(QUESTS_LIST, "user1", Body(value=1), token) == Body(value=1)
+    assert cache.lookup(QUESTS_LIST, "user1") == b'{"value":1}'
+
+
+def test_read_that_raced_an_invalidation_of_its_key_is_not_stored():
+    cache = make_cache()
+    token = cache.token()
+    cache.delete(cache.key(QUESTS_LIST, "user1"))
+
+    cache.store(QUESTS_LIST, "user1", Body(value=1), token)
+
+    assert cache.lookup(QUESTS_LIST, "user1") is None
+    # A read started after the invalidation is fine
+    cache.store(QUESTS_LIST, "user1", Body(value=2), cache.token())
+    assert cache.lookup(QUESTS_LIST, "user1") == b'{"value":2}'
+
+
+def test_invalidating_other_keys_does_not_block_the_store():
+    cache = make_cache()
+    token = cache.token()
+    cache.delete(cache.key(QUESTS_LIST, "user2"))
+    cache.delete(cache.key(RIVALS_LIST, "user1"))
+
+    cache.store(QUESTS_LIST, "user1", Body(value=1), token)
+
+    assert cache.lookup(QUESTS_LIST, "user1") is not None
+
+
+def test_forgotten_invalidation_history_rejects_every_older_read():
+    cache = make_cache(max_entries=2)
+    token = cache.token()
+    # The third invalidation overflows the per-key history, which is replaced by a floor
+    for user_id in ["user2", "user3", "user4"]:
+        cache.delete(cache.key(QUESTS_LIST, user_id))
+
+    cache.store(QUESTS_LIST, "user1", Body(value=1), token)
+
+    assert cache.lookup(QUESTS_LIST, "user1") is None
+    cache.store(QUESTS_LIST, "user1", Body(value=1), cache.token())
+    assert cache.lookup(QUESTS_LIST, "user1") is not None
+
+
+def test_clear_rejects_reads_started_before_it():
+    cache = make_cache()
+    cache.store(QUESTS_LIST, "user1", Body(value=1), cache.token())
+    token = cache.token()
+
+    cache.clear()
+    cache.store(QUESTS_LIST, "user2", Body(value=2), token)
+
+    assert cache.lookup(QUESTS_LIST, "user1") is None
+    assert cache.lookup(QUESTS_LIST, "user2") is None
+
+
+def test_response_past_its_expiry_is_not_stored():
+    cache = make_cache()
+
+    cache.store(QUESTS_LIST, "user1", Body(value=1), cache.token(), expires_at=datetime.now() - timedelta(seconds=1))
+
+    assert cache.lookup(QUESTS_LIST, "user1") is None
+
+
+def test_invalidate_responses_evicts_the_users_routes():
+    token = response_cache.token()
+    response_cache.store(QUESTS_LIST, "user1", Body(value=1), token)
+    response_cache.store(RIVALS_LIST, "user1", Body(value=1), token)
+    response_cache.store(QUESTS_LIST, "user2", Body(value=1), token)
+
+    asyncio.run(invalidate_responses(None, "user1", [QUESTS_LIST, RIVALS_LIST]))
+
+    assert response_cache.lookup(QUESTS_LIST, "user1") is None
+    assert response_cache.lookup(RIVALS_LIST, "user1") is None
+    assert response_cache.lookup(QUESTS_LIST, "user2") is not None
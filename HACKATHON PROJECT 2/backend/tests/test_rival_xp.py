@@ -0,0 +1,135 @@
+"""The XP consumer applies each event once, also with several consumers at the same time.
+
+The concurrent test runs against a real primary, e.g.:
+
+    DATABASE_URL_ADMIN_DEV=postgresql://localhost:5432/app python -m pytest tests/test_rival_xp.py
+"""
+
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.libs import rival_xp
+from app.libs.database import DATABASE_URL_SECRETS, PRIMARY, connect_direct
+from app.libs.rival_xp import RivalXpEngine, level_for_experience, xp_for_completion
+
+
+class FakeConnection:
+    """Serves the pending events and the rivals UPDATE from dicts"""
+
+    def __init__(self, events: list[dict], rivals: dict[str, dict]):
+        self.events = events
+        self.rivals = rivals
+        self.gains = None
+
+    def is_in_transaction(self) -> bool:
+        return False
+
+    async def execute(self, query, *args):
+        pass
+
+    async def fetch(self, query, *args):
+        if "DELETE FROM rival_xp_events" in query:
+            batch, self.events = self.events[:args[0]], self.events[args[0]:]
+            return batch
+        user_ids, xps, _ = args
+        self.gains = dict(zip(user_ids, xps))
+        rows = []
+        for user_id, xp in self.gains.items():
+            rival = self.rivals.get(user_id)
+            if rival is not None:
+                rival["experience"] += xp
+                rival["level"] = level_for_experience(rival["experience"])
+                rows.append({**rival, "user_id": user_id, "xp": xp})
+        return rows
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def test_batch_sums_the_xp_per_user_into_one_update():
+    conn = FakeConnection(
+        [
+            {"user_id": "user1", "xp": 15},
+            {"user_id": "user1", "xp": 12},
+            {"user_id": "user2", "xp": 10},
+            {"user_id": "no-rival", "xp": 10},
+        ],
+        {
+            "user1": {"id": 1, "level": 1, "experience": 90},
+            "user2": {"id": 2, "level": 1, "experience": 0},
+        },
+    )
+
+    consumed = asyncio.run(RivalXpEngine().apply_batch(conn))
+
+    assert consumed == 4
+    assert conn.gains == {"user1": 27, "user2": 10, "no-rival": 10}
+    assert conn.rivals["user1"] == {"id": 1, "level": 2, "experience": 117}
+    assert conn.events == []
+    assert asyncio.run(RivalXpEngine().apply_batch(conn)) == 0
+
+
+@pytest.mark.skipif(
+    not os.environ.get(DATABASE_URL_SECRETS[PRIMARY]),
+    reason=f"needs {DATABASE_URL_SECRETS[PRIMARY]}",
+)
+def test_concurrent_consumers_apply_every_event_once(monkeypatch):
+    monkeypatch.setattr(rival_xp, "BATCH_SIZE", 7)
+    schema = f"test_rival_xp_{uuid.uuid4().hex[:8]}"
+    users = [f"user{i}" for i in range(5)]
+    completions = 40
+
+    async def consumer(engine):
+        conn = await connect_direct()
+        try:
+            await conn.execute(f"SET search_path TO {schema}")
+            consumed = 0
+            while batch := await engine.apply_batch(conn):
+                consumed += batch
+            return consumed
+        finally:
+            await conn.close()
+
+    async def test():
+        admin = await connect_direct()
+        try:
+            await admin.execute(f"CREATE SCHEMA {schema}")
+            await admin.execute(f"SET search_path TO {schema}")
+            await admin.execute(
+                """
+                CREATE TABLE rivals (
+                    id SERIAL PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    level INTEGER NOT NULL DEFAULT 1,
+                    experience INTEGER NOT NULL DEFAULT 0,
+                    rival_order INTEGER NOT NULL DEFAULT 0,
+                    is_active BOOLEAN NOT NULL DEFAULT true
+                )
+                """
+            )
+            await admin.executemany("INSERT INTO rivals (user_id) VALUES ($1)", [(u,) for u in users])
+            await admin.execute(rival_xp.SCHEMA_SQL)
+            for i in range(completions):
+                async with admin.transaction():
+                    await rival_xp.record_completion(admin, users[i % len(users)], i, i % 12)
+
+            consumed = await asyncio.gather(*(consumer(RivalXpEngine()) for _ in range(4)))
+
+            assert sum(consumed) == completions
+            expected = {u: 0 for u in users}
+            for i in range(completions):
+                expected[users[i % len(users)]] += xp_for_completion(i % 12)
+            rows = await admin.fetch("SELECT user_id, experience, level FROM rivals")
+            assert {r["user_id"]: r["experience"] for r in rows} == expected
+            assert all(r["level"] == level_for_experience(r["experience"]) for r in rows)
+            assert await admin.fetchval("SELECT COUNT(*) FROM rival_xp_events") == 0
+        finally:
+            await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+            await admin.close()
+
+    asyncio.run(test())